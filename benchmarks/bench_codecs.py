@@ -0,0 +1,107 @@
+"""
+合成 .mada (mada_reader.synthetic) を gz / xz / bz2 でブロックごとに圧縮し,
+codecごとの圧縮率, 圧縮速度, 展開速度 (順に読む / ブロックごとに並列に読む) を測る
+MB/s は展開後 (元の .mada) の大きさで数える
+
+    poetry run python benchmarks/bench_codecs.py --size-mb 200 -o codecs.json
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+import numpy as np
+
+from bench_common import git_commit
+from mada_reader.block_compression import DEFAULT_BLOCK_SIZE, compress_mada, iter_events_parallel
+from mada_reader.compression import CODECS, iter_decompressed
+from mada_reader.stream import iter_events
+from mada_reader.synthetic import SyntheticConfig, write_synthetic_mada
+
+
+def _timed(func: Callable[[], int]) -> Dict[str, float]:
+    start = time.perf_counter()
+    n = func()
+    return {"seconds": time.perf_counter() - start, "n": n}
+
+
+def bench_codec(path: Path, codec: str, block_size: int, level: int, jobs: int) -> dict:
+    size_bytes = path.stat().st_size
+    compressed_path = None
+
+    def compress() -> int:
+        nonlocal compressed_path
+        compressed_path = compress_mada(path, codec, block_size, level, jobs=jobs)
+        return compressed_path.stat().st_size
+
+    compress_result = _timed(compress)
+    # 展開だけ (FrameAssembler, parse を含まない)
+    decompress_result = _timed(lambda: sum(map(len, iter_decompressed(compressed_path))))
+    # 展開しながら EventBatch にする (.blkidx を使わずに順に読む)
+    sequential_result = _timed(lambda: sum(map(len, iter_events(compressed_path, use_block_index=False))))
+    parallel_result = _timed(lambda: sum(map(len, iter_events_parallel(compressed_path, jobs))))
+    compressed_path.unlink()
+
+    def mb_per_s(result: Dict[str, float]) -> float:
+        return size_bytes / result["seconds"] / 1e6
+
+    return {
+        "level": level,
+        "ratio": compress_result["n"] / size_bytes,
+        "compress_mb_per_s": mb_per_s(compress_result),
+        "decompress_mb_per_s": mb_per_s(decompress_result),
+        "iter_events_mb_per_s": mb_per_s(sequential_result),
+        "iter_events_parallel_mb_per_s": mb_per_s(parallel_result),
+        "n_events": sequential_result["n"],
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--size-mb", type=float, default=100.)
+    arg_parser.add_argument("--depth", type=int, default=1024)
+    arg_parser.add_argument("--codecs", nargs="+", choices=list(CODECS), default=list(CODECS))
+    arg_parser.add_argument("--level", type=int, default=None, help="圧縮レベル (省略するとcodecの既定値)")
+    arg_parser.add_argument("--block-mb", type=float, default=DEFAULT_BLOCK_SIZE / 1024 ** 2)
+    arg_parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="圧縮と並列展開のスレッド数")
+    arg_parser.add_argument("-o", "--output", type=Path, help="結果を書くJSON")
+    args = arg_parser.parse_args()
+
+    config = SyntheticConfig(flush_adc_clock_depth=args.depth)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "GBKB-13_0000.mada"
+        n_events = write_synthetic_mada(path, size_bytes=int(args.size_mb * 1e6), config=config)
+        size_bytes = path.stat().st_size
+
+        uncompressed = _timed(lambda: sum(map(len, iter_events(path))))
+        results = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "file": {"size_bytes": size_bytes, "n_events": n_events, "depth": args.depth},
+            "block_size": int(args.block_mb * 1024 ** 2),
+            "jobs": args.jobs,
+            "uncompressed_iter_events_mb_per_s": size_bytes / uncompressed["seconds"] / 1e6,
+            "codecs": {},
+        }
+        print(f"uncompressed iter_events: {results['uncompressed_iter_events_mb_per_s']:.1f} MB/s")
+        print(f"{'codec':>6}{'ratio':>8}{'compress':>10}{'decompress':>12}{'iter_events':>13}{'parallel':>10}  [MB/s]")
+        for codec in args.codecs:
+            result = bench_codec(path, codec, results["block_size"], args.level, args.jobs)
+            results["codecs"][codec] = result
+            print(
+                f"{codec:>6}{result['ratio']:>8.3f}{result['compress_mb_per_s']:>10.1f}"
+                f"{result['decompress_mb_per_s']:>12.1f}{result['iter_events_mb_per_s']:>13.1f}"
+                f"{result['iter_events_parallel_mb_per_s']:>10.1f}"
+            )
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
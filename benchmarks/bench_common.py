@@ -0,0 +1,16 @@
+"""
+benchmarks/ のスクリプトで共通に使うもの
+"""
+import subprocess
+
+
+def git_commit() -> str:
+    """
+    結果のJSONに書く commit (git が無ければ "unknown")
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
@@ -0,0 +1,65 @@
+"""
+FADCデコードの速度比較 (旧 bitstruct 版 vs NumPy 版)
+
+    poetry run python benchmarks/bench_fadc_decode.py [n_events]
+"""
+import sys
+import time
+
+import bitstruct
+import numpy as np
+
+from mada_reader.parser import decode_flush_adc
+
+FADC_CLOCK_DEPTH = 1024
+
+
+def decode_flush_adc_bitstruct(fadc_block: bytes, flush_adc_clock_depth: int = 1024):
+    """
+    置き換え前の parse_flush_adc の実装
+    """
+    channels = ([], [], [], [])
+    fadc_unpacked = bitstruct.unpack("u4u2u10" * 4 * flush_adc_clock_depth, fadc_block)
+    for i_iter in range(0, len(fadc_unpacked), 3):
+        channel_id, _padding, adc_value = fadc_unpacked[i_iter:i_iter + 3]
+        if 4 <= channel_id <= 7:
+            channels[channel_id - 4].append(adc_value)
+        else:
+            break
+    return channels
+
+
+def make_blocks(n_events: int):
+    rng = np.random.default_rng(0)
+    channel_ids = np.arange(4, 8, dtype=np.uint16)[:, None]
+    blocks = []
+    for _ in range(n_events):
+        waveforms = rng.integers(0, 1024, size=(4, FADC_CLOCK_DEPTH), dtype=np.uint16)
+        blocks.append(((channel_ids << 12) | waveforms).T.astype(">u2").tobytes())
+    return blocks
+
+
+def bench(name: str, func, blocks):
+    start = time.perf_counter()
+    for block in blocks:
+        func(block, FADC_CLOCK_DEPTH)
+    elapsed = time.perf_counter() - start
+    n_bytes = sum(map(len, blocks))
+    print(f"{name:>10}: {len(blocks) / elapsed:10.1f} events/s {n_bytes / elapsed / 1e6:8.1f} MB/s")
+    return elapsed
+
+
+def main(n_events: int = 200):
+    blocks = make_blocks(n_events)
+    for block in blocks[:10]:
+        expected = decode_flush_adc_bitstruct(block)
+        actual = decode_flush_adc(block)
+        assert [list(ch) for ch in expected] == [ch.tolist() for ch in actual]
+
+    t_bitstruct = bench("bitstruct", decode_flush_adc_bitstruct, blocks)
+    t_numpy = bench("numpy", decode_flush_adc, blocks)
+    print(f"speedup: x{t_bitstruct / t_numpy:.1f}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,158 @@
+"""
+合成 .mada (mada_reader.synthetic) を使った読み込み・変換のベンチマーク
+各ステージを別プロセスで走らせて MB/s, events/s, peak RSS を測り, JSONに保存する
+
+    poetry run python benchmarks/bench_suite.py --size-mb 200 -o bench.json
+    poetry run python benchmarks/bench_suite.py --size-mb 200 --compare bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+
+from bench_common import git_commit
+from mada_reader.gain import GainAccumulator
+from mada_reader.headers import read_header_arrays
+from mada_reader.histogram import WaveformHist2D
+from mada_reader.parser import parse_events, parse_headers, read_file
+from mada_reader.prefetch import iter_events_prefetched
+from mada_reader.stream import iter_events
+from mada_reader.synthetic import SyntheticConfig, write_synthetic_mada
+
+
+def _stage_read_file(path: Path) -> int:
+    return len(read_file(path))
+
+
+def _stage_parse_headers(path: Path) -> int:
+    return len(parse_headers(read_file(path)))
+
+
+def _stage_parse_events(path: Path) -> int:
+    return len(parse_events(read_file(path)))
+
+
+def _stage_iter_events(path: Path) -> int:
+    return sum(len(batch) for batch in iter_events(path))
+
+
+def _stage_read_header_arrays(path: Path) -> int:
+    return len(read_header_arrays(path))
+
+
+def _stage_p2p_amplitude(path: Path) -> int:
+    gain = GainAccumulator()
+    gain.update_from_mada_file(path)
+    return int(gain.p2p.count[0])
+
+
+def _stage_p2p_amplitude_prefetch(path: Path) -> int:
+    # p2p_amplitude と同じ計算を, 読み込みを別スレッドで先に進めながらやる
+    gain = GainAccumulator()
+    for batch in iter_events_prefetched(path):
+        gain.update(batch)
+    return int(gain.p2p.count[0])
+
+
+def _stage_histogram(path: Path) -> int:
+    waveform_hist = WaveformHist2D()
+    n_events = 0
+    for batch in iter_events(path):
+        waveform_hist.fill(batch)
+        n_events += len(batch)
+    return n_events
+
+
+STAGES: Dict[str, Callable[[Path], int]] = {
+    "read_file": _stage_read_file,
+    "parse_headers": _stage_parse_headers,
+    "parse_events": _stage_parse_events,
+    "iter_events": _stage_iter_events,
+    "read_header_arrays": _stage_read_header_arrays,
+    "p2p_amplitude": _stage_p2p_amplitude,
+    "p2p_amplitude_prefetch": _stage_p2p_amplitude_prefetch,
+    "histogram": _stage_histogram,
+}
+
+
+def _run_stage(name: str, path: Path) -> Tuple[float, int, float]:
+    start = time.perf_counter()
+    n_events = STAGES[name](path)
+    elapsed = time.perf_counter() - start
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux は kB
+    return elapsed, n_events, peak_rss_mb
+
+
+def run_stage(name: str, path: Path) -> Tuple[float, int, float]:
+    # peak RSS をステージごとに測るため毎回新しいプロセスで走らせる
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(_run_stage, name, path).result()
+
+
+def compare(results: dict, baseline: dict) -> None:
+    print(f"\ncompared with {baseline['commit']}")
+    for name, result in results["stages"].items():
+        if name not in baseline["stages"]:
+            continue
+        ratio = result["mb_per_s"] / baseline["stages"][name]["mb_per_s"]
+        print(f"{name:>20}: x{ratio:.2f} MB/s")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--size-mb", type=float, default=100.)
+    arg_parser.add_argument("--depth", type=int, default=1024)
+    arg_parser.add_argument("--corruption-rate", type=float, default=0.)
+    arg_parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    arg_parser.add_argument("-o", "--output", type=Path, help="結果を書くJSON")
+    arg_parser.add_argument("--compare", type=Path, help="比較するJSON (以前の結果)")
+    args = arg_parser.parse_args()
+
+    config = SyntheticConfig(flush_adc_clock_depth=args.depth, corruption_rate=args.corruption_rate)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "GBKB-13_0000.mada"
+        n_events = write_synthetic_mada(path, size_bytes=int(args.size_mb * 1e6), config=config)
+        size_bytes = path.stat().st_size
+
+        results = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "file": {
+                "size_bytes": size_bytes,
+                "n_events": n_events,
+                "depth": args.depth,
+                "corruption_rate": args.corruption_rate,
+            },
+            "stages": {},
+        }
+        for name in args.stages:
+            elapsed, n_processed, peak_rss_mb = run_stage(name, path)
+            results["stages"][name] = {
+                "seconds": elapsed,
+                "n_events": n_processed,
+                "mb_per_s": size_bytes / elapsed / 1e6,
+                "events_per_s": n_processed / elapsed,
+                "peak_rss_mb": peak_rss_mb,
+            }
+            print(
+                f"{name:>20}: {size_bytes / elapsed / 1e6:8.1f} MB/s "
+                f"{n_processed / elapsed:10.1f} events/s {peak_rss_mb:8.1f} MB peak RSS"
+            )
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.compare is not None:
+        compare(results, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+イベントの境界で区切ったブロックごとに圧縮した .mada (.mada.gz / .mada.xz / .mada.bz2)
+ブロックは独立した member (xz なら stream) をつなげただけなので, gunzip などでもそのまま展開できる
+sidecar (.blkidx) にブロックの位置を書いておくと, ブロックごとに別スレッドで展開・parseできる
+"""
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+from mada_reader.compression import (
+    CODECS,
+    compress_bytes,
+    compression_codec,
+    decompress_bytes,
+    iter_decompressed,
+    strip_compression_suffix,
+)
+from mada_reader.parser import EventBatch, parse_batch
+from mada_reader.stream import MAGIC, _boundary_check_end, is_frame_boundary, iter_events, iter_frame_ranges
+
+BLOCK_INDEX_SUFFIX = ".blkidx"
+BLOCK_INDEX_VERSION = 1
+DEFAULT_BLOCK_SIZE = 16 * 1024 ** 2
+
+
+@dataclass
+class BlockIndex:
+    """
+    i 番目のブロックは圧縮後の [compressed_offsets[i], compressed_offsets[i + 1])
+    展開すると元のファイルの [uncompressed_offsets[i], uncompressed_offsets[i + 1]] になる
+    """
+    codec: str
+    compressed_offsets: np.ndarray  # (n_blocks + 1,) int64
+    uncompressed_offsets: np.ndarray  # (n_blocks + 1,) int64
+    file_size: int
+    file_mtime_ns: int
+
+    def __len__(self) -> int:
+        return len(self.compressed_offsets) - 1
+
+    def is_up_to_date(self, compressed_file_path: Path) -> bool:
+        stat = os.stat(compressed_file_path)
+        return stat.st_size == self.file_size and stat.st_mtime_ns == self.file_mtime_ns
+
+
+def block_index_path(compressed_file_path: Path) -> Path:
+    """
+    /hoge/GBKB-13_0000.mada.gz -> /hoge/GBKB-13_0000.mada.gz.blkidx
+    """
+    compressed_file_path = Path(compressed_file_path)
+    return compressed_file_path.with_name(compressed_file_path.name + BLOCK_INDEX_SUFFIX)
+
+
+def save_block_index(index: BlockIndex, compressed_file_path: Path) -> None:
+    target = block_index_path(compressed_file_path)
+    tmp = target.with_name(target.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            meta=np.array([BLOCK_INDEX_VERSION, index.file_size, index.file_mtime_ns], dtype=np.int64),
+            codec=np.array(index.codec),
+            compressed_offsets=index.compressed_offsets,
+            uncompressed_offsets=index.uncompressed_offsets,
+        )
+    os.replace(tmp, target)
+
+
+def load_block_index(compressed_file_path: Path) -> Optional[BlockIndex]:
+    """
+    sidecarが無い, 壊れている, 圧縮ファイルのsizeかmtimeが変わっている場合はNone
+    """
+    try:
+        with np.load(block_index_path(compressed_file_path)) as npz:
+            version, file_size, file_mtime_ns = npz["meta"].tolist()
+            if version != BLOCK_INDEX_VERSION:
+                return None
+            index = BlockIndex(
+                str(npz["codec"]),
+                npz["compressed_offsets"],
+                npz["uncompressed_offsets"],
+                file_size=file_size,
+                file_mtime_ns=file_mtime_ns,
+            )
+    except (OSError, KeyError, ValueError):
+        return None
+    if index.codec != compression_codec(compressed_file_path) or not index.is_up_to_date(compressed_file_path):
+        return None
+    return index
+
+
+def iter_frame_blocks(chunks: Iterator[bytes], block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[bytes]:
+    """
+    つなげると chunks と同じになるように, block_size byte 以上たまったところの次のイベントの先頭で区切って返す
+    (境界は is_frame_boundary で確認するので, 各ブロックは uPIC から始まるイベントだけを含む. 最初のブロックを除く)
+    ブロックだけでは境界か確認できない位置 (末尾の近く) に uPIC があるところでは区切らないので,
+    ブロックごとに iter_frame_ranges(validate=True) しても元のファイルと同じ区切りになる
+    """
+    check_size = _boundary_check_end(0)
+    buffer = bytearray()
+    search_from = block_size
+    for data in chunks:
+        buffer += data
+        while True:
+            position = buffer.find(MAGIC, search_from)
+            if position < 0:
+                # uPIC が途中で切れているかもしれないので3byte戻ったところから探し直す
+                search_from = max(search_from, len(buffer) - len(MAGIC) + 1)
+                break
+            if _boundary_check_end(position) > len(buffer):
+                search_from = position
+                break
+            if not is_frame_boundary(buffer, position) or buffer.find(
+                MAGIC, max(position - check_size + 1, 0), position
+            ) >= 0:
+                search_from = position + 1
+                continue
+            yield bytes(buffer[:position])
+            del buffer[:position]
+            search_from = block_size
+    if buffer:
+        yield bytes(buffer)
+
+
+def compressed_output_path(mada_file_path: Path, codec: str) -> Path:
+    """
+    /hoge/GBKB-13_0000.mada(.gz など) -> /hoge/GBKB-13_0000.mada.<codec>
+    """
+    return mada_file_path.with_name(f"{strip_compression_suffix(mada_file_path.name)}.{codec}")
+
+
+def compress_mada(
+    mada_file_path: Path,
+    codec: str = "gz",
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    level: Optional[int] = None,
+    output_path: Optional[Path] = None,
+    jobs: int = 1,
+) -> Path:
+    """
+    .mada (圧縮されていてもよい) をブロックごとに圧縮し直して output_path (デフォルトは compressed_output_path) に書く
+    ブロックの圧縮は jobs スレッドで並列にやる (zlib, lzma, bz2 は圧縮中に GIL を離す)
+    一時ファイルに書いてからrenameし, 最後に .blkidx を書くので, 同じcodecの圧縮ファイルをその場で区切り直すこともできる
+    """
+    if codec not in CODECS:
+        raise ValueError(f"unsupported codec: {codec} (choose from {', '.join(CODECS)})")
+    output_path = output_path or compressed_output_path(mada_file_path, codec)
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+
+    compressed_offsets, uncompressed_offsets = [0], [0]
+
+    try:
+        with open(tmp_path, "wb") as f, ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            pending = deque()
+
+            def write_oldest() -> None:
+                n_uncompressed, future = pending.popleft()
+                compressed = future.result()
+                f.write(compressed)
+                compressed_offsets.append(compressed_offsets[-1] + len(compressed))
+                uncompressed_offsets.append(uncompressed_offsets[-1] + n_uncompressed)
+
+            for block in iter_frame_blocks(iter_decompressed(mada_file_path), block_size):
+                # 圧縮待ちのブロックは jobs 個まで (メモリは jobs * block_size 程度)
+                if len(pending) >= max(jobs, 1):
+                    write_oldest()
+                pending.append((len(block), executor.submit(compress_bytes, codec, block, level)))
+            while pending:
+                write_oldest()
+            if len(compressed_offsets) == 1:
+                # 空のファイルも展開できるように空のブロックを1つ書く (xz は0 byteのファイルを読めない)
+                pending.append((0, executor.submit(compress_bytes, codec, b"", level)))
+                write_oldest()
+        os.replace(tmp_path, output_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    stat = os.stat(output_path)
+    save_block_index(BlockIndex(
+        codec,
+        np.array(compressed_offsets, dtype=np.int64),
+        np.array(uncompressed_offsets, dtype=np.int64),
+        file_size=stat.st_size,
+        file_mtime_ns=stat.st_mtime_ns,
+    ), output_path)
+    return output_path
+
+
+def read_block(compressed_file_path: Path, index: BlockIndex, i: int) -> bytes:
+    """
+    i 番目のブロックを展開して返す
+    """
+    start, end = index.compressed_offsets[i:i + 2].tolist()
+    with open(compressed_file_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return decompress_bytes(index.codec, data)
+
+
+def _parse_block(
+    compressed_file_path: Path,
+    index: BlockIndex,
+    i: int,
+    flush_adc_clock_depth: int,
+    with_hits: bool,
+) -> EventBatch:
+    block = read_block(compressed_file_path, index, i)
+    payloads = [block[start:end] for start, end in iter_frame_ranges(block, validate=True)]
+    return parse_batch(payloads, flush_adc_clock_depth, with_hits)
+
+
+def _iter_block_batches(
+    compressed_file_path: Path,
+    index: BlockIndex,
+    jobs: int,
+    flush_adc_clock_depth: int,
+    with_hits: bool,
+) -> Iterator[EventBatch]:
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        pending = deque()
+        try:
+            for i in range(len(index)):
+                # 先に展開しておくのは 2 * jobs ブロックまで
+                if len(pending) >= 2 * max(jobs, 1):
+                    yield pending.popleft().result()
+                pending.append(executor.submit(
+                    _parse_block, compressed_file_path, index, i, flush_adc_clock_depth, with_hits
+                ))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def iter_events_parallel(
+    compressed_file_path: Path,
+    jobs: int = os.cpu_count() or 1,
+    flush_adc_clock_depth: int = 1024,
+    with_hits: bool = False,
+) -> Iterator[EventBatch]:
+    """
+    ブロックごとに jobs スレッドで展開・parseして, 1ブロック1つの EventBatch を順に返す
+    .blkidx が無ければ (compress_mada で作っていないファイル) stream.iter_events で順に読む
+    """
+    index = load_block_index(compressed_file_path)
+    if index is None:
+        yield from iter_events(
+            compressed_file_path, flush_adc_clock_depth=flush_adc_clock_depth, with_hits=with_hits, use_block_index=False
+        )
+        return
+    yield from _iter_block_batches(compressed_file_path, index, jobs, flush_adc_clock_depth, with_hits)
+
+
+def iter_indexed_events(
+    compressed_file_path: Path,
+    chunk_size: int = 1024,
+    flush_adc_clock_depth: int = 1024,
+    with_hits: bool = False,
+    jobs: int = os.cpu_count() or 1,
+) -> Optional[Iterator[EventBatch]]:
+    """
+    stream.iter_events から使う. 使える .blkidx が無ければ None
+    iter_events_parallel と同じく並列に読み, chunk_size イベントずつに分けて返す
+    """
+    index = load_block_index(compressed_file_path)
+    if index is None:
+        return None
+
+    def split(batches: Iterator[EventBatch]) -> Iterator[EventBatch]:
+        for batch in batches:
+            for start in range(0, len(batch), chunk_size):
+                yield batch[start:start + chunk_size]
+
+    return split(_iter_block_batches(compressed_file_path, index, jobs, flush_adc_clock_depth, with_hits))
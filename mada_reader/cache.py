@@ -0,0 +1,158 @@
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from mada_reader.parser import EventBatch
+from mada_reader.stream import iter_events
+
+DEFAULT_CACHE_BYTES = 512 * 1024 ** 2
+
+CacheKey = Tuple[str, int, int]
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+def _batch_arrays(batch: EventBatch) -> List[np.ndarray]:
+    arrays = [batch.trigger_counter, batch.clock_counter, batch.input_ch2_counter, batch.fadc, batch.fadc_lengths]
+    if batch.hits is not None:
+        arrays += [batch.hits.offsets, batch.hits.strip, batch.hits.clock]
+    return arrays
+
+
+def _batch_nbytes(batch: EventBatch) -> int:
+    return sum(a.nbytes for a in _batch_arrays(batch))
+
+
+class DecodedFileCache:
+    """
+    デコード済みの .mada を EventBatch のまま持っておくLRUキャッシュ
+    key は (path, size, mtime) なのでファイルが変われば自動的に読み直す
+    max_bytes を超えたら古いものから捨てる
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[CacheKey, EventBatch]" = OrderedDict()
+        self._nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    @staticmethod
+    def key(mada_file_path: Path) -> CacheKey:
+        stat = os.stat(mada_file_path)
+        return str(Path(mada_file_path).resolve()), stat.st_size, stat.st_mtime_ns
+
+    def get(self, mada_file_path: Path) -> Optional[EventBatch]:
+        key = self.key(mada_file_path)
+        batch = self._entries.get(key)
+        if batch is None:
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return batch
+
+    def put(self, mada_file_path: Path, batch: EventBatch, key: Optional[CacheKey] = None) -> None:
+        key = key or self.key(mada_file_path)
+        nbytes = _batch_nbytes(batch)
+        if nbytes > self.max_bytes:
+            return
+        # 同じ配列を複数の呼び出し元で共有するので書き換えられないようにする
+        for a in _batch_arrays(batch):
+            a.flags.writeable = False
+        if key in self._entries:
+            self._nbytes -= _batch_nbytes(self._entries.pop(key))
+        self._entries[key] = batch
+        self._nbytes += nbytes
+        self.evict()
+
+    def evict(self) -> None:
+        while self._nbytes > self.max_bytes and self._entries:
+            _, batch = self._entries.popitem(last=False)
+            self._nbytes -= _batch_nbytes(batch)
+            self.stats.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._nbytes = 0
+
+    def iter_events(self, mada_file_path: Path, chunk_size: int = 1024) -> Iterator[EventBatch]:
+        """
+        キャッシュにあればファイル全体を1つの EventBatch として返す
+        無ければ stream.iter_events で読みながら返し, 収まりそうなら最後にキャッシュに入れる
+        (デコードした大きさで数えるので, 圧縮されたファイルでも max_bytes を超えて持たない)
+        """
+        batch = self.get(mada_file_path)
+        if batch is not None:
+            yield batch
+            return
+
+        key = self.key(mada_file_path)
+        kept: Optional[List[EventBatch]] = []
+        kept_nbytes = 0
+        for batch in iter_events(mada_file_path, chunk_size):
+            if kept is not None:
+                kept.append(batch)
+                kept_nbytes += _batch_nbytes(batch)
+                if kept_nbytes > self.max_bytes:
+                    kept = None
+            yield batch
+        if kept is not None:
+            self.put(mada_file_path, EventBatch.concatenate(kept) if len(kept) != 1 else kept[0], key)
+
+    def load(self, mada_file_path: Path, chunk_size: int = 1024) -> EventBatch:
+        """
+        ファイル全体を1つの EventBatch で返す
+        キャッシュに入れたときはそれと同じもの (読み取り専用) を返すので, デコード結果を2つ持つことはない
+        """
+        batch = self.get(mada_file_path)
+        if batch is not None:
+            return batch
+        key = self.key(mada_file_path)
+        batches = list(iter_events(mada_file_path, chunk_size))
+        batch = EventBatch.concatenate(batches) if len(batches) != 1 else batches[0]
+        del batches
+        self.put(mada_file_path, batch, key)
+        return batch
+
+
+_default_cache = DecodedFileCache()
+
+
+def get_cache() -> DecodedFileCache:
+    return _default_cache
+
+
+def configure_cache(max_bytes: int) -> None:
+    """
+    既定のキャッシュの上限を変える (0 にすると何も持たない)
+    """
+    _default_cache.max_bytes = max_bytes
+    _default_cache.evict()
+
+
+def load_cached(mada_file_path: Path, chunk_size: int = 1024, use_cache: bool = True) -> EventBatch:
+    if use_cache:
+        return get_cache().load(mada_file_path, chunk_size)
+    return EventBatch.concatenate(list(iter_events(mada_file_path, chunk_size)))
+
+
+def iter_events_cached(mada_file_path: Path, chunk_size: int = 1024, use_cache: bool = True) -> Iterator[EventBatch]:
+    if use_cache:
+        return get_cache().iter_events(mada_file_path, chunk_size)
+    return iter_events(mada_file_path, chunk_size)
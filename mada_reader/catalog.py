@@ -0,0 +1,197 @@
+import os
+import re
+import sqlite3
+from dataclasses import astuple, dataclass, fields
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from mada_reader.compression import is_compressed, strip_compression_suffix
+from mada_reader.headers import CLOCK_FREQUENCY_HZ, gather_counters, unwrap_counter
+from mada_reader.index import get_index
+from mada_reader.parser import HEADER_SIZE, fadc_block_size
+from mada_reader.stream import iter_payload_chunks
+
+CATALOG_NAME = "mada_catalog.sqlite"
+MADA_FILE_NAME = re.compile(r"^(GBKB-\d\d)_(\d{4})\.mada(\.gz|\.xz|\.bz2)?$")
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """
+    .mada 1ファイルぶんの要約
+    n_corrupted: イベントとして読めなかったフレーム (EventIndex.n_skipped)
+    clock_span: 最初から最後のイベントまでの clock 数 (ファイル内で一周を戻したもの)
+    """
+    name: str
+    board_name: str
+    period: int
+    size: int
+    mtime_ns: int
+    n_events: int
+    first_trigger_counter: int
+    last_trigger_counter: int
+    first_clock_counter: int
+    last_clock_counter: int
+    clock_span: int
+    n_corrupted: int
+
+    def duration(self, clock_frequency: float = CLOCK_FREQUENCY_HZ) -> float:
+        return self.clock_span / clock_frequency
+
+
+_COLUMNS = [f.name for f in fields(CatalogEntry)]
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    {", ".join(f"{name} {'TEXT' if name == 'board_name' else 'INTEGER'}" for name in _COLUMNS[1:])}
+);
+CREATE INDEX IF NOT EXISTS files_board_period ON files (board_name, period);
+"""
+
+
+def _first_last(counter) -> Tuple[int, int]:
+    return (int(counter[0]), int(counter[-1])) if len(counter) > 0 else (0, 0)
+
+
+def _scan_decompressed(mada_file_path: Path, flush_adc_clock_depth: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    # 圧縮されたファイルは index を作れないので, 展開しながら EventIndex と同じものを数える
+    event_size = HEADER_SIZE + fadc_block_size(flush_adc_clock_depth)
+    counters = [np.zeros((0, 3), dtype=np.uint32)]
+    n_skipped = 0
+    for payloads in iter_payload_chunks(mada_file_path):
+        headers = [payload[:HEADER_SIZE] for payload in payloads if len(payload) >= event_size]
+        n_skipped += len(payloads) - len(headers)
+        counters.append(gather_counters(b"".join(headers), np.arange(len(headers), dtype=np.int64) * HEADER_SIZE))
+    counters = np.concatenate(counters)
+    return counters[:, 0], counters[:, 1], n_skipped
+
+
+def summarize_mada_file(mada_file_path: Path, flush_adc_clock_depth: int = 1024) -> CatalogEntry:
+    """
+    index (あれば .madaidx を使う) から CatalogEntry を作る
+    圧縮されたファイル (.mada.gz など) は展開しながら数える
+    """
+    board_name, period = MADA_FILE_NAME.match(mada_file_path.name).group(1, 2)
+    stat = os.stat(mada_file_path)
+    if is_compressed(mada_file_path):
+        trigger_counter, clock_counter, n_skipped = _scan_decompressed(mada_file_path, flush_adc_clock_depth)
+    else:
+        index = get_index(mada_file_path, flush_adc_clock_depth, save=False)
+        trigger_counter, clock_counter, n_skipped = index.trigger_counter, index.clock_counter, index.n_skipped
+    clocks = unwrap_counter(clock_counter)
+    return CatalogEntry(
+        mada_file_path.name,
+        board_name,
+        int(period),
+        stat.st_size,
+        stat.st_mtime_ns,
+        len(clock_counter),
+        *_first_last(trigger_counter),
+        *_first_last(clock_counter),
+        int(clocks[-1] - clocks[0]) if len(clocks) > 0 else 0,
+        n_skipped,
+    )
+
+
+class MadaCatalog:
+    """
+    データディレクトリの .mada の要約を SQLite (デフォルトは dir/mada_catalog.sqlite) に持つ
+    refresh で変わったファイルだけ読み直し, 問い合わせでは .mada を開かない
+    """
+
+    def __init__(self, dir: Path, db_path: Optional[Path] = None):
+        self.dir = Path(dir)
+        self.db_path = db_path or self.dir / CATALOG_NAME
+        self.connection = sqlite3.connect(str(self.db_path))
+        self.connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> "MadaCatalog":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def refresh(self, on_file: Optional[Callable[[Path], None]] = None) -> Tuple[int, int]:
+        """
+        size か mtime が変わったファイルと新しいファイルだけ要約し直し, 無くなったファイルは消す
+        (.mada.gz なども対象にする)
+        (更新したファイル数, 消したファイル数) を返す
+        """
+        known = {
+            name: (size, mtime_ns)
+            for name, size, mtime_ns in self.connection.execute("SELECT name, size, mtime_ns FROM files")
+        }
+        mada_files = sorted(p for p in self.dir.iterdir() if MADA_FILE_NAME.match(p.name))
+        # 同じファイルの圧縮したものもあるときは圧縮していない方だけを数える
+        names = {p.name for p in mada_files}
+        mada_files = [p for p in mada_files if not is_compressed(p) or strip_compression_suffix(p.name) not in names]
+
+        n_updated = 0
+        for mada_file in mada_files:
+            stat = os.stat(mada_file)
+            if known.get(mada_file.name) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            if on_file:
+                on_file(mada_file)
+            entry = summarize_mada_file(mada_file)
+            with self.connection:
+                self.connection.execute(
+                    f"INSERT OR REPLACE INTO files VALUES ({', '.join('?' * len(_COLUMNS))})", astuple(entry)
+                )
+            n_updated += 1
+
+        removed = set(known) - {p.name for p in mada_files}
+        with self.connection:
+            self.connection.executemany("DELETE FROM files WHERE name = ?", [(name,) for name in removed])
+        return n_updated, len(removed)
+
+    def entries(
+        self,
+        board_name: Optional[str] = None,
+        period_ini: Optional[int] = None,
+        period_fin: Optional[int] = None,
+        min_events: Optional[int] = None,
+    ) -> List[CatalogEntry]:
+        """
+        条件に合うファイルを (period, board_name) 順に返す. period_ini, period_fin は両端を含む
+        """
+        conditions, parameters = [], []
+        for condition, value in (
+            ("board_name = ?", board_name),
+            ("period >= ?", period_ini),
+            ("period <= ?", period_fin),
+            ("n_events > ?", min_events),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.connection.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM files {where} ORDER BY period, board_name", parameters
+        )
+        return [CatalogEntry(*row) for row in rows]
+
+    def periods(self, board_name: str, min_events: Optional[int] = None) -> List[int]:
+        return [entry.period for entry in self.entries(board_name, min_events=min_events)]
+
+    def total_duration(
+        self,
+        period_ini: Optional[int] = None,
+        period_fin: Optional[int] = None,
+        board_name: Optional[str] = None,
+        clock_frequency: float = CLOCK_FREQUENCY_HZ,
+        min_events: Optional[int] = None,
+    ) -> float:
+        """
+        ファイルごとの最初から最後のイベントまでの時間 [s] の和 (ボードを指定しなければボードごとの最大)
+        """
+        durations = {}
+        for entry in self.entries(board_name, period_ini, period_fin, min_events):
+            durations.setdefault(entry.board_name, 0.)
+            durations[entry.board_name] += entry.duration(clock_frequency)
+        return max(durations.values(), default=0.)
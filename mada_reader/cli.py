@@ -1,54 +1,123 @@
 import sys
 import subprocess
+import time
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import typer
-import rich
 from rich.console import Console
-from rich.progress import track
+from rich.live import Live
+from rich.progress import MofNCompleteColumn, Progress, track
+from rich.style import Style
 from rich.table import Table
 
+from mada_reader import profiling, root_backend
+from mada_reader.clock import DEFAULT_N_BINS
+from mada_reader.compression import CODECS, is_compressed, strip_compression_suffix
+from mada_reader.block_compression import DEFAULT_BLOCK_SIZE, compress_mada
+from mada_reader.catalog import MadaCatalog
+from mada_reader.convert import ConversionResult, _mada_to_root, convert_files, converter_name
+from mada_reader.event_builder import EventBuilder, period_mada_files
+from mada_reader.features import FeatureConfig, extract_features_from_mada_file, save_features
 from mada_reader.files import scan_mada_files_from_path
+from mada_reader.follow import FollowStats, MadaFollower
+from mada_reader.gain import GainAccumulator
+from mada_reader.header_analytics import analyze_files_by_board, save_time_series
+from mada_reader.headers import CLOCK_FREQUENCY_HZ, read_header_arrays
+from mada_reader.index import MadaFile, parse_event_ids
+from mada_reader.manifest import MANIFEST_NAME, ConversionManifest
 from mada_reader.models.mada_config import get_mada_config
-from mada_reader.parser import parse_events, parse_headers, read_file
-from mada_reader.pyroot_lib.clock_hist import clock_hist, save_clock_hist_png
-from mada_reader.rootfile_generator import gbkb
-from mada_reader.vis import vis_flush_adc
+from mada_reader.prefetch import PrefetchConfig, iter_file_batches
 
 app = typer.Typer(pretty_exceptions_show_locals=True)
 
 
+def _prefetch_config(prefetch_depth: int, buffer_mb: float) -> PrefetchConfig:
+    return PrefetchConfig(queue_depth=prefetch_depth, buffer_size=int(buffer_mb * 1024 ** 2))
+
+
+def _require_root() -> None:
+    # ROOT が要るコマンドだけ最初に確認する (他のコマンドは ROOT 無しで動く)
+    if not root_backend.root_available():
+        print(root_backend.ROOT_MISSING_MESSAGE, file=sys.stderr)
+        raise typer.Exit(code=1)
+
+
+@app.callback()
+def main(
+    ctx: typer.Context,
+    profile: bool = typer.Option(False, help="ステージごとの時間と読み飛ばしたイベント数を最後にstderrに出す"),
+    profile_json: Optional[Path] = typer.Option(None, help="profile の結果をJSONで書き出す"),
+):
+    if not profile and profile_json is None:
+        return
+    profiler = profiling.enable_profiling()
+
+    def report():
+        if profile:
+            print("\n".join(profiler.summary_lines()), file=sys.stderr)
+        if profile_json is not None:
+            profiler.save_json(profile_json)
+
+    ctx.call_on_close(report)
+
+
 @app.command()
 def show(mada_path: Path, clock_diff: bool = False):
     """
     show header info
     """
-    b = read_file(mada_path)
-    events = parse_headers(b)
+    header_arrays = read_header_arrays(mada_path)
+    lines = header_arrays.col_lines()
     if not clock_diff:
-        print_string = "trigger\tclock\tinput2\n" + "\n".join(map(lambda e: e.col(), events))
+        print_string = "trigger\tclock\tinput2\n" + "\n".join(lines)
         print(print_string)
         return
     print("trigger\tclock\tinput2")
-    print(events[0].col())
-    for i in range(1, len(events)):
-        trigger_counter_diff = events[i].trigger_counter - events[i-1].trigger_counter
-        clock_counter_diff = events[i].clock_counter - events[i-1].clock_counter
-        input_ch2_counter_diff = events[i].input_ch2_counter - events[i-1].input_ch2_counter
-        rich.print(f"[i][red]{trigger_counter_diff}\t{clock_counter_diff}\t{input_ch2_counter_diff}[/red][/i]")
-        print(events[i].col())
+    if len(lines) == 0:
+        return
+    print(lines[0])
+    if len(lines) == 1:
+        return
+    diffs = np.diff(header_arrays.as_array().astype(np.int64), axis=0)
+    diff_lines = map("{}\t{}\t{}".format, *(d.tolist() for d in diffs.T))
+    if Console().is_terminal:
+        diff_lines = map(Style(italic=True, color="red").render, diff_lines)
+    print_string = "\n".join(
+        f"{diff_line}\n{line}" for diff_line, line in zip(diff_lines, lines[1:])
+    )
+    print(print_string)
 
 
 @app.command()
-def fadc(mada_path: str, event_id: int, im: str = "flush_adc.png"):
+def fadc(
+    mada_path: Path,
+    event_ids: List[str] = typer.Argument(..., help="12, 3,5,7, 10-20 のように指定できる"),
+    im: str = "flush_adc.png",
+):
     """
-    visuallize FADC waveform (single event)
+    visuallize FADC waveform
+    indexを使って指定したイベントだけを読む. 複数イベントのときは flush_adc_<event_id>.png に出力する
     """
-    b = read_file(mada_path)
-    events = parse_events(b)
-    vis_flush_adc(events[event_id].fadc, save_file_name=im)
+    try:
+        selected_event_ids = parse_event_ids(event_ids)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    if is_compressed(mada_path):
+        raise typer.BadParameter(f"{mada_path}: 圧縮された .mada は任意のイベントを読めないので, 展開してから使ってください")
+
+    _require_root()
+    with MadaFile(mada_path) as mada:
+        for event_id in selected_event_ids:
+            if not 0 <= event_id < len(mada):
+                raise typer.BadParameter(f"event {event_id} out of range ({len(mada)} events)")
+        for event_id in selected_event_ids:
+            save_file_name = im
+            if len(selected_event_ids) > 1:
+                save_file_name = str(Path(im).with_name(f"{Path(im).stem}_{event_id}{Path(im).suffix}"))
+            root_backend.vis_flush_adc(mada[event_id].fadc, save_file_name=save_file_name)
 
 
 @app.command()
@@ -57,22 +126,63 @@ def root(
     config_file: Path = Path("MADA_config.json"),
     period_ini: int = 0,
     period_fin: int = 0,
+    use_catalog: bool = typer.Option(False, "--catalog", help="mada_reader catalog の結果からファイルを選ぶ (欠けたファイルは飛ばす)"),
+    prefetch_depth: int = typer.Option(
+        PrefetchConfig.queue_depth, help="処理中に先読みしておく buffer の数 (0 なら先読みしない)"
+    ),
+    buffer_mb: float = typer.Option(PrefetchConfig.buffer_size / 1024 ** 2, help="1回に読む量 [MiB]"),
+    jobs: int = typer.Option(1, "--jobs", "-j", help="並列に変換するプロセス数"),
+    hits: bool = typer.Option(False, help="uPIC strip のhitも hit_strip, hit_clock branch に書く"),
+    resume: bool = typer.Option(
+        True, "--resume/--force",
+        help=f"--resume: {MANIFEST_NAME} で変換済みとわかるファイルは飛ばす / --force: 全て変換し直す"
+    ),
 ):
     """
     .madaを.rootに (perXXXX以下のmadaを走査する)
     """
-    mada_files = scan_mada_files_from_path(dir, config_file, period_ini, period_fin)
-    for mada_file in track(mada_files, description="Processing..."):
-        print(mada_file, file=sys.stderr)
-        gbkb.mada_to_root(mada_file)
+    _require_root()
+    mada_files = scan_mada_files_from_path(dir, config_file, period_ini, period_fin, use_catalog)
+    manifest = ConversionManifest.load(dir / MANIFEST_NAME, converter_name(hits))
+    with Progress(*Progress.get_default_columns(), MofNCompleteColumn()) as progress:
+        task = progress.add_task("Processing...", total=len(mada_files))
+
+        def on_done(result: ConversionResult):
+            status = "skipped (up to date)" if result.skipped else "done" if result.ok else "[red]failed[/red]"
+            progress.console.print(f"{result.mada_path} {status} ({result.elapsed:.1f} s)")
+            progress.advance(task)
+
+        converter = partial(_mada_to_root, with_hits=hits, prefetch=_prefetch_config(prefetch_depth, buffer_mb))
+        results = convert_files(
+            mada_files, jobs=jobs, on_done=on_done, converter=converter, manifest=manifest, force=not resume
+        )
+
+    failed = [result for result in results if not result.ok]
+    for result in failed:
+        print(f"{result.mada_path}:\n{result.error}", file=sys.stderr)
+    if failed:
+        print(f"{len(failed)}/{len(results)} files failed", file=sys.stderr)
+        raise typer.Exit(code=1)
 
 
 @app.command()
-def single(path_to_mada: Path):
+def single(
+    path_to_mada: Path,
+    hits: bool = typer.Option(False, help="uPIC strip のhitも hit_strip, hit_clock branch に書く"),
+):
     """
     .madaを.rootに (1ファイルのみ)
     """
-    gbkb.mada_to_root(path_to_mada)
+    _require_root()
+    root_backend.mada_to_root(path_to_mada, with_hits=hits)
+
+
+def _format_int(x: float) -> str:
+    return str(int(x)) if np.isfinite(x) else "nan"
+
+
+def _format_std(x: float) -> str:
+    return f"{x:.1f}"
 
 
 @app.command("detp2p")
@@ -81,6 +191,11 @@ def detect_peak_to_peak(
     config_file: Path = Path("MADA_config.json"),
     period_ini: int = 0,
     period_fin: int = 0,
+    use_catalog: bool = typer.Option(False, "--catalog", help="mada_reader catalog の結果からファイルを選ぶ (欠けたファイルは飛ばす)"),
+    prefetch_depth: int = typer.Option(
+        PrefetchConfig.queue_depth, help="処理中に先読みしておく buffer の数 (0 なら先読みしない)"
+    ),
+    buffer_mb: float = typer.Option(PrefetchConfig.buffer_size / 1024 ** 2, help="1回に読む量 [MiB]"),
     pretty: bool = True
 ):
     """
@@ -88,41 +203,42 @@ def detect_peak_to_peak(
     指定したperの全てのFADCから波形のp-pを算出して, ボードごとに平均する
     """
     mada_config = get_mada_config(config_file)
-    mada_files = scan_mada_files_from_path(dir, config_file, period_ini, period_fin)
-    mada_files_group_by_name: Dict[str, List[Path]] = {board_name: [] for board_name in mada_config.available_boards}
-    for mada_file in mada_files:
-        board_name = mada_file.name[:7]
-        mada_files_group_by_name[board_name].append(mada_file)
-
-    results: Dict[str, Tuple[float, float, float, float]] = \
-        {board_name: (0, 0, 0, 0) for board_name in mada_config.available_boards}  # GBKB-XX: (sum, count)
-
-    for board_name, mada_file_list in track(mada_files_group_by_name.items(), description="Processing...", transient=True):
-        concatenating_arrays = [
-            gbkb.get_fadc_peak2peak_from_mada_file(mada_file)
-            for mada_file in mada_file_list
-        ]
-        concatenating_arrays = list(filter(lambda x: x.size > 0, concatenating_arrays))
-        fadc_p2p_list = np.concatenate(concatenating_arrays)
-        results[board_name] = tuple(np.average(fadc_p2p_list, axis=0))
+    mada_files = scan_mada_files_from_path(dir, config_file, period_ini, period_fin, use_catalog)
+    results = {
+        board_name: GainAccumulator(with_amplitude=False)
+        for board_name in mada_config.available_boards
+    }
+    file_batches = iter_file_batches(mada_files, _prefetch_config(prefetch_depth, buffer_mb))
+    for mada_file, batches in track(file_batches, total=len(mada_files), description="Processing...", transient=True):
+        for batch in batches:
+            results[mada_file.name[:7]].update(batch)
 
     if pretty:
         table = Table(title="p2p average summary")
         console = Console()
         table.add_column("Board Name")
-        table.add_column("ch0", justify="right")
-        table.add_column("ch1", justify="right")
-        table.add_column("ch2", justify="right")
-        table.add_column("ch3", justify="right")
-        for board_name, fadc_p2p_averages in results.items():
-            ch0, ch1, ch2, ch3 = map(lambda x: str(int(x)), fadc_p2p_averages)
-            table.add_row(board_name, ch0, ch1, ch2, ch3)
+        for ch in range(4):
+            table.add_column(f"ch{ch}", justify="right")
+        for ch in range(4):
+            table.add_column(f"ch{ch} std", justify="right")
+        table.add_column("events", justify="right")
+        for board_name, gain in results.items():
+            table.add_row(
+                board_name,
+                *map(_format_int, gain.p2p.average),
+                *map(_format_std, gain.p2p.std),
+                str(gain.p2p.count[0]),
+            )
         console.print(table)
     else:
-        print("board name, ch0, ch1, ch2, ch3")
-        for board_name, fadc_p2p_averages in results.items():
-            ch0, ch1, ch2, ch3 = map(lambda x: str(int(x)), fadc_p2p_averages)
-            print("{}, {}, {}, {}, {}".format(board_name, ch0, ch1, ch2, ch3))
+        print("board name, ch0, ch1, ch2, ch3, ch0_std, ch1_std, ch2_std, ch3_std, n_events")
+        for board_name, gain in results.items():
+            print(", ".join([
+                board_name,
+                *map(_format_int, gain.p2p.average),
+                *map(_format_std, gain.p2p.std),
+                str(gain.p2p.count[0]),
+            ]))
 
 
 @app.command("detamps")
@@ -131,50 +247,271 @@ def detect_peak_to_peak(
     config_file: Path = typer.Option(Path("MADA_config.json"), "--config", "-c", help="MADA_configへのパス"),
     period_ini: int = typer.Option(0, "--ini", "-f", help="ファイル番号の最初"),
     period_fin: int = typer.Option(0, "--fin", "-t", help="ファイル番号の最後"),
+    use_catalog: bool = typer.Option(False, "--catalog", help="mada_reader catalog の結果からファイルを選ぶ (欠けたファイルは飛ばす)"),
+    prefetch_depth: int = typer.Option(
+        PrefetchConfig.queue_depth, help="処理中に先読みしておく buffer の数 (0 なら先読みしない)"
+    ),
+    buffer_mb: float = typer.Option(PrefetchConfig.buffer_size / 1024 ** 2, help="1回に読む量 [MiB]"),
 ):
     """
     [gain測定用]
     指定したperの全てのFADCから波形のampを算出して, ボードごとに平均する
     """
     mada_config = get_mada_config(config_file)
-    mada_files = scan_mada_files_from_path(dir, config_file, period_ini, period_fin)
-    mada_files_group_by_name: Dict[str, List[Path]] = {board_name: [] for board_name in mada_config.available_boards}
-    for mada_file in mada_files:
-        board_name = mada_file.name[:7]
-        mada_files_group_by_name[board_name].append(mada_file)
-
-    results: Dict[str, Tuple[gbkb.FlushADCAmplitude, gbkb.FlushADCAmplitude]] = \
-        {board_name: None for board_name in mada_config.available_boards}
-
-    for board_name, mada_file_list in track(mada_files_group_by_name.items(), description="Processing...", transient=True):
-        amps_min_list, amps_max_list = [], []
-        for mada_file in mada_file_list:
-            amps_min, amps_max = gbkb.get_fadc_amplitude_from_mada_file(mada_file)
-            amps_min_list.append(amps_min)
-            amps_max_list.append(amps_max)
-
-        results[board_name] = (
-            gbkb.average_flush_adc_amplitudes(amps_min_list),
-            gbkb.average_flush_adc_amplitudes(amps_max_list)
+    mada_files = scan_mada_files_from_path(dir, config_file, period_ini, period_fin, use_catalog)
+    results = {
+        board_name: GainAccumulator(with_p2p=False)
+        for board_name in mada_config.available_boards
+    }
+    file_batches = iter_file_batches(mada_files, _prefetch_config(prefetch_depth, buffer_mb))
+    for mada_file, batches in track(file_batches, total=len(mada_files), description="Processing...", transient=True):
+        for batch in batches:
+            results[mada_file.name[:7]].update(batch)
+
+    print("board name, ch0, ch1, ch2, ch3, ch0_std, ch1_std, ch2_std, ch3_std, n_events")
+    for board_name, gain in results.items():
+        for amp in (gain.amp_min, gain.amp_max):
+            print(", ".join([
+                board_name,
+                *map(_format_int, amp.average),
+                *map(_format_std, amp.std),
+                str(amp.count[0]),
+            ]))
+
+
+@app.command("features")
+def extract_pulse_features(
+    mada_paths: List[Path] = typer.Argument(..., help=".mada (複数可)"),
+    output: Path = typer.Option(Path("features.csv"), "--output", "-o", help="出力先 (.csv / .npz / .root)"),
+    baseline_window: Tuple[int, int] = typer.Option((600, 1000), help="baseline を取る clock の範囲 [begin, end)"),
+    integral_window: Tuple[int, int] = typer.Option((0, 1024), help="積分する clock の範囲 [begin, end)"),
+    threshold: float = typer.Option(20., help="time over threshold の閾値 (baseline からの高さ)"),
+    polarity: int = typer.Option(-1, help="パルスの向き (負なら -1)"),
+):
+    """
+    波形から baseline, amplitude, peak clock, 積分, rise time, time over threshold を取り出して保存する
+    (全chで同じ設定. chごとに変えるときは features.FeatureConfig を使う)
+    """
+    if output.suffix == ".root":
+        _require_root()
+    config = FeatureConfig.uniform(
+        baseline_window=baseline_window,
+        integral_window=integral_window,
+        threshold=threshold,
+        polarity=polarity,
+    )
+    features = np.concatenate([
+        extract_features_from_mada_file(mada_path, config)
+        for mada_path in track(mada_paths, description="Processing...", transient=True)
+    ])
+    if output.suffix == ".root":
+        root_backend.save_features_root(features, output)
+    else:
+        save_features(features, output)
+
+
+def _follow_table(stats: Dict[Path, FollowStats]) -> Table:
+    table = Table(title="follow")
+    table.add_column("File")
+    table.add_column("events", justify="right")
+    table.add_column("trigger", justify="right")
+    table.add_column("rate [Hz]", justify="right")
+    table.add_column("recent rate [Hz]", justify="right")
+    for ch in range(4):
+        table.add_column(f"p2p ch{ch}", justify="right")
+    for mada_path, follow_stats in stats.items():
+        table.add_row(
+            mada_path.name,
+            str(follow_stats.n_events),
+            str(follow_stats.last_trigger_counter),
+            f"{follow_stats.rate:.1f}",
+            f"{follow_stats.recent_rate:.1f}",
+            *map(_format_int, follow_stats.p2p.average),
         )
+    return table
+
+
+@app.command()
+def follow(
+    mada_paths: List[Path],
+    interval: float = typer.Option(1.0, help="更新間隔 [s]"),
+    clock_hz: float = typer.Option(CLOCK_FREQUENCY_HZ, help="clock_counter の周波数 [Hz]"),
+):
+    """
+    書き込み中の .mada を追いかけて trigger rate と p2p を表示する (Ctrl-C で終了)
+    """
+    followers = [MadaFollower(mada_path) for mada_path in mada_paths]
+    stats = {mada_path: FollowStats(clock_frequency=clock_hz) for mada_path in mada_paths}
+    with Live(_follow_table(stats), refresh_per_second=4) as live:
+        try:
+            while True:
+                for follower in followers:
+                    for batch in follower.iter_poll():
+                        stats[follower.path].update(batch)
+                live.update(_follow_table(stats))
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
 
-    print("board name, ch0, ch1, ch2, ch3")
-    for board_name, (amp_min, amp_max) in results.items():
-        print("{}, {}, {}, {}, {}".format(board_name, *map(int, amp_min.value)))
-        print("{}, {}, {}, {}, {}".format(board_name, *map(int, amp_max.value)))
+
+@app.command("evbuild")
+def event_build(
+    dir: Path = Path("."),
+    config_file: Path = typer.Option(Path("MADA_config.json"), "--config", "-c", help="MADA_configへのパス"),
+    period: int = typer.Option(0, "--period", "-p", help="ファイル番号"),
+    clock_tolerance: Optional[int] = typer.Option(None, help="同じイベントとみなす clock_counter の差"),
+):
+    """
+    activeな全ボードの .mada を trigger_counter で突き合わせて, 揃ったイベント数とorphanを表示する
+    """
+    mada_config = get_mada_config(config_file)
+    builder = EventBuilder(period_mada_files(dir, mada_config, period), clock_tolerance)
+    for _ in builder:
+        pass
+
+    report = builder.report
+    table = Table(title=f"event building (per {period})")
+    table.add_column("Board Name")
+    table.add_column("orphans", justify="right")
+    for board_name, n_orphans in report.orphans.items():
+        table.add_row(board_name, str(n_orphans))
+    Console().print(table)
+    print(
+        f"built events: {report.n_built}, clock mismatches: {report.n_clock_mismatches}, "
+        f"out of order: {report.n_out_of_order}"
+    )
+
+
+@app.command("analyze-headers")
+def analyze_headers(
+    dir: Path = Path("."),
+    config_file: Path = Path("MADA_config.json"),
+    period_ini: int = 0,
+    period_fin: int = 0,
+    clock_hz: float = typer.Option(CLOCK_FREQUENCY_HZ, help="clock_counter の周波数 [Hz]"),
+    bin_seconds: float = typer.Option(1.0, help="rate の時系列のbin幅 [s]"),
+    gap_threshold: float = typer.Option(1.0, help="これより長いイベント間隔を gap とする [s]"),
+    time_series: Optional[Path] = typer.Option(None, "--timeseries", help="時系列の出力先 (.csv / .npz)"),
+):
+    """
+    指定したperの header だけを読んで, ボードごとに trigger rate, trigger の抜け, gap などをまとめる
+    """
+    mada_files = scan_mada_files_from_path(dir, config_file, period_ini, period_fin)
+    results = analyze_files_by_board(mada_files, clock_hz, bin_seconds, gap_threshold)
+
+    table = Table(title="header summary")
+    columns = [
+        ("Board Name", lambda s: s.board_name),
+        ("files", lambda s: str(s.n_files)),
+        ("events", lambda s: str(s.n_events)),
+        ("trigger", lambda s: f"{s.first_trigger_counter}-{s.last_trigger_counter}"),
+        ("missing", lambda s: str(s.n_missing_triggers)),
+        ("duplicated", lambda s: str(s.n_duplicated_triggers)),
+        ("resets", lambda s: str(s.n_trigger_resets)),
+        ("duration [s]", lambda s: f"{s.duration:.1f}"),
+        ("livetime [s]", lambda s: f"{s.livetime:.1f}"),
+        ("gaps", lambda s: str(s.n_gaps)),
+        ("max interval [s]", lambda s: f"{s.max_interval:.3g}"),
+        ("rate [Hz]", lambda s: f"{s.trigger_rate:.2f}"),
+        ("input2 rate [Hz]", lambda s: f"{s.input_ch2_rate:.2f}"),
+    ]
+    for name, _ in columns:
+        table.add_column(name, justify="left" if name == "Board Name" else "right")
+    for summary, _ in results.values():
+        table.add_row(*(column(summary) for _, column in columns))
+    Console().print(table)
+
+    if time_series is not None:
+        save_time_series(results, time_series)
+
+
+@app.command("catalog")
+def catalog(
+    dir: Path = Path("."),
+    db: Optional[Path] = typer.Option(None, help="catalog の SQLite (デフォルトは dir/mada_catalog.sqlite)"),
+    refresh: bool = typer.Option(True, help="変わった .mada だけ読み直してから表示する"),
+    board: Optional[str] = typer.Option(None, help="ボード名 (GBKB-XX)"),
+    period_ini: Optional[int] = None,
+    period_fin: Optional[int] = None,
+    min_events: Optional[int] = typer.Option(None, help="イベント数がこれより多いファイルだけ"),
+    clock_hz: float = typer.Option(CLOCK_FREQUENCY_HZ, help="clock_counter の周波数 [Hz]"),
+):
+    """
+    dir の .mada の要約 (イベント数, counter の範囲, 時間, 壊れたフレーム数) を SQLite に溜めて表示する
+    """
+    with MadaCatalog(dir, db) as mada_catalog:
+        if refresh:
+            n_updated, n_removed = mada_catalog.refresh(
+                on_file=lambda path: print(f"reading {path.name}", file=sys.stderr)
+            )
+            print(f"updated: {n_updated}, removed: {n_removed}", file=sys.stderr)
+        entries = mada_catalog.entries(board, period_ini, period_fin, min_events)
+        total_duration = mada_catalog.total_duration(period_ini, period_fin, board, clock_hz, min_events)
+
+    table = Table(title="mada catalog")
+    columns = [
+        ("File", lambda e: e.name),
+        ("events", lambda e: str(e.n_events)),
+        ("trigger", lambda e: f"{e.first_trigger_counter}-{e.last_trigger_counter}"),
+        ("duration [s]", lambda e: f"{e.duration(clock_hz):.1f}"),
+        ("corrupted", lambda e: str(e.n_corrupted)),
+        ("size [MB]", lambda e: f"{e.size / 1024 ** 2:.1f}"),
+    ]
+    for name, _ in columns:
+        table.add_column(name, justify="left" if name == "File" else "right")
+    for entry in entries:
+        table.add_row(*(column(entry) for _, column in columns))
+    console = Console()
+    console.print(table)
+    console.print(f"total duration: {total_duration:.1f} s ({len(entries)} files)")
+
+
+@app.command("compress")
+def compress(
+    mada_paths: List[Path] = typer.Argument(..., help=".mada (複数可, 圧縮されたものを別のcodecで圧縮し直してもよい)"),
+    codec: str = typer.Option("gz", help=f"{' / '.join(CODECS)}"),
+    block_mb: float = typer.Option(DEFAULT_BLOCK_SIZE / 1024 ** 2, help="このくらいの大きさ [MiB] ごとにイベントの境界で区切って圧縮する"),
+    level: Optional[int] = typer.Option(None, help="圧縮レベル (省略するとcodecの既定値)"),
+    jobs: int = typer.Option(1, "--jobs", "-j", help="ブロックを並列に圧縮するスレッド数"),
+):
+    """
+    .mada をブロックごとに圧縮して .mada.<codec> と .blkidx (ブロックの位置) を書く
+    元のファイルは消さない. 圧縮したファイルはそのまま他のコマンドに渡せる
+    """
+    if codec not in CODECS:
+        raise typer.BadParameter(f"codec must be one of {', '.join(CODECS)}")
+    for mada_path in mada_paths:
+        start = time.perf_counter()
+        source_size = mada_path.stat().st_size
+        output_path = compress_mada(mada_path, codec, int(block_mb * 1024 ** 2), level, jobs=jobs)
+        ratio = output_path.stat().st_size / source_size if source_size > 0 else 0.
+        print(f"{mada_path} -> {output_path} ({ratio:.1%} of source, {time.perf_counter() - start:.1f} s)")
 
 
 @app.command("clock")
-def command_clock_hist(target_rootfile_path: Path, imgcat: bool = False):
+def command_clock_hist(
+    paths: List[Path] = typer.Argument(..., help=".mada または mada_reader root で作った .root (複数可)"),
+    bins: int = typer.Option(DEFAULT_N_BINS, help="bin数の目安"),
+    bin_width: Optional[int] = typer.Option(None, help="bin幅 [clock] (指定すると --bins より優先)"),
+    imgcat: bool = False,
+):
     """
-    mada_reader root で作ったrootファイルを見る
     clockの分布を出力する
+    ボード (GBKB-XX) ごとに1つのhistogramにまとめ, 32 bitの一周は戻してから詰める
     """
-    hist = clock_hist(str(target_rootfile_path))
-    save_png_path = target_rootfile_path.parent / Path(f"{target_rootfile_path.stem}_clock.png")
-    save_clock_hist_png(hist, save_png_path)
-    if imgcat:
-        subprocess.run(f"imgcat {save_png_path}", shell=True)
+    _require_root()
+    hists = root_backend.clock_hists(paths, bins, bin_width)
+    for board_name, hist in hists.items():
+        board_paths = sorted(filter(lambda p: p.name.startswith(board_name), paths), key=lambda p: p.name)
+        # GBKB-13_0000.mada.gz なども GBKB-13_0000
+        stems = [Path(strip_compression_suffix(p.name)).stem for p in board_paths]
+        if len(board_paths) == 1:
+            save_png_path = board_paths[0].parent / Path(f"{stems[0]}_clock.png")
+        else:
+            save_png_path = board_paths[0].parent / Path(f"{stems[0]}-{stems[-1][8:]}_clock.png")
+        root_backend.save_clock_hist_png(hist, save_png_path)
+        if imgcat:
+            subprocess.run(f"imgcat {save_png_path}", shell=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from mada_reader.headers import read_header_arrays, unwrap_counter
+
+DEFAULT_N_BINS = 1000
+
+
+@dataclass
+class ClockHistogram:
+    """
+    unwrap した clock_counter の分布 (等間隔bin)
+    edges: [shape (n_bins + 1,)], counts: [shape (n_bins,)]
+    """
+    name: str
+    edges: np.ndarray
+    counts: np.ndarray
+    sum_clock: float = 0.
+    sum_clock2: float = 0.
+
+    @property
+    def n_entries(self) -> int:
+        return int(self.counts.sum())
+
+    @property
+    def bin_width(self) -> int:
+        return int(self.edges[1] - self.edges[0])
+
+
+def choose_bin_width(span: int, n_bins: int = DEFAULT_N_BINS, bin_width: Optional[int] = None) -> int:
+    """
+    bin_width が指定されていなければ, span がだいたい n_bins 個のbinになる幅 (1 clock 以上)
+    """
+    if bin_width is not None:
+        return max(int(bin_width), 1)
+    return max(-(-span // n_bins), 1)
+
+
+def clock_histogram(
+    name: str,
+    clocks: np.ndarray,
+    n_bins: int = DEFAULT_N_BINS,
+    bin_width: Optional[int] = None,
+) -> ClockHistogram:
+    """
+    clocks は unwrap_counter 済みのもの
+    """
+    if len(clocks) == 0:
+        return ClockHistogram(name, np.array([0, 1], dtype=np.int64), np.zeros(1, dtype=np.int64))
+    clocks_min, clocks_max = int(clocks.min()), int(clocks.max())
+    width = choose_bin_width(clocks_max - clocks_min, n_bins, bin_width)
+    n = (clocks_max - clocks_min) // width + 1
+    edges = clocks_min + width * np.arange(n + 1, dtype=np.int64)
+    counts = np.bincount((clocks - clocks_min) // width, minlength=n)
+    x = clocks.astype(np.float64)
+    return ClockHistogram(name, edges, counts, x.sum(), (x * x).sum())
+
+
+def read_mada_clock_counter(mada_file_path: Path) -> np.ndarray:
+    return read_header_arrays(mada_file_path).clock_counter
+
+
+def clock_histograms_by_board(
+    paths: List[Path],
+    n_bins: int = DEFAULT_N_BINS,
+    bin_width: Optional[int] = None,
+    read_clock_counter: Callable[[Path], np.ndarray] = read_mada_clock_counter,
+) -> Dict[str, ClockHistogram]:
+    """
+    GBKB-XX_NNNN ごとのファイルをボード (GBKB-XX) ごとにまとめ, ファイル名順に clock_counter をつなげて unwrap する
+    """
+    paths_by_board: Dict[str, List[Path]] = {}
+    for path in sorted(paths, key=lambda p: p.name):
+        paths_by_board.setdefault(path.name[:7], []).append(path)
+
+    hists: Dict[str, ClockHistogram] = {}
+    for board_name, board_paths in paths_by_board.items():
+        clocks = []
+        last: Optional[int] = None
+        for path in board_paths:
+            unwrapped = unwrap_counter(read_clock_counter(path), last)
+            if len(unwrapped) > 0:
+                last = int(unwrapped[-1])
+            clocks.append(unwrapped)
+        hists[board_name] = clock_histogram(board_name, np.concatenate(clocks), n_bins, bin_width)
+    return hists
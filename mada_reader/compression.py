@@ -0,0 +1,78 @@
+"""
+圧縮した .mada (.mada.gz / .mada.xz / .mada.bz2) を標準ライブラリだけで読み書きする
+展開したものをディスクに書かずに, 決まった大きさずつ展開して FrameAssembler に渡す
+"""
+import bz2
+import gzip
+import lzma
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from mada_reader import profiling
+
+CODECS = {"gz": gzip, "xz": lzma, "bz2": bz2}
+COMPRESSED_SUFFIXES = tuple(f".{codec}" for codec in CODECS)
+# 1回に展開する量 (メモリ使用量はファイルサイズによらずこれで決まる)
+DEFAULT_READ_SIZE = 4 * 1024 ** 2
+
+
+def compression_codec(file_path: Path) -> Optional[str]:
+    """
+    GBKB-13_0000.mada.gz -> "gz" (圧縮されていなければ None)
+    """
+    suffix = Path(file_path).suffix
+    return suffix[1:] if suffix in COMPRESSED_SUFFIXES else None
+
+
+def is_compressed(file_path: Path) -> bool:
+    return compression_codec(file_path) is not None
+
+
+def strip_compression_suffix(name: str) -> str:
+    """
+    GBKB-13_0000.mada.gz -> GBKB-13_0000.mada
+    """
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def open_mada(file_path: Path) -> BinaryIO:
+    """
+    圧縮されていれば展開しながら読むファイルオブジェクトを返す
+    (gzip, xz, bz2 とも複数の member / stream をつなげたものも続けて読める)
+    """
+    codec = compression_codec(file_path)
+    if codec is None:
+        return open(file_path, "rb")
+    return CODECS[codec].open(file_path, "rb")
+
+
+def iter_decompressed(file_path: Path, read_size: int = DEFAULT_READ_SIZE) -> Iterator[bytes]:
+    """
+    展開したbyte列を read_size byte ずつ返す
+    """
+    with open_mada(file_path) as f:
+        while True:
+            with profiling.stage("decompress") as s:
+                data = f.read(read_size)
+                s.n_bytes = len(data)
+            if not data:
+                return
+            yield data
+
+
+def compress_bytes(codec: str, data: bytes, level: Optional[int] = None) -> bytes:
+    """
+    1つの member (xz なら stream) に圧縮する. level を省略すると各codecの既定値
+    """
+    if codec == "xz":
+        return lzma.compress(data, preset=level)
+    if level is None:
+        return CODECS[codec].compress(data)
+    return CODECS[codec].compress(data, compresslevel=level)
+
+
+def decompress_bytes(codec: str, data: bytes) -> bytes:
+    return CODECS[codec].decompress(data)
@@ -0,0 +1,127 @@
+import multiprocessing
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from mada_reader import profiling, root_backend
+from mada_reader.files import root_output_path
+from mada_reader.manifest import ConversionManifest, SourceFingerprint
+from mada_reader.prefetch import PrefetchConfig, iter_events_prefetched
+
+# .root の中身が変わる変更をしたら上げる (manifest に記録されているものと違えば変換し直す)
+CONVERTER_VERSION = "gbkb-1"
+
+
+def converter_name(with_hits: bool = False) -> str:
+    return CONVERTER_VERSION + ("+hits" if with_hits else "")
+
+
+@dataclass
+class ConversionResult:
+    mada_path: Path
+    elapsed: float = 0.
+    error: Optional[str] = None
+    profile: Optional[dict] = None  # worker プロセスの profiling.Profiler.to_dict()
+    skipped: bool = False  # manifest で最新とわかったので変換しなかった
+    fingerprint: Optional[SourceFingerprint] = None  # 変換前の元ファイル (manifest を使うときだけ)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _mada_to_root(mada_path: Path, with_hits: bool = False, prefetch: Optional[PrefetchConfig] = None) -> None:
+    # ROOTはworkerプロセスの中で初めてimportする
+    # prefetch を渡すと, ROOT に書いている間に次の buffer を別スレッドで読んでおく
+    batches = iter_events_prefetched(mada_path, prefetch, with_hits=with_hits) if prefetch is not None else None
+    root_backend.mada_to_root(mada_path, with_hits=with_hits, batches=batches)
+
+
+def _convert_one(
+    converter: Callable[[Path], None],
+    mada_path: Path,
+    with_fingerprint: bool = False
+) -> ConversionResult:
+    start = time.perf_counter()
+    try:
+        # hash はworkerで取る (親で取ると直列になる)
+        fingerprint = SourceFingerprint.of(mada_path) if with_fingerprint else None
+        converter(mada_path)
+    except Exception:
+        return ConversionResult(mada_path, time.perf_counter() - start, traceback.format_exc())
+    return ConversionResult(mada_path, time.perf_counter() - start, fingerprint=fingerprint)
+
+
+def _convert_one_in_worker(
+    converter: Callable[[Path], None],
+    mada_path: Path,
+    with_fingerprint: bool,
+    profile: bool
+) -> ConversionResult:
+    # spawn したプロセスでは profiling の状態は引き継がれないので, 結果と一緒に返して親で足す
+    profiler = profiling.enable_profiling(profile)
+    profiler.reset()
+    result = _convert_one(converter, mada_path, with_fingerprint)
+    result.profile = profiler.to_dict()
+    return result
+
+
+def convert_files(
+    mada_files: List[Path],
+    jobs: int = 1,
+    on_done: Optional[Callable[[ConversionResult], None]] = None,
+    converter: Callable[[Path], None] = _mada_to_root,
+    manifest: Optional[ConversionManifest] = None,
+    force: bool = False,
+) -> List[ConversionResult]:
+    """
+    mada_files を .root に変換する
+    jobs > 1 のときはspawnしたプロセスで並列に変換するので, ROOTの状態はファイルごとに独立している
+    失敗したファイルがあっても残りは続け, 結果は mada_files と同じ順で返す
+    manifest を渡すと, 前回から変わっていないファイルは飛ばし (force=True なら全て変換し直す),
+    変換できたものから manifest に書いていくので, 途中で止まっても次は残りだけをやり直せる
+    """
+    results: List[Optional[ConversionResult]] = [None] * len(mada_files)
+
+    def done(i: int, result: ConversionResult) -> None:
+        if manifest is not None and result.ok and not result.skipped:
+            manifest.record(result.mada_path, result.fingerprint, root_output_path(result.mada_path))
+            manifest.save()
+        results[i] = result
+        if on_done:
+            on_done(result)
+
+    targets = []
+    for i, mada_file in enumerate(mada_files):
+        if manifest is not None and not force and manifest.is_up_to_date(mada_file, root_output_path(mada_file)):
+            done(i, ConversionResult(mada_file, skipped=True))
+        else:
+            targets.append(i)
+    with_fingerprint = manifest is not None
+
+    if jobs <= 1:
+        for i in targets:
+            done(i, _convert_one(converter, mada_files[i], with_fingerprint))
+        return results
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as executor:
+        profiler = profiling.get_profiler()
+        futures = {
+            executor.submit(_convert_one_in_worker, converter, mada_files[i], with_fingerprint, profiler.enabled): i
+            for i in targets
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                result = future.result()
+            except Exception:
+                # workerごと落ちた場合 (segfaultなど)
+                result = ConversionResult(mada_files[i], error=traceback.format_exc())
+            if result.profile is not None:
+                profiler.merge_dict(result.profile)
+            done(i, result)
+    return results
@@ -0,0 +1,132 @@
+import heapq
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from mada_reader.files import find_mada_file
+from mada_reader.headers import unwrap_counter, unwrap_trigger_counter
+from mada_reader.models.mada_config import MadaConfig
+from mada_reader.parser import Event, EventBatch
+from mada_reader.stream import iter_events
+
+
+@dataclass
+class BuiltEvent:
+    """
+    全ボードで同じ trigger_counter を持つイベントをまとめたもの
+    """
+    trigger_counter: int
+    events: Dict[str, Event]
+
+
+@dataclass
+class BuildReport:
+    n_built: int = 0
+    orphans: Dict[str, int] = field(default_factory=dict)  # 相手が揃わなかったボードごとのイベント数
+    n_clock_mismatches: int = 0
+    n_out_of_order: int = 0  # 前のイベントより trigger_counter が小さく, 読み飛ばしたイベント (orphans にも数える)
+
+
+# (trigger_counter, ボードの順番, clock_counter, ボード名, batch, batch中の番号)
+_Entry = Tuple[int, int, int, str, EventBatch, int]
+
+
+class EventBuilder:
+    """
+    ボードごとの .mada を trigger_counter で k-way merge して, 全ボードが揃ったイベントを返す
+    clock_tolerance を指定すると clock_counter の差がそれ以下のものだけを揃ったとみなす
+    merge は trigger_counter の小さい順に返すので, それより大きい trigger_counter が来た時点で
+    揃っていないイベントは orphan として数える (待っているのは1つの trigger_counter ぶんだけなので,
+    メモリは chunk_size で決まり, runの長さにはよらない)
+    """
+
+    def __init__(
+        self,
+        mada_files: Dict[str, Path],
+        clock_tolerance: Optional[int] = None,
+        chunk_size: int = 256,
+    ):
+        self.mada_files = mada_files
+        self.clock_tolerance = clock_tolerance
+        self.chunk_size = chunk_size
+        self.report = BuildReport(orphans={board_name: 0 for board_name in mada_files})
+
+    def _iter_board_entries(self, board_id: int, board_name: str, mada_file_path: Path) -> Iterator[_Entry]:
+        """
+        heapq.merge に渡せるように, trigger_counter が前より小さいイベント (reset, 順番の入れ替わり) は読み飛ばす
+        """
+        last_trigger: Optional[int] = None
+        last_clock: Optional[int] = None
+        for batch in iter_events(mada_file_path, self.chunk_size):
+            if len(batch) == 0:
+                continue
+            triggers = unwrap_trigger_counter(batch.trigger_counter, last_trigger)
+            # それまでの最大より小さいものを読み飛ばす (clock_counter も残ったものだけでつなげる)
+            first = triggers[0] if last_trigger is None else last_trigger
+            keep = triggers >= np.maximum.accumulate(np.concatenate([[first], triggers[:-1]]))
+            n_dropped = len(keep) - int(keep.sum())
+            self.report.n_out_of_order += n_dropped
+            self.report.orphans[board_name] += n_dropped
+            if n_dropped == len(keep):
+                continue
+            indices = np.flatnonzero(keep)
+            clocks = unwrap_counter(batch.clock_counter[indices], last_clock)
+            last_trigger, last_clock = int(triggers[indices[-1]]), int(clocks[-1])
+            for i, trigger, clock in zip(indices.tolist(), triggers[indices].tolist(), clocks.tolist()):
+                yield trigger, board_id, clock, board_name, batch, i
+
+    def _add_orphans(self, group: Dict[str, _Entry]) -> None:
+        for board_name in group:
+            self.report.orphans[board_name] += 1
+
+    def _is_coincident(self, group: Dict[str, _Entry]) -> bool:
+        if self.clock_tolerance is None:
+            return True
+        clocks = [entry[2] for entry in group.values()]
+        return max(clocks) - min(clocks) <= self.clock_tolerance
+
+    def __iter__(self) -> Iterator[BuiltEvent]:
+        streams = [
+            self._iter_board_entries(board_id, board_name, mada_file_path)
+            for board_id, (board_name, mada_file_path) in enumerate(self.mada_files.items())
+        ]
+        pending: "OrderedDict[int, Dict[str, _Entry]]" = OrderedDict()
+        for entry in heapq.merge(*streams, key=lambda e: (e[0], e[1])):
+            trigger, _, _, board_name, _, _ = entry
+            while pending and next(iter(pending)) < trigger:
+                _, oldest = pending.popitem(last=False)
+                self._add_orphans(oldest)
+
+            group = pending.setdefault(trigger, {})
+            if board_name in group:
+                # 同じボードで trigger_counter が重複している
+                self.report.orphans[board_name] += 1
+            group[board_name] = entry
+
+            if len(group) == len(self.mada_files):
+                del pending[trigger]
+                if self._is_coincident(group):
+                    self.report.n_built += 1
+                    yield BuiltEvent(trigger, {
+                        name: batch.event(i) for name, (_, _, _, _, batch, i) in group.items()
+                    })
+                else:
+                    self.report.n_clock_mismatches += 1
+                    self._add_orphans(group)
+
+        for group in pending.values():
+            self._add_orphans(group)
+
+
+def period_mada_files(dir: Path, mada_config: MadaConfig, period: int) -> Dict[str, Path]:
+    """
+    MadaConfig で active なボードの GBKB-XX_NNNN.mada (無ければ圧縮したもの)
+    """
+    return {
+        board_name: find_mada_file(dir, f"{board_name}_{str(period).zfill(4)}.mada")
+        for board_name in mada_config.available_boards
+    }
+
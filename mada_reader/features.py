@@ -0,0 +1,166 @@
+import csv
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from mada_reader import profiling
+from mada_reader.parser import FADC_CHANNEL_IDS, EventBatch
+from mada_reader.stream import iter_events
+
+# (n_events, 4) で持つ特徴量
+# baseline, baseline_rms: baseline_window での平均と RMS
+# amp_min, amp_max: 波形の min, max から baseline を引いたもの (calc_fadc_amplitudes と同じ)
+# peak_clock: polarity 向きに一番大きいサンプルの clock
+# integral: integral_window での polarity * (波形 - baseline) の和
+# rise_time: peak の前で 10% から 90% に上がるまでの clock 数
+# time_over_threshold: polarity * (波形 - baseline) が threshold を超えているサンプル数
+FEATURE_DTYPES = (
+    ("baseline", np.float32),
+    ("baseline_rms", np.float32),
+    ("amp_min", np.float32),
+    ("amp_max", np.float32),
+    ("peak_clock", np.int16),
+    ("integral", np.float32),
+    ("rise_time", np.int16),
+    ("time_over_threshold", np.int16),
+)
+COUNTER_NAMES = ("trigger_counter", "clock_counter", "input_ch2_counter")
+
+
+@dataclass(frozen=True)
+class ChannelFeatureConfig:
+    baseline_window: Tuple[int, int] = (600, 1000)
+    integral_window: Tuple[int, int] = (0, 1024)
+    threshold: float = 20.  # [ADC] baseline からの高さ
+    polarity: int = -1  # 負のパルスなら -1
+
+
+@dataclass(frozen=True)
+class FeatureConfig:
+    channels: Tuple[ChannelFeatureConfig, ...] = (ChannelFeatureConfig(),) * len(FADC_CHANNEL_IDS)
+
+    @classmethod
+    def uniform(cls, **kwargs) -> "FeatureConfig":
+        """
+        全chに同じ設定を使う (kwargs は ChannelFeatureConfig のフィールド)
+        """
+        return cls((replace(ChannelFeatureConfig(), **kwargs),) * len(FADC_CHANNEL_IDS))
+
+    def window_mask(self, name: str, depth: int) -> np.ndarray:
+        """
+        (4, depth) の bool. ch ごとの window の中だけ True
+        """
+        clocks = np.arange(depth)
+        return np.array([
+            (getattr(ch, name)[0] <= clocks) & (clocks < getattr(ch, name)[1])
+            for ch in self.channels
+        ])
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        (4, 1) の ch ごとの値
+        """
+        return np.array([getattr(ch, name) for ch in self.channels], dtype=np.float64)[:, None]
+
+
+def feature_dtype(n_channels: int = len(FADC_CHANNEL_IDS)) -> np.dtype:
+    return np.dtype(
+        [(name, np.uint32) for name in COUNTER_NAMES]
+        + [(name, dtype, (n_channels,)) for name, dtype in FEATURE_DTYPES]
+    )
+
+
+def _last_true(mask: np.ndarray) -> np.ndarray:
+    # 最後の軸で最後に True になる index (無ければ -1)
+    depth = mask.shape[-1]
+    return np.where(mask.any(axis=-1), depth - 1 - np.argmax(mask[..., ::-1], axis=-1), -1)
+
+
+def extract_features(batch: EventBatch, config: FeatureConfig = FeatureConfig()) -> np.ndarray:
+    """
+    EventBatch の全イベント・全chの特徴量を1回でまとめて計算し, 構造化配列 (n_events,) で返す
+    途中で切れたイベントは有効なサンプルだけを使う (baseline_window に1つも無ければ nan)
+    """
+    with profiling.stage("reduction", n_bytes=batch.fadc.nbytes, n_events=len(batch)):
+        features = np.zeros(len(batch), dtype=feature_dtype(batch.fadc.shape[1]))
+        for name in COUNTER_NAMES:
+            features[name] = getattr(batch, name)
+        if len(batch) == 0:
+            return features
+
+        depth = batch.depth
+        valid_mask = batch.valid_mask
+        fadc = batch.fadc.astype(np.float32)
+        polarity = config.column("polarity").astype(np.float32)
+
+        baseline_mask = valid_mask & config.window_mask("baseline_window", depth)
+        n_baseline = baseline_mask.sum(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            baseline = fadc.sum(axis=2, where=baseline_mask, dtype=np.float64) / n_baseline
+            baseline_square = np.square(fadc).sum(axis=2, where=baseline_mask, dtype=np.float64) / n_baseline
+        baseline_rms = np.sqrt(np.maximum(baseline_square - baseline ** 2, 0))
+
+        # polarity 向きを正にした信号. 無効なサンプルは -inf にして peak や閾値に引っかからないようにする
+        signal = np.where(
+            valid_mask,
+            polarity * (fadc - baseline[:, :, None].astype(np.float32)),
+            np.float32(-np.inf)
+        )
+        peak_clock = np.argmax(signal, axis=2)
+        amplitude = np.take_along_axis(signal, peak_clock[:, :, None], axis=2)
+
+        before_peak = np.arange(depth) <= peak_clock[:, :, None]
+        t10 = _last_true(before_peak & (signal < 0.1 * amplitude)) + 1
+        t90 = _last_true(before_peak & (signal < 0.9 * amplitude)) + 1
+
+        integral_mask = valid_mask & config.window_mask("integral_window", depth)
+
+        features["baseline"] = baseline
+        features["baseline_rms"] = baseline_rms
+        features["amp_min"] = fadc.min(axis=2, where=valid_mask, initial=np.inf) - baseline
+        features["amp_max"] = fadc.max(axis=2, where=valid_mask, initial=-np.inf) - baseline
+        features["peak_clock"] = peak_clock
+        features["integral"] = signal.sum(axis=2, where=integral_mask, dtype=np.float64)
+        features["rise_time"] = t90 - t10
+        features["time_over_threshold"] = (signal > config.column("threshold")).sum(axis=2)
+        return features
+
+
+def extract_features_from_mada_file(mada_file_path: Path, config: FeatureConfig = FeatureConfig()) -> np.ndarray:
+    features = [extract_features(batch, config) for batch in iter_events(mada_file_path)]
+    return np.concatenate(features) if features else np.zeros(0, dtype=feature_dtype())
+
+
+def flat_columns(features: np.ndarray) -> List[Tuple[str, np.ndarray]]:
+    """
+    (n_channels,) のフィールドを baseline_ch0, baseline_ch1, ... の列に分ける
+    """
+    columns = []
+    for name in features.dtype.names:
+        values = features[name]
+        if values.ndim == 1:
+            columns.append((name, values))
+        else:
+            columns.extend((f"{name}_ch{ch}", values[:, ch]) for ch in range(values.shape[1]))
+    return columns
+
+
+def save_features(features: np.ndarray, save_path: Path) -> None:
+    """
+    .npz なら構造化配列のまま, .csv なら flat_columns の列で書く
+    (.root は root_backend.save_features_root)
+    """
+    if save_path.suffix == ".npz":
+        with open(save_path, "wb") as f:
+            np.savez(f, features=features)
+        return
+    if save_path.suffix != ".csv":
+        raise ValueError(f"unsupported suffix: {save_path.suffix}")
+
+    columns = flat_columns(features)
+    with open(save_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in columns])
+        writer.writerows(zip(*(values.tolist() for _, values in columns)))
@@ -1,22 +1,58 @@
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
+from mada_reader.catalog import MadaCatalog
+from mada_reader.compression import COMPRESSED_SUFFIXES, strip_compression_suffix
 from mada_reader.models.mada_config import MadaConfig, get_mada_config
 
 
+def root_output_path(mada_file_path: Path) -> Path:
+    # /hoge/fuga/piyo.mada -> /hoge/fuga/piyo.root (piyo.mada.gz なども piyo.root)
+    return mada_file_path.absolute().parent / strip_compression_suffix(mada_file_path.name).replace(".mada", ".root")
+
+
+def find_mada_file(dir: Path, name: str) -> Path:
+    """
+    dir/name が無く, 圧縮したもの (name.gz, name.xz, name.bz2) があればそれを返す
+    どれも無ければ dir/name
+    """
+    mada_file_path = dir / name
+    if mada_file_path.exists():
+        return mada_file_path
+    for suffix in COMPRESSED_SUFFIXES:
+        compressed = dir / (name + suffix)
+        if compressed.exists():
+            return compressed
+    return mada_file_path
+
+
 def scan_mada_files(
     dir: Path,
     mada_config: MadaConfig,
     initial_period: int = 0,
-    final_period: int = 0
+    final_period: int = 0,
+    catalog: Optional[MadaCatalog] = None,
 ) -> List[Path]:
+    """
+    GBKB-XX_NNNN.mada が無ければ圧縮したもの (.mada.gz, .mada.xz, .mada.bz2) を使う
+    catalog を渡すと, activeなボードのうち catalog にあって実際に存在するファイルだけを返す
+    (途中のperが欠けていてもエラーにしない)
+    """
+    if catalog is not None:
+        active_boards = set(mada_config.available_boards)
+        return [
+            dir / entry.name
+            for entry in catalog.entries(period_ini=initial_period, period_fin=final_period)
+            if entry.board_name in active_boards and (dir / entry.name).exists()
+        ]
+
     target_mada_files: List[Path] = []
     active_gigaiwaki = filter(lambda x: x.is_active, mada_config.giga_iwaki)
     for gigaiwaki_config in active_gigaiwaki:
         for per in range(initial_period, final_period + 1):
             per = str(per).zfill(4)  # 1 -> 0001
             target_mada_files.append(
-                dir / Path(f"{gigaiwaki_config.name}_{per}.mada")
+                find_mada_file(dir, f"{gigaiwaki_config.name}_{per}.mada")
             )
 
     # file existance check
@@ -34,11 +70,13 @@ def scan_mada_files_from_path(
     dir: Path,
     mada_config_path: Path,
     initial_period: int = 0,
-    final_period: int = 0
+    final_period: int = 0,
+    use_catalog: bool = False,
 ) -> List[Path]:
-    return scan_mada_files(
-        dir,
-        get_mada_config(mada_config_path),
-        initial_period,
-        final_period,
-    )
+    """
+    use_catalog=True なら dir の catalog (mada_reader catalog で作ったもの) を使う
+    """
+    if not use_catalog:
+        return scan_mada_files(dir, get_mada_config(mada_config_path), initial_period, final_period)
+    with MadaCatalog(dir) as catalog:
+        return scan_mada_files(dir, get_mada_config(mada_config_path), initial_period, final_period, catalog)
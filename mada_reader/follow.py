@@ -0,0 +1,121 @@
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+from mada_reader.gain import RunningStats, calc_fadc_peak2peak_batch
+from mada_reader.headers import CLOCK_FREQUENCY_HZ, unwrap_counter
+from mada_reader.parser import EventBatch, parse_batch
+from mada_reader.stream import FrameAssembler
+
+READ_SIZE = 16 * 1024 ** 2
+
+
+class MadaFollower:
+    """
+    DAQが書き込み中の .mada を追いかける
+    どこまで読んだかを覚えておき, poll() では新しく書き足された完全なイベントだけをparseする
+    (次のイベントの uPIC が届くまで最後のイベントは返さない)
+    1回に読むのは read_size byte までなので, 溜まっている分は iter_poll() で少しずつ読む
+    """
+
+    def __init__(self, mada_file_path: Path, flush_adc_clock_depth: int = 1024, read_size: int = READ_SIZE):
+        self.path = Path(mada_file_path)
+        self.flush_adc_clock_depth = flush_adc_clock_depth
+        self.read_size = read_size
+        self.offset = 0
+        self._assembler = FrameAssembler()
+
+    def _file_size(self) -> int:
+        if not self.path.exists():
+            return self.offset
+        size = os.path.getsize(self.path)
+        if size < self.offset:
+            # ファイルが作り直された
+            self.offset = 0
+            self._assembler = FrameAssembler()
+        return size
+
+    def _poll_until(self, size: int, final: bool) -> EventBatch:
+        payloads = []
+        if self.offset < size:
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                data = f.read(min(self.read_size, size - self.offset))
+            self.offset += len(data)
+            payloads += self._assembler.feed(data)
+            if not data:
+                # 読めなかったら (ファイルが縮んだなど) 今ある分で終わりにする
+                size = self.offset
+        if final and self.offset >= size:
+            payloads += self._assembler.flush()
+        return parse_batch(payloads, self.flush_adc_clock_depth)
+
+    def poll(self, final: bool = False) -> EventBatch:
+        """
+        新しく書き足された分を最大 read_size byte 読んで, 完全に届いたイベントを返す
+        final=True のときは最後まで読んだら書きかけとして持っていた最後のイベントも返す (run終了後など)
+        """
+        return self._poll_until(self._file_size(), final)
+
+    def iter_poll(self, final: bool = False) -> Iterator[EventBatch]:
+        """
+        呼んだときのファイルの終わりまで poll を繰り返す
+        (書き込み中のrunの途中から追いかけても, メモリは read_size ぶんで決まる)
+        """
+        size = self._file_size()
+        while True:
+            yield self._poll_until(size, final)
+            if self.offset >= size:
+                return
+
+
+@dataclass
+class FollowStats:
+    """
+    follow 中の1ファイル (1ボード) の統計
+    rate は clock_counter から計算する
+    """
+    clock_frequency: float = CLOCK_FREQUENCY_HZ
+    n_events: int = 0
+    first_clock: Optional[int] = None
+    last_clock: Optional[int] = None
+    last_trigger_counter: Optional[int] = None
+    recent_rate: float = np.nan
+    p2p: RunningStats = field(default_factory=RunningStats)
+    recent_p2p: RunningStats = field(default_factory=RunningStats)
+
+    def update(self, batch: EventBatch) -> None:
+        self.recent_p2p = RunningStats()
+        if len(batch) == 0:
+            return
+        clocks = unwrap_counter(batch.clock_counter, self.last_clock)
+        if self.first_clock is None:
+            self.first_clock = int(clocks[0])
+            previous_clock, n_intervals = int(clocks[0]), len(batch) - 1
+        else:
+            previous_clock, n_intervals = self.last_clock, len(batch)
+        elapsed = (int(clocks[-1]) - previous_clock) / self.clock_frequency
+        self.recent_rate = n_intervals / elapsed if elapsed > 0 else np.nan
+
+        self.last_clock = int(clocks[-1])
+        self.last_trigger_counter = int(batch.trigger_counter[-1])
+        self.n_events += len(batch)
+        p2p = calc_fadc_peak2peak_batch(batch)
+        self.p2p.update(p2p)
+        self.recent_p2p.update(p2p)
+
+    @property
+    def elapsed(self) -> float:
+        """
+        最初のイベントから最後のイベントまでの秒数
+        """
+        if self.first_clock is None:
+            return 0.
+        return (self.last_clock - self.first_clock) / self.clock_frequency
+
+    @property
+    def rate(self) -> float:
+        return (self.n_events - 1) / self.elapsed if self.elapsed > 0 else np.nan
@@ -0,0 +1,142 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+from mada_reader import profiling
+from mada_reader.parser import EventBatch
+from mada_reader.stream import iter_events
+
+
+def calc_fadc_peak2peak_batch(batch: EventBatch) -> np.ndarray:
+    """
+    gbkb.calc_fadc_peak2peak を EventBatch の全イベントに対してまとめて行う
+    どれかのchが空のイベントは除く
+    [shape (n_events, 4)]
+    """
+    has_all_channels = (batch.fadc_lengths > 0).all(axis=1)
+    fadc = batch.fadc[has_all_channels]
+    valid_mask = batch.valid_mask[has_all_channels]
+    fadc_max = np.where(valid_mask, fadc, 0).max(axis=2, initial=0)
+    fadc_min = np.where(valid_mask, fadc, np.iinfo(np.uint16).max).min(axis=2, initial=np.iinfo(np.uint16).max)
+    return np.abs(fadc_max.astype(np.float64) - fadc_min)
+
+
+def calc_fadc_amplitudes_batch(
+    batch: EventBatch,
+    baseline_correction_range: Tuple[int, int] = (600, 1000)
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    gbkb.calc_fadc_amplitudes を EventBatch の全イベントに対してまとめて行う
+    ch0 が depth ぶん揃っていない, またはどれかのchが空のイベントは除く
+    [shape (n_events, 4)], [shape (n_events, 4)]
+    """
+    is_target = (batch.fadc_lengths[:, 0] == batch.depth) & (batch.fadc_lengths > 0).all(axis=1)
+    fadc = batch.fadc[is_target].astype(np.float64)
+    valid_mask = batch.valid_mask[is_target]
+    range_min, range_max = baseline_correction_range
+
+    baseline_mask = valid_mask[:, :, range_min:range_max]
+    baselines = np.where(baseline_mask, fadc[:, :, range_min:range_max], 0).sum(axis=2) / baseline_mask.sum(axis=2)
+
+    amp_min = np.where(valid_mask, fadc, np.inf).min(axis=2) - baselines
+    amp_max = np.where(valid_mask, fadc, -np.inf).max(axis=2) - baselines
+    return amp_min, amp_max
+
+
+@dataclass
+class RunningStats:
+    """
+    chごとの count, sum, 平均, 分散 (Welford), min, max を逐次更新する
+    別ファイル・別プロセスで作ったものを merge できる
+    """
+    n_channels: int = 4
+    count: np.ndarray = field(init=False)
+    total: np.ndarray = field(init=False)
+    mean: np.ndarray = field(init=False)
+    m2: np.ndarray = field(init=False)
+    min: np.ndarray = field(init=False)
+    max: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        self.count = np.zeros(self.n_channels, dtype=np.int64)
+        self.total = np.zeros(self.n_channels)
+        self.mean = np.zeros(self.n_channels)
+        self.m2 = np.zeros(self.n_channels)
+        self.min = np.full(self.n_channels, np.inf)
+        self.max = np.full(self.n_channels, -np.inf)
+
+    def update(self, values: np.ndarray) -> None:
+        """
+        values: [shape (n_events, n_channels)]
+        """
+        if len(values) == 0:
+            return
+        batch_stats = RunningStats(self.n_channels)
+        batch_stats.count[:] = len(values)
+        batch_stats.total[:] = values.sum(axis=0)
+        batch_stats.mean[:] = values.mean(axis=0)
+        batch_stats.m2[:] = ((values - batch_stats.mean) ** 2).sum(axis=0)
+        batch_stats.min[:] = values.min(axis=0)
+        batch_stats.max[:] = values.max(axis=0)
+        self.merge(batch_stats)
+
+    def merge(self, other: "RunningStats") -> None:
+        count = self.count + other.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = other.mean - self.mean
+            self.mean = np.where(count > 0, self.mean + delta * other.count / count, 0.)
+            self.m2 = np.where(count > 0, self.m2 + other.m2 + delta ** 2 * self.count * other.count / count, 0.)
+        self.count = count
+        self.total = self.total + other.total
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+
+    @property
+    def average(self) -> np.ndarray:
+        """
+        イベントが無いchは nan
+        """
+        return np.where(self.count > 0, self.mean, np.nan)
+
+    @property
+    def std(self) -> np.ndarray:
+        """
+        標準偏差 (np.std と同じく ddof=0)
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.m2 / self.count)
+
+
+@dataclass
+class GainAccumulator:
+    """
+    1ボードぶんの p2p と amplitude (min, max) の RunningStats
+    使わない方は with_p2p / with_amplitude を False にすると計算しない
+    """
+    baseline_correction_range: Tuple[int, int] = (600, 1000)
+    with_p2p: bool = True
+    with_amplitude: bool = True
+    p2p: RunningStats = field(default_factory=RunningStats)
+    amp_min: RunningStats = field(default_factory=RunningStats)
+    amp_max: RunningStats = field(default_factory=RunningStats)
+
+    def update(self, batch: EventBatch) -> None:
+        with profiling.stage("reduction", n_bytes=batch.fadc.nbytes, n_events=len(batch)):
+            if self.with_p2p:
+                self.p2p.update(calc_fadc_peak2peak_batch(batch))
+            if self.with_amplitude:
+                amp_min, amp_max = calc_fadc_amplitudes_batch(batch, self.baseline_correction_range)
+                self.amp_min.update(amp_min)
+                self.amp_max.update(amp_max)
+
+    def update_from_mada_file(self, mada_file_path: Path) -> None:
+        for batch in iter_events(mada_file_path):
+            self.update(batch)
+
+    def merge(self, other: "GainAccumulator") -> None:
+        self.p2p.merge(other.p2p)
+        self.amp_min.merge(other.amp_min)
+        self.amp_max.merge(other.amp_max)
+
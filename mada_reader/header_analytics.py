@@ -0,0 +1,157 @@
+import csv
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from mada_reader.headers import (
+    CLOCK_FREQUENCY_HZ,
+    HeaderArrays,
+    read_header_arrays,
+    unwrap_counter,
+    unwrap_trigger_counter,
+)
+
+
+@dataclass
+class HeaderSummary:
+    board_name: str
+    n_files: int
+    n_events: int
+    first_trigger_counter: int
+    last_trigger_counter: int
+    n_missing_triggers: int  # trigger_counter が飛んだぶん
+    n_duplicated_triggers: int  # 前のイベントと同じ trigger_counter
+    n_trigger_resets: int  # 一周ではなく trigger_counter が減ったところ (reset, 順番の入れ替わり)
+    duration: float  # [s] 最初から最後のイベントまで
+    livetime: float  # [s] gap_threshold より長い間隔を除いた時間
+    n_gaps: int
+    max_interval: float  # [s]
+    trigger_rate: float  # [Hz]
+    input_ch2_rate: float  # [Hz]
+
+
+@dataclass
+class HeaderTimeSeries:
+    """
+    time: 最初のイベントからの秒数 [shape (n_events,)]
+    instantaneous_rate: 前のイベントとの間隔の逆数 (最初のイベントは nan)
+    bin_edges: rate を数えるbinの端 [shape (n_bins + 1,)]
+    """
+    time: np.ndarray
+    instantaneous_rate: np.ndarray
+    bin_edges: np.ndarray
+    trigger_rate: np.ndarray
+    input_ch2_rate: np.ndarray
+
+
+def _unwrap_headers(header_arrays_list: List[HeaderArrays]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if len(header_arrays_list) == 0:
+        return tuple(np.zeros(0, dtype=np.int64) for _ in range(3))
+    triggers, clocks, input_ch2 = (
+        np.concatenate([getattr(h, name) for h in header_arrays_list])
+        for name in ("trigger_counter", "clock_counter", "input_ch2_counter")
+    )
+    return unwrap_trigger_counter(triggers), unwrap_counter(clocks), unwrap_counter(input_ch2)
+
+
+def analyze_headers(
+    board_name: str,
+    header_arrays_list: List[HeaderArrays],
+    clock_frequency: float = CLOCK_FREQUENCY_HZ,
+    bin_seconds: float = 1.,
+    gap_threshold: float = 1.,
+) -> Tuple[HeaderSummary, HeaderTimeSeries]:
+    """
+    1ボードぶんのheader (ファイル順) から rate, 抜け, gap などをまとめて計算する
+    counter は32 bitの一周を戻してからつなげる (trigger_counter は unwrap_trigger_counter)
+    """
+    triggers, clocks, input_ch2 = _unwrap_headers(header_arrays_list)
+    n_events = len(triggers)
+    if n_events == 0:
+        empty = np.zeros(0)
+        return (
+            HeaderSummary(board_name, len(header_arrays_list), 0, 0, 0, 0, 0, 0, 0., 0., 0, 0., np.nan, np.nan),
+            HeaderTimeSeries(empty, empty, np.zeros(1), empty, empty),
+        )
+
+    trigger_diffs = np.diff(triggers)
+    intervals = np.diff(clocks) / clock_frequency
+    time = (clocks - clocks[0]) / clock_frequency
+    duration = float(time[-1])
+    is_gap = intervals > gap_threshold
+
+    with np.errstate(divide="ignore"):
+        instantaneous_rate = np.concatenate([[np.nan], 1. / intervals])
+
+    n_bins = max(int(np.ceil(duration / bin_seconds)), 1)
+    bin_edges = np.arange(n_bins + 1) * bin_seconds
+    bin_ids = np.minimum((time // bin_seconds).astype(np.int64), n_bins - 1)
+    trigger_rate = np.bincount(bin_ids, minlength=n_bins) / bin_seconds
+    input_ch2_rate = np.bincount(
+        bin_ids[1:], weights=np.diff(input_ch2).astype(np.float64), minlength=n_bins
+    ) / bin_seconds
+
+    summary = HeaderSummary(
+        board_name=board_name,
+        n_files=len(header_arrays_list),
+        n_events=n_events,
+        first_trigger_counter=int(triggers[0]),
+        last_trigger_counter=int(triggers[-1]),
+        n_missing_triggers=int((trigger_diffs[trigger_diffs > 1] - 1).sum()),
+        n_duplicated_triggers=int((trigger_diffs == 0).sum()),
+        n_trigger_resets=int((trigger_diffs < 0).sum()),
+        duration=duration,
+        livetime=duration - float(intervals[is_gap].sum()),
+        n_gaps=int(is_gap.sum()),
+        max_interval=float(intervals.max()) if len(intervals) else 0.,
+        trigger_rate=(n_events - 1) / duration if duration > 0 else np.nan,
+        input_ch2_rate=float(input_ch2[-1] - input_ch2[0]) / duration if duration > 0 else np.nan,
+    )
+    return summary, HeaderTimeSeries(time, instantaneous_rate, bin_edges, trigger_rate, input_ch2_rate)
+
+
+def analyze_files_by_board(
+    mada_files: List[Path],
+    clock_frequency: float = CLOCK_FREQUENCY_HZ,
+    bin_seconds: float = 1.,
+    gap_threshold: float = 1.,
+) -> Dict[str, Tuple[HeaderSummary, HeaderTimeSeries]]:
+    """
+    GBKB-XX_NNNN.mada をボードごと, ファイル名順にまとめて analyze_headers する
+    """
+    paths_by_board: Dict[str, List[Path]] = {}
+    for mada_file in sorted(mada_files, key=lambda p: p.name):
+        paths_by_board.setdefault(mada_file.name[:7], []).append(mada_file)
+    return {
+        board_name: analyze_headers(
+            board_name,
+            [read_header_arrays(path) for path in paths],
+            clock_frequency,
+            bin_seconds,
+            gap_threshold,
+        )
+        for board_name, paths in paths_by_board.items()
+    }
+
+
+def save_time_series(results: Dict[str, Tuple[HeaderSummary, HeaderTimeSeries]], save_path: Path) -> None:
+    """
+    .npz ならイベントごとの値も含めて全て, .csv なら bin ごとの rate だけを書く
+    """
+    if save_path.suffix == ".npz":
+        arrays: Dict[str, np.ndarray] = {}
+        for board_name, (_, time_series) in results.items():
+            for key, value in asdict(time_series).items():
+                arrays[f"{board_name}/{key}"] = value
+        with open(save_path, "wb") as f:
+            np.savez(f, **arrays)
+        return
+
+    with open(save_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["board_name", "time", "trigger_rate", "input_ch2_rate"])
+        for board_name, (_, time_series) in results.items():
+            for row in zip(time_series.bin_edges[:-1], time_series.trigger_rate, time_series.input_ch2_rate):
+                writer.writerow([board_name, *row])
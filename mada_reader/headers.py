@@ -0,0 +1,175 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from mada_reader import profiling
+from mada_reader.compression import is_compressed
+from mada_reader.parser import HEADER_SIZE
+from mada_reader.stream import (
+    MAGIC,
+    are_frame_boundaries,
+    is_frame_boundary,
+    iter_frame_ranges,
+    iter_payload_chunks,
+    open_mmap,
+)
+
+COUNTER_RANGE = 2 ** 32
+# clock_counter の周波数の既定値 (CLIでは --clock-hz で変えられる)
+CLOCK_FREQUENCY_HZ = 100e6
+# trigger_counter が減ったとき, 前が 2^32 - ROLLOVER_MARGIN 以上で次が ROLLOVER_MARGIN 未満なら一周とみなす
+ROLLOVER_MARGIN = 2 ** 20
+
+
+def unwrap_counter(counter: np.ndarray, previous: Optional[int] = None) -> np.ndarray:
+    """
+    32 bit で一周する counter を int64 の単調な値に直す (隣のイベントとの差は 2^32 未満とする)
+    previous に前の chunk の最後の値 (unwrap済み) を渡すと続きとして計算する
+    """
+    counter = np.asarray(counter, dtype=np.int64)
+    if len(counter) == 0:
+        return counter
+    start = int(counter[0]) if previous is None else previous
+    diffs = np.diff(counter, prepend=start % COUNTER_RANGE) % COUNTER_RANGE
+    return start + np.cumsum(diffs)
+
+
+def unwrap_trigger_counter(counter: np.ndarray, previous: Optional[int] = None) -> np.ndarray:
+    """
+    trigger_counter は隣のイベントとの差が小さいので, 2^32 の近くから 0 の近くに戻ったときだけ一周とみなす
+    それ以外で減ったところ (reset, 順番の入れ替わり) は減ったままにする
+    previous に前の chunk の最後の値 (unwrap済み) を渡すと続きとして計算する
+    """
+    counter = np.asarray(counter, dtype=np.int64)
+    if len(counter) == 0:
+        return counter
+    start = int(counter[0]) if previous is None else previous
+    last = np.concatenate([[start % COUNTER_RANGE], counter[:-1]])
+    is_rollover = (last >= COUNTER_RANGE - ROLLOVER_MARGIN) & (counter < ROLLOVER_MARGIN)
+    return start - start % COUNTER_RANGE + counter + COUNTER_RANGE * np.cumsum(is_rollover)
+
+
+@dataclass
+class HeaderArrays:
+    """
+    全イベントの header の counter を列ごとに持つ
+    """
+    trigger_counter: np.ndarray  # (n_events,) uint32
+    clock_counter: np.ndarray  # (n_events,) uint32
+    input_ch2_counter: np.ndarray  # (n_events,) uint32
+
+    def __len__(self) -> int:
+        return len(self.trigger_counter)
+
+    def as_array(self) -> np.ndarray:
+        """
+        [shape (n_events, 3)]
+        """
+        return np.stack([self.trigger_counter, self.clock_counter, self.input_ch2_counter], axis=1)
+
+    def col_lines(self) -> List[str]:
+        """
+        EventHeader.col() と同じ形式の行
+        """
+        return list(map("{}\t{}\t{}".format, *(a.tolist() for a in self.as_array().T)))
+
+    @classmethod
+    def from_counters(cls, counters: np.ndarray) -> "HeaderArrays":
+        return cls(counters[:, 0].copy(), counters[:, 1].copy(), counters[:, 2].copy())
+
+
+def gather_counters(buffer, offsets: np.ndarray) -> np.ndarray:
+    """
+    uPIC を除いた payload の先頭位置 offsets から counter を3つずつ取り出す
+    [shape (n_events, 3)]
+    """
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+    try:
+        counters = raw[offsets[:, None] + np.arange(4, HEADER_SIZE)]
+    finally:
+        del raw
+    return counters.view(">u4").astype(np.uint32).reshape(len(offsets), 3)
+
+
+def _find_stride(buffer) -> int:
+    """
+    先頭2イベントの間隔. 求まらなければ0
+    """
+    if bytes(buffer[0:len(MAGIC)]) != MAGIC:
+        return 0
+    position = len(MAGIC)
+    while True:
+        position = buffer.find(MAGIC, position)
+        if position < 0:
+            return 0
+        if is_frame_boundary(buffer, position):
+            return position
+        position += 1
+
+
+def _scan_regular_frames(buffer) -> Tuple[int, int]:
+    """
+    先頭から同じ長さで並んでいるイベントの (数, 長さ) を返す (並んでいなければ数は0)
+    各イベントの先頭が is_frame_boundary を満たし, 間に他の境界が無いときだけ並んでいるとみなす
+    (イベントの先頭が壊れて前のイベントにつながっている, 途中で切れたイベントがある, など)
+    """
+    stride = _find_stride(buffer)
+    if stride == 0:
+        return 0, 0
+    n_frames = len(buffer) // stride
+    raw = np.frombuffer(buffer, dtype=np.uint8, count=n_frames * stride).reshape(n_frames, stride)
+    try:
+        is_regular = (raw[:, :len(MAGIC)] == np.frombuffer(MAGIC, dtype=np.uint8)).all()
+    finally:
+        del raw
+    if not is_regular or not are_frame_boundaries(buffer, np.arange(n_frames, dtype=np.int64) * stride).all():
+        return 0, 0
+
+    # stride の間にある uPIC がデータ中のものか確かめる
+    end = n_frames * stride
+    position = buffer.find(MAGIC, len(MAGIC))
+    while 0 <= position < end:
+        if position % stride != 0 and is_frame_boundary(buffer, position):
+            return 0, 0
+        position = buffer.find(MAGIC, position + 1)
+    return n_frames, stride
+
+
+def read_header_arrays(mada_file_path: Path) -> HeaderArrays:
+    """
+    FADCブロックは読まずに header の counter だけを集める
+    イベント長が一定なら固定strideで一度に読み, そうでなければ uPIC を探して境界を決める
+    (parse_headers と同じく, FADCが足りなくても header が読めるイベントは含む)
+    圧縮されたファイルは展開しながら iter_payload_chunks で区切る
+    """
+    if is_compressed(mada_file_path):
+        return _read_header_arrays_decompressed(mada_file_path)
+
+    with open_mmap(mada_file_path) as mm, profiling.stage("header_decode", n_bytes=len(mm)) as s:
+        n_regular, stride = _scan_regular_frames(mm)
+        regular_offsets = np.arange(n_regular, dtype=np.int64) * stride + len(MAGIC)
+
+        # 固定strideで読めなかった残り (末尾の書きかけ, またはファイル全体)
+        ranges = np.array(
+            list(iter_frame_ranges(mm, validate=True, start=n_regular * stride)),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        if n_regular > 0:
+            # 最後の固定長イベントの続き (uPIC から始まっていないもの) は除く
+            ranges = ranges[ranges[:, 0] != n_regular * stride]
+        is_readable = ranges[:, 1] - ranges[:, 0] >= HEADER_SIZE
+        offsets = np.concatenate([regular_offsets, ranges[is_readable, 0]])
+        s.n_events = len(offsets)
+        return HeaderArrays.from_counters(gather_counters(mm, offsets))
+
+
+def _read_header_arrays_decompressed(mada_file_path: Path) -> HeaderArrays:
+    counters = [np.zeros((0, 3), dtype=np.uint32)]
+    for payloads in iter_payload_chunks(mada_file_path):
+        headers = [payload[:HEADER_SIZE] for payload in payloads if len(payload) >= HEADER_SIZE]
+        with profiling.stage("header_decode", n_bytes=len(headers) * HEADER_SIZE, n_events=len(headers)):
+            offsets = np.arange(len(headers), dtype=np.int64) * HEADER_SIZE
+            counters.append(gather_counters(b"".join(headers), offsets))
+    return HeaderArrays.from_counters(np.concatenate(counters))
@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable
+
+import numpy as np
+
+from mada_reader import profiling
+from mada_reader.parser import EventBatch
+
+
+@dataclass(frozen=True)
+class Axis:
+    """
+    ROOT の TAxis (等間隔) と同じbin番号の付け方をする
+    0 が underflow, nbins + 1 が overflow
+    """
+    nbins: int
+    low: float
+    high: float
+
+    def find_bins(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=np.float64)
+        bins = 1 + (self.nbins * (values - self.low) / (self.high - self.low)).astype(np.int64)
+        bins[values < self.low] = 0
+        bins[~(values < self.high)] = self.nbins + 1
+        return bins
+
+
+@lru_cache(maxsize=None)
+def _bin_lookup(axis: Axis, n_values: int) -> np.ndarray:
+    return axis.find_bins(np.arange(n_values))
+
+
+class WaveformHist2D:
+    """
+    gbkb の wf_chN (x: clock, y: adc value) をROOTを使わずに数える
+    counts は ch ごとに ROOT の TH2D と同じ並び (y, x) で under/overflow も含む
+    [shape (4, y.nbins + 2, x.nbins + 2)]
+    """
+
+    def __init__(
+        self,
+        x_axis: Axis = Axis(1024, 0, 1023),
+        y_axis: Axis = Axis(2048, 0, 2047),
+        n_channels: int = 4,
+    ):
+        self.x_axis = x_axis
+        self.y_axis = y_axis
+        self.counts = np.zeros((n_channels, y_axis.nbins + 2, x_axis.nbins + 2), dtype=np.int64)
+        self.entries = np.zeros(n_channels, dtype=np.int64)
+        # TH1::PutStats と同じ並び (sumw, sumw2, sumwx, sumwx2, sumwy, sumwy2, sumwxy)
+        self.stats = np.zeros((n_channels, 7), dtype=np.float64)
+
+    def fill(self, batch: EventBatch) -> None:
+        with profiling.stage("reduction", n_bytes=batch.fadc.nbytes, n_events=len(batch)):
+            self._fill(batch)
+
+    def _fill(self, batch: EventBatch) -> None:
+        n_x = self.counts.shape[2]
+        valid_mask = batch.valid_mask
+        x_lookup = _bin_lookup(self.x_axis, batch.depth)
+        y_lookup = _bin_lookup(self.y_axis, np.iinfo(np.uint16).max + 1)
+        all_clocks = np.broadcast_to(np.arange(batch.depth), (len(batch), batch.depth))
+        for ch in range(self.counts.shape[0]):
+            # デコードできたサンプルだけを取り出して数える
+            clocks = all_clocks[valid_mask[:, ch]]
+            values = batch.fadc[:, ch][valid_mask[:, ch]]
+            if len(values) == 0:
+                continue
+            x_bins = x_lookup[clocks]
+            y_bins = y_lookup[values]
+            flat_bins = y_bins * n_x + x_bins
+            # 埋まっている範囲の大きさだけの bincount を足す
+            low = int(flat_bins.min())
+            occupied = np.bincount(flat_bins - low)
+            self.counts[ch].reshape(-1)[low:low + len(occupied)] += occupied
+            self.entries[ch] += len(values)
+
+            # ROOTと同じく統計量は範囲内のentryだけで計算する (重みは全て1なので整数で足す)
+            in_range = (y_bins > 0) & (y_bins <= self.y_axis.nbins) & (x_bins > 0) & (x_bins <= self.x_axis.nbins)
+            x = clocks[in_range]
+            y = values[in_range].astype(np.int64)
+            n = len(x)
+            self.stats[ch] += [n, n, x.sum(), (x * x).sum(), y.sum(), (y * y).sum(), (x * y).sum()]
+
+    def fill_all(self, batches: Iterable[EventBatch]) -> "WaveformHist2D":
+        for batch in batches:
+            self.fill(batch)
+        return self
+
+    def merge(self, other: "WaveformHist2D") -> None:
+        if (self.x_axis, self.y_axis, self.counts.shape) != (other.x_axis, other.y_axis, other.counts.shape):
+            raise ValueError("histogram binning does not match")
+        self.counts += other.counts
+        self.entries += other.entries
+        self.stats += other.stats
+
+    def contents(self, ch: int, flow: bool = False) -> np.ndarray:
+        """
+        [shape (y.nbins, x.nbins)] (flow=True なら under/overflow込み)
+        """
+        if flow:
+            return self.counts[ch]
+        return self.counts[ch, 1:-1, 1:-1]
+
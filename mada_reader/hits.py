@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+
+# FADCブロックの後ろの uPIC strip のhit部分
+# 1レコード = clock (big-endian uint16) + strip の bitmap (N_STRIPS bit, strip 0 が先頭byteのMSB)
+# 最後の1レコードに満たない端数は捨てる
+N_STRIPS = 128
+HIT_CLOCK_SIZE = 2
+
+
+def hit_record_size(n_strips: int = N_STRIPS) -> int:
+    return HIT_CLOCK_SIZE + n_strips // 8
+
+
+@dataclass
+class HitArrays:
+    """
+    EventBatch 1つぶんのhitを CSR 形式で持つ
+    イベント i のhitは strip[offsets[i]:offsets[i + 1]], clock[offsets[i]:offsets[i + 1]]
+    (レコード順, レコード内では strip 順)
+    """
+    offsets: np.ndarray  # (n_events + 1,) int64
+    strip: np.ndarray  # (n_hits,) uint16
+    clock: np.ndarray  # (n_hits,) uint16
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def n_hits(self) -> np.ndarray:
+        """
+        (n_events,) のイベントごとのhit数
+        """
+        return np.diff(self.offsets)
+
+    def event(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        begin, end = self.offsets[i], self.offsets[i + 1]
+        return self.strip[begin:end], self.clock[begin:end]
+
+    def take(self, index) -> "HitArrays":
+        """
+        EventBatch[index] と同じイベントを取り出す (slice, bool mask, index配列)
+        """
+        event_ids = np.arange(len(self))[index]
+        n_hits = self.n_hits[event_ids]
+        offsets = np.zeros(len(event_ids) + 1, dtype=np.int64)
+        np.cumsum(n_hits, out=offsets[1:])
+        # 各hitが元の配列のどこにあるか
+        hit_ids = np.repeat(self.offsets[event_ids] - offsets[:-1], n_hits) + np.arange(offsets[-1])
+        return HitArrays(offsets, self.strip[hit_ids], self.clock[hit_ids])
+
+    @classmethod
+    def empty(cls, n_events: int = 0) -> "HitArrays":
+        return cls(
+            np.zeros(n_events + 1, dtype=np.int64),
+            np.zeros(0, dtype=np.uint16),
+            np.zeros(0, dtype=np.uint16),
+        )
+
+    @classmethod
+    def concatenate(cls, hit_arrays_list: List["HitArrays"]) -> "HitArrays":
+        if len(hit_arrays_list) == 0:
+            return cls.empty()
+        n_hits = np.concatenate([h.n_hits for h in hit_arrays_list])
+        offsets = np.zeros(len(n_hits) + 1, dtype=np.int64)
+        np.cumsum(n_hits, out=offsets[1:])
+        return cls(
+            offsets,
+            np.concatenate([h.strip for h in hit_arrays_list]),
+            np.concatenate([h.clock for h in hit_arrays_list]),
+        )
+
+
+def decode_hits(hit_blocks: List[bytes], n_strips: int = N_STRIPS) -> HitArrays:
+    """
+    イベントごとのhit部分のbyte列をまとめてデコードする
+    0でないbyteだけを bit に展開するので, 途中のメモリもhit数ぶんしか使わない
+    """
+    record_size = hit_record_size(n_strips)
+    n_records = np.array([len(b) // record_size for b in hit_blocks], dtype=np.int64)
+    if n_records.sum() == 0:
+        return HitArrays.empty(len(hit_blocks))
+
+    records = np.frombuffer(
+        b"".join(b[:n * record_size] for b, n in zip(hit_blocks, n_records)),
+        dtype=np.uint8
+    ).reshape(-1, record_size)
+    record_clocks = records[:, :HIT_CLOCK_SIZE].copy().view(">u2").astype(np.uint16)[:, 0]
+    bitmaps = records[:, HIT_CLOCK_SIZE:]
+
+    record_ids, byte_ids = np.nonzero(bitmaps)
+    bits = np.unpackbits(bitmaps[record_ids, byte_ids][:, None], axis=1)
+    hit_byte_ids, bit_ids = np.nonzero(bits)
+    record_ids = record_ids[hit_byte_ids]
+
+    event_of_record = np.repeat(np.arange(len(hit_blocks)), n_records)
+    offsets = np.zeros(len(hit_blocks) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(event_of_record[record_ids], minlength=len(hit_blocks)), out=offsets[1:])
+
+    return HitArrays(
+        offsets,
+        (byte_ids[hit_byte_ids] * 8 + bit_ids).astype(np.uint16),
+        record_clocks[record_ids],
+    )
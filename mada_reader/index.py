@@ -0,0 +1,204 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+
+from mada_reader import profiling
+from mada_reader.compression import is_compressed
+from mada_reader.parser import HEADER_SIZE, Event, EventBatch, fadc_block_size, parse_batch
+from mada_reader.headers import gather_counters
+from mada_reader.stream import iter_frame_ranges, open_mmap
+
+INDEX_SUFFIX = ".madaidx"
+INDEX_VERSION = 1
+
+
+@dataclass
+class EventIndex:
+    """
+    .mada 中の各イベントの位置とheaderのcounter
+    offsets/lengths は uPIC を除いた payload の範囲 (read_file の各要素に対応)
+    parse_events で捨てられる短いイベントは含まず, n_skipped に数だけ残す
+    """
+    offsets: np.ndarray  # (n_events,) int64
+    lengths: np.ndarray  # (n_events,) int64
+    trigger_counter: np.ndarray  # (n_events,) uint32
+    clock_counter: np.ndarray  # (n_events,) uint32
+    input_ch2_counter: np.ndarray  # (n_events,) uint32
+    n_skipped: int
+    file_size: int
+    file_mtime_ns: int
+    flush_adc_clock_depth: int = 1024
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def is_up_to_date(self, mada_file_path: Path) -> bool:
+        stat = os.stat(mada_file_path)
+        return stat.st_size == self.file_size and stat.st_mtime_ns == self.file_mtime_ns
+
+
+def index_path(mada_file_path: Path) -> Path:
+    """
+    /hoge/GBKB-13_0000.mada -> /hoge/GBKB-13_0000.mada.madaidx
+    """
+    mada_file_path = Path(mada_file_path)
+    return mada_file_path.with_name(mada_file_path.name + INDEX_SUFFIX)
+
+
+def build_index(mada_file_path: Path, flush_adc_clock_depth: int = 1024) -> EventIndex:
+    """
+    ファイルを1回走査して EventIndex を作る (境界は iter_frame_ranges(validate=True) で確認する)
+    圧縮されたファイルの中の位置は使えないので ValueError
+    """
+    if is_compressed(mada_file_path):
+        raise ValueError(f"{mada_file_path}: compressed .mada can not be indexed (decompress it first)")
+    stat = os.stat(mada_file_path)
+    event_size = HEADER_SIZE + fadc_block_size(flush_adc_clock_depth)
+    with open_mmap(mada_file_path) as mm, profiling.stage("index", n_bytes=len(mm)) as s:
+        ranges = np.array(list(iter_frame_ranges(mm, validate=True)), dtype=np.int64).reshape(-1, 2)
+        offsets = ranges[:, 0]
+        lengths = ranges[:, 1] - ranges[:, 0]
+        is_complete = lengths >= event_size
+        offsets, lengths = offsets[is_complete], lengths[is_complete]
+        s.n_events = len(offsets)
+
+        counters = gather_counters(mm, offsets)
+    return EventIndex(
+        offsets,
+        lengths,
+        counters[:, 0].copy(),
+        counters[:, 1].copy(),
+        counters[:, 2].copy(),
+        n_skipped=int((~is_complete).sum()),
+        file_size=stat.st_size,
+        file_mtime_ns=stat.st_mtime_ns,
+        flush_adc_clock_depth=flush_adc_clock_depth,
+    )
+
+
+def save_index(index: EventIndex, mada_file_path: Path) -> None:
+    """
+    一時ファイルに書いてからrenameするので, 途中で落ちても壊れたsidecarは残らない
+    """
+    target = index_path(mada_file_path)
+    tmp = target.with_name(target.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            meta=np.array([
+                INDEX_VERSION, index.n_skipped, index.file_size,
+                index.file_mtime_ns, index.flush_adc_clock_depth
+            ], dtype=np.int64),
+            offsets=index.offsets,
+            lengths=index.lengths,
+            trigger_counter=index.trigger_counter,
+            clock_counter=index.clock_counter,
+            input_ch2_counter=index.input_ch2_counter,
+        )
+    os.replace(tmp, target)
+
+
+def load_index(mada_file_path: Path, flush_adc_clock_depth: int = 1024) -> Optional[EventIndex]:
+    """
+    sidecarが無い, 壊れている, 元ファイルのsizeかmtimeが変わっている場合はNone
+    """
+    try:
+        with np.load(index_path(mada_file_path)) as npz:
+            version, n_skipped, file_size, file_mtime_ns, depth = npz["meta"].tolist()
+            if version != INDEX_VERSION or depth != flush_adc_clock_depth:
+                return None
+            index = EventIndex(
+                npz["offsets"],
+                npz["lengths"],
+                npz["trigger_counter"],
+                npz["clock_counter"],
+                npz["input_ch2_counter"],
+                n_skipped=n_skipped,
+                file_size=file_size,
+                file_mtime_ns=file_mtime_ns,
+                flush_adc_clock_depth=depth,
+            )
+    except (OSError, KeyError, ValueError):
+        return None
+    if not index.is_up_to_date(mada_file_path):
+        return None
+    return index
+
+
+def get_index(mada_file_path: Path, flush_adc_clock_depth: int = 1024, save: bool = True) -> EventIndex:
+    """
+    sidecarがあればそれを使い, 無ければ作って保存する
+    (書き込めないディレクトリでは保存せずに返す)
+    """
+    index = load_index(mada_file_path, flush_adc_clock_depth)
+    if index is not None:
+        return index
+    index = build_index(mada_file_path, flush_adc_clock_depth)
+    if save:
+        try:
+            save_index(index, mada_file_path)
+        except OSError:
+            pass
+    return index
+
+
+def parse_event_ids(specs: List[str]) -> List[int]:
+    """
+    ["12", "3,5,7", "10-20"] -> [12, 3, 5, 7, 10, 11, ..., 20]
+    "A-B" は B も含む
+    """
+    event_ids: List[int] = []
+    for spec in specs:
+        for item in filter(None, spec.split(",")):
+            first, sep, last = item.partition("-")
+            try:
+                if sep:
+                    event_ids.extend(range(int(first), int(last) + 1))
+                else:
+                    event_ids.append(int(first))
+            except ValueError:
+                raise ValueError(f"invalid event id: {item!r}") from None
+    return event_ids
+
+
+class MadaFile:
+    """
+    EventIndex を使って .mada の任意のイベントだけを読む
+    mada[i] -> Event, mada[i:j] -> EventBatch
+    番号は parse_from_mada_file の戻り値のリストと同じ
+    """
+
+    def __init__(self, mada_file_path: Path, flush_adc_clock_depth: int = 1024, index: Optional[EventIndex] = None):
+        self.path = Path(mada_file_path)
+        self.flush_adc_clock_depth = flush_adc_clock_depth
+        self.index = index if index is not None else get_index(self.path, flush_adc_clock_depth)
+        self._file = open(self.path, "rb")
+
+    def __enter__(self) -> "MadaFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[Event, EventBatch]:
+        if isinstance(key, slice):
+            return self.batch(range(len(self))[key])
+        if not -len(self) <= key < len(self):
+            raise IndexError(f"event {key} out of range ({len(self)} events)")
+        return self.batch([key % len(self)]).event(0)
+
+    def read_payload(self, event_id: int) -> bytes:
+        self._file.seek(int(self.index.offsets[event_id]))
+        return self._file.read(int(self.index.lengths[event_id]))
+
+    def batch(self, event_ids: Union[range, List[int]]) -> EventBatch:
+        return parse_batch([self.read_payload(i) for i in event_ids], self.flush_adc_clock_depth)
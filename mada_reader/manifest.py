@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+MANIFEST_NAME = ".mada_reader_manifest.json"
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 16 * 1024 ** 2
+
+
+def file_sha256(file_path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+@dataclass(frozen=True)
+class SourceFingerprint:
+    size: int
+    mtime_ns: int
+    sha256: str
+
+    @classmethod
+    def of(cls, file_path: Path) -> "SourceFingerprint":
+        # hash を取っている間に書き換わっても, stat は先に取るので次回は mtime の違いで気付ける
+        stat = os.stat(file_path)
+        return cls(stat.st_size, stat.st_mtime_ns, file_sha256(file_path))
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    source: str  # manifest と同じディレクトリの .mada のファイル名
+    size: int
+    mtime_ns: int
+    sha256: str
+    converter: str
+    output: str
+    output_size: int
+
+
+class ConversionManifest:
+    """
+    変換済みの .mada と, そのときの元ファイルの size, mtime, sha256, 変換器のversion, 出力先を記録する
+    converter が違うエントリは無いものとして扱う
+    """
+
+    def __init__(self, manifest_path: Path, converter: str, entries: Optional[Dict[str, ManifestEntry]] = None):
+        self.manifest_path = manifest_path
+        self.converter = converter
+        self.entries: Dict[str, ManifestEntry] = entries or {}
+
+    @classmethod
+    def load(cls, manifest_path: Path, converter: str) -> "ConversionManifest":
+        """
+        無い, または読めない manifest は空として扱う (全ファイルを変換し直す)
+        """
+        try:
+            content = json.loads(manifest_path.read_text())
+            if content["version"] != MANIFEST_VERSION:
+                return cls(manifest_path, converter)
+            entries = {entry["source"]: ManifestEntry(**entry) for entry in content["entries"]}
+        except (OSError, ValueError, KeyError, TypeError):
+            return cls(manifest_path, converter)
+        return cls(manifest_path, converter, entries)
+
+    def is_up_to_date(self, mada_file_path: Path, output_path: Path) -> bool:
+        """
+        出力があり, 元ファイルが前回の変換から変わっていなければ True
+        size が同じで mtime だけ違う (touch された) ときは hash で比べる
+        """
+        entry = self.entries.get(mada_file_path.name)
+        if entry is None or entry.converter != self.converter or entry.output != str(output_path):
+            return False
+        try:
+            source_stat = os.stat(mada_file_path)
+            output_stat = os.stat(output_path)
+        except OSError:
+            return False
+        if output_stat.st_size != entry.output_size or source_stat.st_size != entry.size:
+            return False
+        return source_stat.st_mtime_ns == entry.mtime_ns or file_sha256(mada_file_path) == entry.sha256
+
+    def record(self, mada_file_path: Path, fingerprint: SourceFingerprint, output_path: Path) -> None:
+        self.entries[mada_file_path.name] = ManifestEntry(
+            source=mada_file_path.name,
+            size=fingerprint.size,
+            mtime_ns=fingerprint.mtime_ns,
+            sha256=fingerprint.sha256,
+            converter=self.converter,
+            output=str(output_path),
+            output_size=os.stat(output_path).st_size,
+        )
+
+    def save(self) -> None:
+        """
+        一時ファイルに書いてからrenameする
+        """
+        tmp = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        tmp.write_text(json.dumps({
+            "version": MANIFEST_VERSION,
+            "entries": [asdict(entry) for entry in self.entries.values()],
+        }, indent=2))
+        os.replace(tmp, self.manifest_path)
@@ -1,14 +1,19 @@
 import struct
-import sys
-from dataclasses import dataclass, field
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
 
-import bitstruct
+import numpy as np
+
+from mada_reader import profiling
+from mada_reader.hits import N_STRIPS, HitArrays, decode_hits
 
 
 @dataclass(frozen=True)
 class EventHeader:
+    __slots__ = ("trigger_counter", "clock_counter", "input_ch2_counter")
+
     trigger_counter: int
     clock_counter: int
     input_ch2_counter: int
@@ -16,10 +21,27 @@ class EventHeader:
     def col(self) -> str:
         return f"{self.trigger_counter}\t{self.clock_counter}\t{self.input_ch2_counter}"
 
+    # frozen + __slots__ はそのままだとpickleから戻せない (setattrが禁止されている) ので
+    def __getstate__(self) -> Tuple[int, int, int]:
+        return self.trigger_counter, self.clock_counter, self.input_ch2_counter
+
+    def __setstate__(self, state: Tuple[int, int, int]) -> None:
+        for name, value in zip(self.__slots__, state):
+            object.__setattr__(self, name, value)
+
+
+HEADER_SIZE = 16  # 4 byte + counter (4 byte x 3)
+
 
 def read_file(file_path: Path) -> List[bytes]:
-    binaries = open(file_path, "rb").read().split(b"uPIC")
-    return list(filter(lambda x: x != b'', binaries))
+    with profiling.stage("read") as s:
+        with open(file_path, "rb") as f:
+            data = f.read()
+        s.n_bytes = len(data)
+    with profiling.stage("split", n_bytes=len(data)) as s:
+        binaries = list(filter(lambda x: x != b'', data.split(b"uPIC")))
+        s.n_events = len(binaries)
+    return binaries
 
 
 def parse_headers(events: List[bytes]) -> List[EventHeader]:
@@ -38,77 +60,176 @@ def parse_header(event: bytes) -> Optional[Tuple[EventHeader, bytes]]:
         trigger_counter, clock_counter, input_ch2_counter = struct.unpack("!III", event[4:16])
         ret_event = EventHeader(trigger_counter, clock_counter, input_ch2_counter)
         return ret_event, event[16:]
-    except struct.error as e:
-        print(e, file=sys.stderr)
+    except struct.error:
+        profiling.count("header_too_short")
         return None
 
 
-@dataclass
 class FlushADC:
-    ch0: List[int] = field(default_factory=list)
-    ch1: List[int] = field(default_factory=list)
-    ch2: List[int] = field(default_factory=list)
-    ch3: List[int] = field(default_factory=list)
-
-    def __iter__(self):
-        self.__current_ch = 0
-        return self
-
-    def __next__(self) -> List[int]:
-        self.__current_ch += 1
-
-        if self.__current_ch == 1:
-            return self.ch0
-        elif self.__current_ch == 2:
-            return self.ch1
-        elif self.__current_ch == 3:
-            return self.ch2
-        elif self.__current_ch == 4:
-            return self.ch3
-        else:
-            raise StopIteration
+    """
+    1イベントの4chぶんのFADC波形
+    (4, depth) の uint16 配列 (EventBatch.fadc[i] のviewでもよい) と ch ごとの有効サンプル数を持つ
+    ch0-ch3 はそれぞれ有効なところまでの view
+    """
+    __slots__ = ("data", "lengths")
+    __hash__ = None
+
+    def __init__(
+        self,
+        ch0: Sequence[int] = (),
+        ch1: Sequence[int] = (),
+        ch2: Sequence[int] = (),
+        ch3: Sequence[int] = (),
+    ):
+        channels = (ch0, ch1, ch2, ch3)
+        self.lengths = tuple(len(ch) for ch in channels)
+        self.data = np.zeros((len(channels), max(self.lengths)), dtype=np.uint16)
+        for data_ch, ch, length in zip(self.data, channels, self.lengths):
+            data_ch[:length] = ch
+
+    @classmethod
+    def from_array(cls, data: np.ndarray, lengths: Optional[Sequence[int]] = None) -> "FlushADC":
+        """
+        (4, depth) の配列をコピーせずに使う
+        """
+        flush_adc = cls.__new__(cls)
+        flush_adc.data = data
+        flush_adc.lengths = tuple(map(int, lengths)) if lengths is not None else (data.shape[1],) * len(data)
+        return flush_adc
+
+    @property
+    def ch0(self) -> np.ndarray:
+        return self.data[0, :self.lengths[0]]
+
+    @property
+    def ch1(self) -> np.ndarray:
+        return self.data[1, :self.lengths[1]]
+
+    @property
+    def ch2(self) -> np.ndarray:
+        return self.data[2, :self.lengths[2]]
+
+    @property
+    def ch3(self) -> np.ndarray:
+        return self.data[3, :self.lengths[3]]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        return (self.data[ch, :length] for ch, length in enumerate(self.lengths))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, FlushADC):
+            return NotImplemented
+        return self.lengths == other.lengths and all(map(np.array_equal, self, other))
+
+    def __repr__(self) -> str:
+        return f"FlushADC(lengths={self.lengths})"
+
+
+FADC_CHANNEL_IDS = (4, 5, 6, 7)
+FADC_CHANNEL_ID_SHIFT = 12  # u4 (channel id) u2 (padding) u10 (adc value)
+FADC_ADC_VALUE_MASK = 0x3FF
+
+
+def fadc_block_size(flush_adc_clock_depth: int = 1024) -> int:
+    """
+    FADCブロックのbyte数 (16 bit x 4ch x depth)
+    """
+    return 2 * len(FADC_CHANNEL_IDS) * flush_adc_clock_depth
+
+
+@lru_cache(maxsize=None)
+def _fadc_channel_id_pattern(n_words: int) -> np.ndarray:
+    return np.resize(np.array(FADC_CHANNEL_IDS, dtype=np.uint16), n_words)
+
+
+def decode_flush_adc(
+    fadc_block: bytes,
+    flush_adc_clock_depth: int = 1024
+) -> Optional[List[np.ndarray]]:
+    """
+    FADCブロックをbig-endianのuint16としてまとめて読み, ch0-ch3の波形に分ける
+    channel idが4-7以外のwordが出てきたらそこで打ち切る (bitstruct版と同じ挙動)
+    ブロックが短すぎる場合はNone
+    """
+    n_words = len(FADC_CHANNEL_IDS) * flush_adc_clock_depth
+    if len(fadc_block) < 2 * n_words:
+        return None
+
+    words = np.frombuffer(fadc_block, dtype=">u2", count=n_words)
+    channel_ids = words >> FADC_CHANNEL_ID_SHIFT
+    adc_values = words & FADC_ADC_VALUE_MASK
+
+    # 通常は 4, 5, 6, 7, 4, 5, ... の順に並んでいるので reshape するだけでよい
+    if np.array_equal(channel_ids, _fadc_channel_id_pattern(n_words)):
+        return list(adc_values.reshape(flush_adc_clock_depth, len(FADC_CHANNEL_IDS)).T)
+
+    profiling.count("fadc_irregular")
+    return _split_irregular_channels(channel_ids, adc_values)
+
+
+def _split_irregular_channels(channel_ids: np.ndarray, adc_values: np.ndarray) -> List[np.ndarray]:
+    is_unexpected = (channel_ids < FADC_CHANNEL_IDS[0]) | (channel_ids > FADC_CHANNEL_IDS[-1])
+    n_valid = int(np.argmax(is_unexpected)) if is_unexpected.any() else len(channel_ids)
+    channel_ids = channel_ids[:n_valid]
+    adc_values = adc_values[:n_valid]
+    return [adc_values[channel_ids == channel_id] for channel_id in FADC_CHANNEL_IDS]
+
+
+def decode_flush_adc_batch(
+    fadc_words: np.ndarray,
+    flush_adc_clock_depth: int = 1024
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (n_events, 4 * depth) のFADC wordをまとめてデコードする
+    (n_events, 4, depth) の波形と (n_events, 4) の有効サンプル数を返す
+    channel idが崩れているイベントだけ1イベントずつ decode_flush_adc と同じ処理をする
+    (depthを超えたぶんは捨てる)
+    """
+    n_events = len(fadc_words)
+    n_channels = len(FADC_CHANNEL_IDS)
+    channel_ids = fadc_words >> FADC_CHANNEL_ID_SHIFT
+    adc_values = fadc_words & FADC_ADC_VALUE_MASK
+
+    waveforms = np.zeros((n_events, n_channels, flush_adc_clock_depth), dtype=np.uint16)
+    lengths = np.zeros((n_events, n_channels), dtype=np.int32)
+
+    is_regular = (channel_ids == _fadc_channel_id_pattern(n_channels * flush_adc_clock_depth)).all(axis=1)
+    waveforms[is_regular] = adc_values[is_regular] \
+        .reshape(-1, flush_adc_clock_depth, n_channels).transpose(0, 2, 1)
+    lengths[is_regular] = flush_adc_clock_depth
+
+    irregular_events = np.flatnonzero(~is_regular)
+    if len(irregular_events) > 0:
+        profiling.count("fadc_irregular", len(irregular_events))
+    for i_event in irregular_events:
+        channels = _split_irregular_channels(channel_ids[i_event], adc_values[i_event])
+        for ch, values in enumerate(channels):
+            values = values[:flush_adc_clock_depth]
+            waveforms[i_event, ch, :len(values)] = values
+            lengths[i_event, ch] = len(values)
+
+    return waveforms, lengths
 
 
 def parse_flush_adc(
     event: bytes,
     flush_adc_clock_depth: int = 1024
 ) -> Optional[Tuple[FlushADC, bytes]]:
-    flush_adc = FlushADC()
-    event_reading_bytes = 2 * 4 * flush_adc_clock_depth
+    event_reading_bytes = fadc_block_size(flush_adc_clock_depth)
 
-    try:
-        fadc_unpacked = bitstruct.unpack(
-            "u4u2u10"*4*flush_adc_clock_depth,
-            event[0:event_reading_bytes]
-        )
-    except bitstruct.Error as e:
-        print(e, file=sys.stderr)
+    channels = decode_flush_adc(event[0:event_reading_bytes], flush_adc_clock_depth)
+    if channels is None:
+        profiling.count("fadc_too_short")
         return None
 
-    for i_iter in range(0, len(fadc_unpacked), 3):
-        # channel_id = fadc_unpacked[i_iter]
-        # adc_value = fadc_unpacked[i_iter + 2]
-        channel_id, padding, adc_value = fadc_unpacked[i_iter:i_iter+3]
-
-        if channel_id == 4:
-            flush_adc.ch0.append(adc_value)
-        elif channel_id == 5:
-            flush_adc.ch1.append(adc_value)
-        elif channel_id == 6:
-            flush_adc.ch2.append(adc_value)
-        elif channel_id == 7:
-            flush_adc.ch3.append(adc_value)
-        else:
-            # raise ValueError(
-            #     f"FADC parse Error: i_iter: {i_iter}, channel_id: {channel_id}, padding: {padding}, adc_value: {adc_value}"
-            # )
-            break
-
+    flush_adc = FlushADC(*channels)
     return flush_adc, event[event_reading_bytes:]
 
 
 @dataclass
 class Event:
+    __slots__ = ("header", "fadc")
+
     header: EventHeader
     fadc: FlushADC
 
@@ -116,12 +237,14 @@ class Event:
 def parse_events(bytes_list: List[bytes]) -> List[Event]:
     events: List[Event] = []
     for b in bytes_list:
-        ret_parse_header = parse_header(b)
+        with profiling.stage("header_decode", n_bytes=HEADER_SIZE, n_events=1):
+            ret_parse_header = parse_header(b)
         if not ret_parse_header:
             continue
         header, remain_b = ret_parse_header
 
-        ret_parse_flush_adc = parse_flush_adc(remain_b)
+        with profiling.stage("fadc_decode", n_bytes=fadc_block_size(), n_events=1):
+            ret_parse_flush_adc = parse_flush_adc(remain_b)
         if not ret_parse_flush_adc:
             continue
         fadc, remain_b = ret_parse_flush_adc
@@ -131,5 +254,185 @@ def parse_events(bytes_list: List[bytes]) -> List[Event]:
     return events
 
 
-def parse_from_mada_file(mada_file_path: Path) -> List[Event]:
-    return parse_events(read_file(mada_file_path))
+@dataclass
+class EventBatch:
+    """
+    複数イベントを列ごとにまとめたもの
+    fadc は (n_events, 4, depth) で, fadc_lengths[i, ch] より後ろは途中で切れたイベントの0埋め
+    hits は with_hits=True でparseしたときだけ入る
+    """
+    trigger_counter: np.ndarray  # (n_events,) uint32
+    clock_counter: np.ndarray  # (n_events,) uint32
+    input_ch2_counter: np.ndarray  # (n_events,) uint32
+    fadc: np.ndarray  # (n_events, 4, depth) uint16
+    fadc_lengths: np.ndarray  # (n_events, 4) int32
+    hits: Optional[HitArrays] = None
+
+    def __len__(self) -> int:
+        return len(self.trigger_counter)
+
+    def __getitem__(self, index) -> Union[Event, "EventBatch"]:
+        if isinstance(index, (int, np.integer)):
+            return self.event(int(index))
+        return EventBatch(
+            self.trigger_counter[index],
+            self.clock_counter[index],
+            self.input_ch2_counter[index],
+            self.fadc[index],
+            self.fadc_lengths[index],
+            None if self.hits is None else self.hits.take(index),
+        )
+
+    @property
+    def depth(self) -> int:
+        return self.fadc.shape[2]
+
+    @property
+    def valid_mask(self) -> np.ndarray:
+        """
+        (n_events, 4, depth) の bool. 実際にデコードできたサンプルだけ True
+        """
+        return np.arange(self.depth) < self.fadc_lengths[:, :, None]
+
+    @property
+    def is_complete(self) -> np.ndarray:
+        """
+        (n_events,) の bool. 4chとも depth ぶん揃っているイベントだけ True
+        """
+        return (self.fadc_lengths == self.depth).all(axis=1)
+
+    def event(self, i: int) -> Event:
+        header = EventHeader(
+            int(self.trigger_counter[i]),
+            int(self.clock_counter[i]),
+            int(self.input_ch2_counter[i]),
+        )
+        return Event(header, FlushADC.from_array(self.fadc[i], self.fadc_lengths[i]))
+
+    def events(self) -> List[Event]:
+        return [self.event(i) for i in range(len(self))]
+
+    def copy(self) -> "EventBatch":
+        """
+        書き換えられる (読み取り専用でない) 配列を持つコピー
+        """
+        return EventBatch.concatenate([self], self.depth)
+
+    @classmethod
+    def empty(cls, flush_adc_clock_depth: int = 1024) -> "EventBatch":
+        return cls(
+            np.zeros(0, dtype=np.uint32),
+            np.zeros(0, dtype=np.uint32),
+            np.zeros(0, dtype=np.uint32),
+            np.zeros((0, len(FADC_CHANNEL_IDS), flush_adc_clock_depth), dtype=np.uint16),
+            np.zeros((0, len(FADC_CHANNEL_IDS)), dtype=np.int32),
+        )
+
+    @classmethod
+    def concatenate(cls, batches: List["EventBatch"], flush_adc_clock_depth: int = 1024) -> "EventBatch":
+        if len(batches) == 0:
+            return cls.empty(flush_adc_clock_depth)
+        hits = None
+        if all(b.hits is not None for b in batches):
+            hits = HitArrays.concatenate([b.hits for b in batches])
+        return cls(
+            np.concatenate([b.trigger_counter for b in batches]),
+            np.concatenate([b.clock_counter for b in batches]),
+            np.concatenate([b.input_ch2_counter for b in batches]),
+            np.concatenate([b.fadc for b in batches]),
+            np.concatenate([b.fadc_lengths for b in batches]),
+            hits,
+        )
+
+
+# 前のイベントにつながったイベントとみなす FADCブロックの, channel id が 4-7 でない word の数の上限
+MAX_MERGED_FRAME_BAD_WORDS = 8
+
+
+def _cut_merged_frame(hit_block: bytes, flush_adc_clock_depth: int) -> bytes:
+    """
+    先頭のFADC wordが壊れたイベントは境界とみなされず, 前のイベントのhit部分につながってしまう
+    hit部分の中に header と (ほぼ) 正しいFADCブロックがまるごと続く uPIC があれば, hit部分はその手前までにする
+    hit中にたまたま現れた uPIC ではFADCブロックが続かないので切らない
+    """
+    hit_block = bytes(hit_block)
+    n_words = fadc_block_size(flush_adc_clock_depth) // 2
+    frame_size = 4 + HEADER_SIZE + 2 * n_words
+    position = hit_block.find(b"uPIC")
+    while 0 <= position <= len(hit_block) - frame_size:
+        words = np.frombuffer(hit_block, dtype=">u2", count=n_words, offset=position + 4 + HEADER_SIZE)
+        channel_ids = words >> FADC_CHANNEL_ID_SHIFT
+        is_bad = (channel_ids < FADC_CHANNEL_IDS[0]) | (channel_ids > FADC_CHANNEL_IDS[-1])
+        if is_bad.sum() <= MAX_MERGED_FRAME_BAD_WORDS:
+            profiling.count("merged_frame")
+            return hit_block[:position]
+        position = hit_block.find(b"uPIC", position + 1)
+    return hit_block
+
+
+def parse_batch(
+    bytes_list: List[bytes],
+    flush_adc_clock_depth: int = 1024,
+    with_hits: bool = False,
+    n_strips: int = N_STRIPS,
+) -> EventBatch:
+    """
+    parse_events と同じイベントを EventBatch としてまとめてparseする
+    (headerかFADCブロックが足りないイベントは捨てる)
+    with_hits=True ならFADCブロックの後ろのhit部分も hits.decode_hits でデコードする
+    """
+    event_size = HEADER_SIZE + fadc_block_size(flush_adc_clock_depth)
+    complete_events = [b for b in bytes_list if len(b) >= event_size]
+    if len(complete_events) < len(bytes_list):
+        n_header_too_short = sum(len(b) < HEADER_SIZE for b in bytes_list)
+        profiling.count("header_too_short", n_header_too_short)
+        profiling.count("fadc_too_short", len(bytes_list) - len(complete_events) - n_header_too_short)
+    if len(complete_events) == 0:
+        batch = EventBatch.empty(flush_adc_clock_depth)
+        if with_hits:
+            batch.hits = HitArrays.empty()
+        return batch
+
+    n_events = len(complete_events)
+    raw = np.frombuffer(
+        b"".join(b[:event_size] for b in complete_events),
+        dtype=np.uint8
+    ).reshape(n_events, event_size)
+    with profiling.stage("header_decode", n_bytes=n_events * HEADER_SIZE, n_events=n_events):
+        counters = raw[:, 4:HEADER_SIZE].copy().view(">u4").astype(np.uint32)
+    with profiling.stage("fadc_decode", n_bytes=raw.nbytes - n_events * HEADER_SIZE, n_events=n_events):
+        fadc_words = raw[:, HEADER_SIZE:].copy().view(">u2").astype(np.uint16)
+        waveforms, lengths = decode_flush_adc_batch(fadc_words, flush_adc_clock_depth)
+    hits = None
+    if with_hits:
+        hit_blocks = [_cut_merged_frame(b[event_size:], flush_adc_clock_depth) for b in complete_events]
+        with profiling.stage("hit_decode", n_bytes=sum(map(len, hit_blocks)), n_events=n_events):
+            hits = decode_hits(hit_blocks, n_strips)
+
+    return EventBatch(
+        counters[:, 0].copy(),
+        counters[:, 1].copy(),
+        counters[:, 2].copy(),
+        waveforms,
+        lengths,
+        hits,
+    )
+
+
+def parse_from_mada_file(
+    mada_file_path: Path,
+    as_batch: bool = False,
+    use_cache: bool = True,
+    copy: bool = True,
+) -> Union[List[Event], EventBatch]:
+    """
+    stream.iter_events と同じく境界を確認して区切ったイベントを返す
+    use_cache=True のときは cache.get_cache() に残っているデコード結果を使う
+    copy=False ならキャッシュと配列を共有するので (Event の FlushADC も) 読み取り専用になる
+    """
+    # cache は stream 経由でこのモジュールを import しているのでここで import する
+    from mada_reader.cache import load_cached
+    batch = load_cached(mada_file_path, use_cache=use_cache)
+    if use_cache and copy:
+        batch = batch.copy()
+    return batch if as_batch else batch.events()
@@ -0,0 +1,185 @@
+"""
+ファイルの読み込みを別スレッドで先に進めておき, その間にメインスレッドで decode, reduction をする
+(read は GIL を離すので, 読み込みと計算が重なって全体の時間が max(I/O, CPU) に近づく)
+"""
+import itertools
+import queue
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple, TypeVar
+
+from mada_reader import profiling
+from mada_reader.compression import open_mada
+from mada_reader.files import scan_mada_files_from_path
+from mada_reader.parser import EventBatch, parse_batch
+from mada_reader.stream import FrameAssembler
+
+T = TypeVar("T")
+
+_DONE = object()
+# 止めるように言われていないか確認する間隔 [s]
+_PUT_TIMEOUT = 0.1
+
+
+@dataclass(frozen=True)
+class PrefetchConfig:
+    queue_depth: int = 4  # 先に読んで溜めておく buffer の数 (0 なら先読みしない)
+    buffer_size: int = 8 * 1024 ** 2  # 1回に read する byte 数
+
+    @property
+    def max_buffered_bytes(self) -> int:
+        # queue に入っている分と, 読み込み中の1つ
+        return (self.queue_depth + 1) * self.buffer_size
+
+
+class _Failure:
+    __slots__ = ("exception",)
+
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+def prefetch(items: Iterable[T], queue_depth: int) -> Iterator[T]:
+    """
+    items を別スレッドで進めて, 最大 queue_depth 個まで溜めながら順に返す
+    items 側の例外はここで投げ直す. 途中でやめても (break, close) 読み込みスレッドは止まる
+    queue_depth <= 0 なら別スレッドは使わない
+    """
+    if queue_depth <= 0:
+        yield from items
+        return
+
+    buffered: "queue.Queue[object]" = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+
+    def put(item: object) -> bool:
+        while not stop.is_set():
+            try:
+                buffered.put(item, timeout=_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    thread = threading.Thread(target=produce, name="mada-reader-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffered.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.exception
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def iter_file_chunks(mada_file_paths: Iterable[Path], buffer_size: int) -> Iterator[Tuple[Path, bytes]]:
+    """
+    ファイルを順に buffer_size byte ずつ読んで返す. 各ファイルの最後に (path, b"") を返す
+    圧縮されたファイルは展開したものを返す (展開も読み込みのスレッドでやる)
+    """
+    for mada_file_path in mada_file_paths:
+        with open_mada(mada_file_path) as f:
+            while True:
+                with profiling.stage("read") as s:
+                    data = f.read(buffer_size)
+                    s.n_bytes = len(data)
+                yield mada_file_path, data
+                if not data:
+                    break
+
+
+def iter_batches_prefetched(
+    mada_file_paths: Iterable[Path],
+    config: PrefetchConfig = PrefetchConfig(),
+    chunk_size: int = 1024,
+    flush_adc_clock_depth: int = 1024,
+    with_hits: bool = False,
+) -> Iterator[Tuple[Path, EventBatch]]:
+    """
+    次のファイル, 次の buffer を先読みしながら (path, EventBatch) を返す
+    FrameAssembler で区切るので iter_events(validate=True) と同じイベントになる
+    各ファイルから少なくとも1つ (イベントが無ければ空の) EventBatch を返す
+    メモリ使用量は config.max_buffered_bytes と chunk_size イベントぶんで決まる
+    """
+    assembler = FrameAssembler()
+    payloads: List[bytes] = []
+    n_batches = 0
+    for mada_file_path, data in prefetch(iter_file_chunks(mada_file_paths, config.buffer_size), config.queue_depth):
+        with profiling.stage("split", n_bytes=len(data)) as s:
+            new_payloads = assembler.feed(data) if data else assembler.flush()
+            s.n_events = len(new_payloads)
+        payloads.extend(new_payloads)
+
+        end_of_file = not data
+        while len(payloads) >= chunk_size or (end_of_file and (payloads or n_batches == 0)):
+            yield mada_file_path, parse_batch(payloads[:chunk_size], flush_adc_clock_depth, with_hits)
+            del payloads[:chunk_size]
+            n_batches += 1
+        if end_of_file:
+            n_batches = 0
+
+
+def iter_events_prefetched(
+    mada_file_path: Path,
+    config: PrefetchConfig = PrefetchConfig(),
+    chunk_size: int = 1024,
+    flush_adc_clock_depth: int = 1024,
+    with_hits: bool = False,
+) -> Iterator[EventBatch]:
+    """
+    1ファイルぶんの iter_batches_prefetched (stream.iter_events の代わりに使える)
+    """
+    for _, batch in iter_batches_prefetched([mada_file_path], config, chunk_size, flush_adc_clock_depth, with_hits):
+        yield batch
+
+
+def iter_file_batches(
+    mada_file_paths: List[Path],
+    config: PrefetchConfig = PrefetchConfig(),
+    chunk_size: int = 1024,
+    flush_adc_clock_depth: int = 1024,
+    with_hits: bool = False,
+) -> Iterator[Tuple[Path, Iterator[EventBatch]]]:
+    """
+    iter_batches_prefetched をファイルごとにまとめて (path, そのファイルの EventBatch) を返す
+    (itertools.groupby なので, 次のファイルに進む前にそのファイルの EventBatch を使い切ること)
+    """
+    batches = iter_batches_prefetched(mada_file_paths, config, chunk_size, flush_adc_clock_depth, with_hits)
+    for mada_file_path, group in itertools.groupby(batches, key=lambda item: item[0]):
+        yield mada_file_path, (batch for _, batch in group)
+
+
+def iter_batches_from_path(
+    dir: Path,
+    mada_config_path: Path,
+    initial_period: int = 0,
+    final_period: int = 0,
+    use_catalog: bool = False,
+    config: PrefetchConfig = PrefetchConfig(),
+    chunk_size: int = 1024,
+    flush_adc_clock_depth: int = 1024,
+    with_hits: bool = False,
+) -> Iterator[Tuple[Path, EventBatch]]:
+    """
+    scan_mada_files_from_path で選んだファイルの iter_batches_prefetched
+    """
+    mada_files = scan_mada_files_from_path(dir, mada_config_path, initial_period, final_period, use_catalog)
+    return iter_batches_prefetched(mada_files, config, chunk_size, flush_adc_clock_depth, with_hits)
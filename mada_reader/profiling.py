@@ -0,0 +1,133 @@
+import json
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict
+
+# 読み飛ばしたイベントは無効のときも数える (壊れたイベントは少ないので負荷にならない)
+#   header_too_short: counter が読めない
+#   fadc_too_short: FADCブロックが depth ぶん無い
+#   fadc_irregular: channel id が 4-7 以外のwordで打ち切った
+#   invalid_boundary: データ中の uPIC (境界とみなさなかったもの)
+#   merged_frame: 前のイベントのhit部分につながったイベント (その uPIC 以降は hit としては読まない)
+
+
+@dataclass
+class StageStats:
+    seconds: float = 0.
+    calls: int = 0
+    n_bytes: int = 0
+    n_events: int = 0
+
+    def merge(self, other: "StageStats") -> None:
+        self.seconds += other.seconds
+        self.calls += other.calls
+        self.n_bytes += other.n_bytes
+        self.n_events += other.n_events
+
+
+class _Stage:
+    """
+    with profiler.stage("fadc_decode") as s: ... s.n_events = n
+    n_bytes, n_events はブロックの中で後から入れてもよい
+    """
+    __slots__ = ("profiler", "name", "n_bytes", "n_events", "_start")
+
+    def __init__(self, profiler: "Profiler", name: str, n_bytes: int, n_events: int):
+        self.profiler = profiler
+        self.name = name
+        self.n_bytes = n_bytes
+        self.n_events = n_events
+
+    def __enter__(self) -> "_Stage":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        stats = self.profiler.stages.setdefault(self.name, StageStats())
+        stats.seconds += time.perf_counter() - self._start
+        stats.calls += 1
+        stats.n_bytes += self.n_bytes
+        stats.n_events += self.n_events
+
+
+class _NullStage:
+    # 無効のときに使い回す何もしない stage
+    __slots__ = ("n_bytes", "n_events")
+
+    def __enter__(self) -> "_NullStage":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stages: Dict[str, StageStats] = {}
+        self.skipped: Dict[str, int] = {}
+
+    def stage(self, name: str, n_bytes: int = 0, n_events: int = 0):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, n_bytes, n_events)
+
+    def count(self, cause: str, n: int = 1) -> None:
+        if n == 0:
+            return
+        self.skipped[cause] = self.skipped.get(cause, 0) + n
+
+    def reset(self) -> None:
+        self.stages.clear()
+        self.skipped.clear()
+
+    def to_dict(self) -> dict:
+        return {
+            "stages": {name: asdict(stats) for name, stats in self.stages.items()},
+            "skipped": dict(self.skipped),
+        }
+
+    def merge_dict(self, profile: dict) -> None:
+        """
+        別プロセスの to_dict() の結果を足し込む
+        """
+        for name, stats in profile["stages"].items():
+            self.stages.setdefault(name, StageStats()).merge(StageStats(**stats))
+        for cause, n in profile["skipped"].items():
+            self.count(cause, n)
+
+    def summary_lines(self):
+        yield f"{'stage':<16}{'calls':>10}{'seconds':>10}{'MB/s':>10}{'events/s':>12}"
+        for name, stats in self.stages.items():
+            mb_per_s = stats.n_bytes / stats.seconds / 1e6 if stats.seconds > 0 else 0.
+            events_per_s = stats.n_events / stats.seconds if stats.seconds > 0 else 0.
+            yield f"{name:<16}{stats.calls:>10}{stats.seconds:>10.3f}{mb_per_s:>10.1f}{events_per_s:>12.1f}"
+        for cause, n in self.skipped.items():
+            yield f"skipped ({cause}): {n}"
+
+    def save_json(self, save_path: Path) -> None:
+        save_path.write_text(json.dumps(self.to_dict(), indent=2))
+
+
+_profiler = Profiler()
+
+
+def get_profiler() -> Profiler:
+    return _profiler
+
+
+def enable_profiling(enabled: bool = True) -> Profiler:
+    _profiler.enabled = enabled
+    return _profiler
+
+
+def stage(name: str, n_bytes: int = 0, n_events: int = 0):
+    return _profiler.stage(name, n_bytes, n_events)
+
+
+def count(cause: str, n: int = 1) -> None:
+    _profiler.count(cause, n)
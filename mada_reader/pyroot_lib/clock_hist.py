@@ -1,24 +1,58 @@
 import ROOT as r
 from pathlib import Path
 from copy import copy
+from typing import Dict, List, Optional
 
+import numpy as np
 
-def clock_hist(root_file_path: str) -> r.TH2D:
-    r.gROOT.SetBatch()
-    root_file = r.TFile.Open(root_file_path)
-    tree = root_file.tree01
-    clocks = [e.clock_counter for e in tree]
-    clocks_min = min(clocks)
-    clocks_max = max(clocks)
-    clocks_dif = clocks_max - clocks_min
+from mada_reader.clock import DEFAULT_N_BINS, ClockHistogram, clock_histograms_by_board, read_mada_clock_counter
+from mada_reader.pyroot_lib.util import set_hist_contents
+
+
+def read_root_clock_counter(root_file_path: Path) -> np.ndarray:
+    """
+    mada_reader root で作った tree01 の clock_counter (/I で書いてあるので uint32 に戻す)
+    """
+    df = r.RDataFrame("tree01", str(root_file_path))
+    return df.AsNumpy(["clock_counter"])["clock_counter"].astype(np.uint32)
+
+
+def read_clock_counter(path: Path) -> np.ndarray:
+    if Path(path).suffix == ".root":
+        return read_root_clock_counter(path)
+    return read_mada_clock_counter(path)
 
-    hist = r.TH1D(root_file_path, f"{root_file_path};clock;count", clocks_dif, clocks_min, clocks_max)
-    for c in clocks:
-        hist.Fill(c)
 
+def clock_hist_to_root(clock_hist: ClockHistogram) -> r.TH1D:
+    edges = clock_hist.edges
+    hist = r.TH1D(clock_hist.name, f"{clock_hist.name};clock;count", len(edges) - 1, float(edges[0]), float(edges[-1]))
+    n = clock_hist.n_entries
+    set_hist_contents(
+        hist,
+        np.concatenate([[0], clock_hist.counts, [0]]),
+        n,
+        np.array([n, n, clock_hist.sum_clock, clock_hist.sum_clock2]),
+    )
     return copy(hist)
 
 
+def clock_hists(
+    paths: List[Path],
+    n_bins: int = DEFAULT_N_BINS,
+    bin_width: Optional[int] = None,
+) -> Dict[str, r.TH1D]:
+    """
+    .mada / .root をボードごとにまとめて clock の TH1D を作る
+    """
+    r.gROOT.SetBatch()
+    hists = clock_histograms_by_board(paths, n_bins, bin_width, read_clock_counter)
+    return {board_name: clock_hist_to_root(hist) for board_name, hist in hists.items()}
+
+
+def clock_hist(root_file_path: str, n_bins: int = DEFAULT_N_BINS, bin_width: Optional[int] = None) -> r.TH1D:
+    return next(iter(clock_hists([Path(root_file_path)], n_bins, bin_width).values()))
+
+
 def save_clock_hist_png(hist: r.TH1D, save_path: Path):
     c = r.TCanvas("", "", 1500, 800)
     hist.Draw()
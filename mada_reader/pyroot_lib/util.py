@@ -1,6 +1,8 @@
 from array import array
 from copy import copy
+from typing import Optional
 
+import numpy as np
 import ROOT as r
 
 
@@ -12,6 +14,9 @@ def pyroot_func(func):
 
 
 def list_to_array(l: list) -> array:
+    if isinstance(l, np.ndarray):
+        # FlushADC の ch0-ch3 などはnumpy配列なので, python の int / float に戻してから型を見る
+        l = l.tolist()
     t = type(l[0])
     if t == int:
         return array("i", l)
@@ -26,3 +31,22 @@ def TPGraph(n: int, x: list, y: list) -> r.TGraph:
     xx = list_to_array(x)
     yy = list_to_array(y)
     return copy(r.TGraph(n, xx, yy))
+
+
+def set_hist_contents(hist: r.TH1, contents: np.ndarray, entries: float, stats: Optional[np.ndarray] = None) -> None:
+    """
+    under/overflow込みのbin内容 (ROOTと同じ並び) をFillを使わずにまとめて書き込む
+    weightは全て1として扱う
+    """
+    n_cells = hist.GetNcells()
+    contents = np.ascontiguousarray(contents, dtype=np.float64).reshape(n_cells)
+    buffer = hist.GetArray()
+    buffer.reshape((n_cells,))
+    np.frombuffer(buffer, dtype=np.float64, count=n_cells)[:] = contents
+    if hist.GetSumw2N() > 0:
+        sumw2 = hist.GetSumw2().GetArray()
+        sumw2.reshape((n_cells,))
+        np.frombuffer(sumw2, dtype=np.float64, count=n_cells)[:] = contents
+    hist.SetEntries(entries)
+    if stats is not None:
+        hist.PutStats(np.ascontiguousarray(stats, dtype=np.float64))
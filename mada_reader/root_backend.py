@@ -0,0 +1,67 @@
+"""
+ROOT (PyROOT) を使う処理への入り口
+ROOT は PyPI からは入らないので必須の依存にはせず, ここを通して使うときに初めて import する
+(gbkb, vis, pyroot_lib は import した時点で ROOT を読むので, それ以外のモジュールからは直接 import しない)
+"""
+import importlib.util
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from mada_reader.parser import EventBatch, FlushADC
+
+ROOT_MISSING_MESSAGE = (
+    "ROOT (PyROOT) が見つかりません. "
+    "ROOT をインストールして `export PYTHONPATH=$ROOTSYS/lib:$PYTHONPATH` を設定してください"
+)
+
+
+class RootNotAvailableError(ImportError):
+    pass
+
+
+def root_available() -> bool:
+    return importlib.util.find_spec("ROOT") is not None
+
+
+def require_root() -> None:
+    if not root_available():
+        raise RootNotAvailableError(ROOT_MISSING_MESSAGE)
+
+
+def mada_to_root(
+    mada_file_path: Path,
+    with_hits: bool = False,
+    batches: Optional[Iterable[EventBatch]] = None,
+) -> None:
+    require_root()
+    from mada_reader.rootfile_generator import gbkb
+    gbkb.mada_to_root(mada_file_path, with_hits=with_hits, batches=batches)
+
+
+def vis_flush_adc(fadc: FlushADC, save_file_name: str = "flush_adc.png") -> None:
+    require_root()
+    from mada_reader.vis import vis_flush_adc
+    vis_flush_adc(fadc, save_file_name=save_file_name)
+
+
+def clock_hists(paths: List[Path], n_bins: int, bin_width: Optional[int] = None) -> Dict[str, object]:
+    """
+    pyroot_lib.clock_hist.clock_hists (ボード名 -> TH1D)
+    """
+    require_root()
+    from mada_reader.pyroot_lib.clock_hist import clock_hists
+    return clock_hists(paths, n_bins, bin_width)
+
+
+def save_clock_hist_png(hist, save_path: Path) -> None:
+    require_root()
+    from mada_reader.pyroot_lib.clock_hist import save_clock_hist_png
+    save_clock_hist_png(hist, save_path)
+
+
+def save_features_root(features: np.ndarray, tfile_path: Path, tree_name: str = "features") -> None:
+    require_root()
+    from mada_reader.rootfile_generator.features import save_features_root
+    save_features_root(features, tfile_path, tree_name)
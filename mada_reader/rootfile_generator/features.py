@@ -0,0 +1,38 @@
+from pathlib import Path
+
+import numpy as np
+import ROOT as r
+
+from mada_reader.pyroot_lib.util import pyroot_func
+
+# numpy の dtype -> TTree の leaf の型
+LEAF_TYPES = {
+    np.dtype(np.uint32): "i",
+    np.dtype(np.int16): "S",
+    np.dtype(np.float32): "F",
+}
+
+
+@pyroot_func
+def save_features_root(features: np.ndarray, tfile_path: Path, tree_name: str = "features") -> None:
+    """
+    features.extract_features の構造化配列を1イベント1エントリの TTree に書く
+    (n_channels,) のフィールドは baseline[4]/F のような固定長配列の branch になる
+    """
+    tfile = r.TFile(str(tfile_path), "recreate")
+    tree = r.TTree(tree_name, tree_name)
+    buffers = {}
+    for name in features.dtype.names:
+        base_dtype, shape = features.dtype[name].base, features.dtype[name].shape
+        buffers[name] = np.zeros(shape or (1,), dtype=base_dtype)
+        dims = "".join(f"[{n}]" for n in shape)
+        tree.Branch(name, buffers[name], f"{name}{dims}/{LEAF_TYPES[base_dtype]}")
+
+    for feature in features:
+        for name, buffer in buffers.items():
+            buffer[...] = feature[name]
+        tree.Fill()
+
+    tfile.cd()
+    tree.Write()
+    tfile.Close()
@@ -1,65 +1,155 @@
 from copy import copy
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Literal, Optional, Tuple
+from typing import Iterable, List, Literal, Optional, Tuple
 import itertools
+import os
 
 import numpy as np
 import ROOT as r
-from mada_reader.parser import Event, FlushADC, parse_from_mada_file
-from mada_reader.pyroot_lib.util import pyroot_func
+from mada_reader import profiling
+from mada_reader.cache import iter_events_cached
+from mada_reader.files import root_output_path
+from mada_reader.gain import calc_fadc_amplitudes_batch, calc_fadc_peak2peak_batch
+from mada_reader.histogram import WaveformHist2D
+from mada_reader.parser import EventBatch, FlushADC
+from mada_reader.pyroot_lib.util import pyroot_func, set_hist_contents
+from mada_reader.stream import iter_events
 from nptyping import NDArray
 
 
-def draw_waveform_hist2d(events: List[Event]) -> List[r.TH2D]:
+def waveform_hist2d_to_root(waveform_hist: WaveformHist2D) -> List[r.TH2D]:
+    """
+    NumPyで数えた WaveformHist2D を TH2D wf_chN に書き込む (1点ずつFillしない)
+    """
+    x_axis, y_axis = waveform_hist.x_axis, waveform_hist.y_axis
     hists: List[r.TH2D] = [
         r.TH2D(
             f"wf_ch{ch}", f"wf_ch{ch}",
-            1024, 0, 1023,  # x -> clock
-            2048, 0, 2047  # y -> adc value
+            x_axis.nbins, x_axis.low, x_axis.high,  # x -> clock
+            y_axis.nbins, y_axis.low, y_axis.high  # y -> adc value
         )
-        for ch in range(4)
+        for ch in range(len(waveform_hist.counts))
     ]
-    for event in events:
-        for ch, fadc in enumerate(event.fadc):
-            for clock, adc_value in enumerate(fadc):
-                hists[ch].Fill(clock, adc_value)
+    for ch, hist in enumerate(hists):
+        set_hist_contents(
+            hist,
+            waveform_hist.contents(ch, flow=True),
+            waveform_hist.entries[ch],
+            waveform_hist.stats[ch],
+        )
+    return hists
+
+
+def draw_waveform_hist2d(batches: Iterable[EventBatch]) -> List[r.TH2D]:
+    hists = waveform_hist2d_to_root(WaveformHist2D().fill_all(batches))
     return [copy(h) for h in hists]
 
 
-@pyroot_func
-def mada_to_root(target_mada_path: Path) -> None:
+class FadcTreeWriter:
+    """
+    EventBatch を受け取って tree01 と波形の2D histogram を同時に埋める
+    (fadc[4][1024]/I と counter 3つの branch)
+    with_hits=True なら n_hits/I, hit_strip[n_hits]/s, hit_clock[n_hits]/s も書く
+    (batch は with_hits=True で読んだものを渡す)
+    """
     TREE_NAME = "tree01"
-    events = parse_from_mada_file(target_mada_path)
-    # /hoge/fuga/piyo.mada -> hoge/fuga/piyo.root
-    tfile_path = target_mada_path.absolute().parent / target_mada_path.name.replace(".mada", ".root")
-    tfile = r.TFile(str(tfile_path), "recreate")
-
-    fadc = np.ndarray((4, 1024), dtype=np.int32)
-    trigger_counter = np.ndarray(1, dtype=np.int32)
-    clock_counter = np.ndarray(1, dtype=np.int32)
-    input_ch2_counter = np.ndarray(1, dtype=np.int32)
-
-    tree = r.TTree(TREE_NAME, TREE_NAME)
-    tree.Branch("fadc", fadc, "fadc[4][1024]/I")
-    tree.Branch("trigger_counter", trigger_counter, "trigger_counter/I")
-    tree.Branch("clock_counter", clock_counter, "clock_counter/I")
-    tree.Branch("input_ch2_counter", input_ch2_counter, "input_ch2_counter/I")
-
-    for event in events:
-        trigger_counter[0] = event.header.trigger_counter
-        clock_counter[0] = event.header.clock_counter
-        input_ch2_counter[0] = event.header.input_ch2_counter
-        for i, fadc_ch_i in enumerate(event.fadc):
-            for j, v in enumerate(fadc_ch_i):
-                fadc[i][j] = v
-        tree.Fill()
-
-    tree.Write()
-
-    hists = draw_waveform_hist2d(events)
-    for h in hists:
-        h.Write()
+
+    def __init__(self, tfile_path: Path, flush_adc_clock_depth: int = 1024, with_hits: bool = False):
+        self.tfile = r.TFile(str(tfile_path), "recreate")
+
+        self.fadc = np.zeros((4, flush_adc_clock_depth), dtype=np.int32)
+        self.trigger_counter = np.zeros(1, dtype=np.int32)
+        self.clock_counter = np.zeros(1, dtype=np.int32)
+        self.input_ch2_counter = np.zeros(1, dtype=np.int32)
+
+        self.tree = r.TTree(self.TREE_NAME, self.TREE_NAME)
+        self.tree.Branch("fadc", self.fadc, f"fadc[4][{flush_adc_clock_depth}]/I")
+        self.tree.Branch("trigger_counter", self.trigger_counter, "trigger_counter/I")
+        self.tree.Branch("clock_counter", self.clock_counter, "clock_counter/I")
+        self.tree.Branch("input_ch2_counter", self.input_ch2_counter, "input_ch2_counter/I")
+
+        self.with_hits = with_hits
+        if with_hits:
+            self.n_hits = np.zeros(1, dtype=np.int32)
+            self.hit_strip = np.zeros(1024, dtype=np.uint16)
+            self.hit_clock = np.zeros(1024, dtype=np.uint16)
+            self.tree.Branch("n_hits", self.n_hits, "n_hits/I")
+            self.tree.Branch("hit_strip", self.hit_strip, "hit_strip[n_hits]/s")
+            self.tree.Branch("hit_clock", self.hit_clock, "hit_clock[n_hits]/s")
+
+        self.waveform_hist = WaveformHist2D()
+
+    def __enter__(self) -> "FadcTreeWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _reserve_hits(self, n_hits: int) -> None:
+        # 可変長branchのバッファが足りなければ作り直してアドレスを付け替える
+        if n_hits <= len(self.hit_strip):
+            return
+        size = max(n_hits, 2 * len(self.hit_strip))
+        self.hit_strip = np.zeros(size, dtype=np.uint16)
+        self.hit_clock = np.zeros(size, dtype=np.uint16)
+        self.tree.SetBranchAddress("hit_strip", self.hit_strip)
+        self.tree.SetBranchAddress("hit_clock", self.hit_clock)
+
+    def fill(self, batch: EventBatch) -> None:
+        if self.with_hits and batch.hits is None:
+            raise ValueError("with_hits=True needs a batch parsed with with_hits=True")
+        # branchは /I なので int32 に揃えておく
+        trigger_counters = batch.trigger_counter.astype(np.int32)
+        clock_counters = batch.clock_counter.astype(np.int32)
+        input_ch2_counters = batch.input_ch2_counter.astype(np.int32)
+        with profiling.stage("root_write", n_bytes=batch.fadc.nbytes, n_events=len(batch)):
+            for i in range(len(batch)):
+                self.trigger_counter[0] = trigger_counters[i]
+                self.clock_counter[0] = clock_counters[i]
+                self.input_ch2_counter[0] = input_ch2_counters[i]
+                self.fadc[:, :] = batch.fadc[i]
+                if self.with_hits:
+                    strip, clock = batch.hits.event(i)
+                    self._reserve_hits(len(strip))
+                    self.n_hits[0] = len(strip)
+                    self.hit_strip[:len(strip)] = strip
+                    self.hit_clock[:len(clock)] = clock
+                self.tree.Fill()
+        self.waveform_hist.fill(batch)
+
+    def close(self) -> None:
+        with profiling.stage("root_write"):
+            self.tfile.cd()
+            self.tree.Write()
+            for h in waveform_hist2d_to_root(self.waveform_hist):
+                h.Write()
+            self.tfile.Close()
+
+
+@pyroot_func
+def mada_to_root(
+    target_mada_path: Path,
+    with_hits: bool = False,
+    batches: Optional[Iterable[EventBatch]] = None,
+) -> None:
+    """
+    /hoge/fuga/piyo.mada -> /hoge/fuga/piyo.root
+    一時ファイル (.piyo.root.tmp) に書いてからrenameするので, 途中で落ちても壊れた .root は残らない
+    batches を渡すとそれを書く (prefetch.iter_events_prefetched など. 無ければ iter_events で読む)
+    """
+    if batches is None:
+        batches = iter_events(target_mada_path, with_hits=with_hits)
+    tfile_path = root_output_path(target_mada_path)
+    tmp_path = tfile_path.with_name(f".{tfile_path.name}.tmp")
+    try:
+        with FadcTreeWriter(tmp_path, with_hits=with_hits) as writer:
+            for batch in batches:
+                writer.fill(batch)
+        os.replace(tmp_path, tfile_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
 
 
 def calc_fadc_peak2peak(fadc: FlushADC) -> Optional[List[float]]:
@@ -69,8 +159,8 @@ def calc_fadc_peak2peak(fadc: FlushADC) -> Optional[List[float]]:
     """
     ret = [0., 0., 0., 0.]
     for i, fadc_ch_i in enumerate(fadc):
-        if fadc_ch_i:
-            ret[i] = float(abs(max(fadc_ch_i) - min(fadc_ch_i)))
+        if len(fadc_ch_i) > 0:
+            ret[i] = float(np.ptp(fadc_ch_i))
         else:
             return None
     return ret
@@ -104,42 +194,40 @@ def calc_fadc_amplitudes(
     ]
 
     for i, fadc_ch_i in enumerate(fadc):
-        if fadc_ch_i:
-            ret_min[i] = min(fadc_ch_i) - baselines[i]
-            ret_max[i] = max(fadc_ch_i) - baselines[i]
+        if len(fadc_ch_i) > 0:
+            ret_min[i] = float(np.min(fadc_ch_i)) - baselines[i]
+            ret_max[i] = float(np.max(fadc_ch_i)) - baselines[i]
         else:
             return None
     return FlushADCAmplitude("min", ret_min), FlushADCAmplitude("max", ret_max)
 
 
-def get_fadc_peak2peak_from_mada_file(target_mada_path: Path) -> NDArray:
+def get_fadc_peak2peak_from_mada_file(target_mada_path: Path, use_cache: bool = True) -> NDArray:
     """
     .mada 1ファイル分の p2p を np.array で取得する 
     [shape (n_events, 4)]
     """
-    events = parse_from_mada_file(target_mada_path)
-    fadc_list = list(map(lambda e: e.fadc, events))
-    ret = list(map(calc_fadc_peak2peak, fadc_list))
-    ret = list(filter(lambda x: x != None, ret))
-    return np.array(ret)
+    p2p_list = [
+        calc_fadc_peak2peak_batch(batch)
+        for batch in iter_events_cached(target_mada_path, use_cache=use_cache)
+    ]
+    return np.concatenate(p2p_list) if p2p_list else np.array([])
 
 
-def get_fadc_amplitude_from_mada_file(target_mada_path: Path) -> Tuple[List[FlushADCAmplitude], List[FlushADCAmplitude]]:
+def get_fadc_amplitude_from_mada_file(
+    target_mada_path: Path,
+    use_cache: bool = True
+) -> Tuple[List[FlushADCAmplitude], List[FlushADCAmplitude]]:
     """
     .mada 1ファイル分の amplitude を取得する 
     [min_ampのリスト], [max_ampのリスト]
     """
-    events = parse_from_mada_file(target_mada_path)
     ret_amp_mins: List[FlushADCAmplitude] = []
     ret_amp_maxs: List[FlushADCAmplitude] = []
-    for event in events:
-        ret_calc_fadc_amplitudes = calc_fadc_amplitudes(event.fadc, (600, 1000))
-        if ret_calc_fadc_amplitudes != None:
-            actual_calc_fadc_amplitudes: Tuple[FlushADCAmplitude, FlushADCAmplitude] = ret_calc_fadc_amplitudes
-            amp_min, amp_max = actual_calc_fadc_amplitudes
-            ret_amp_mins.append(amp_min)
-            ret_amp_maxs.append(amp_max)
-
+    for batch in iter_events_cached(target_mada_path, use_cache=use_cache):
+        amp_mins, amp_maxs = calc_fadc_amplitudes_batch(batch, (600, 1000))
+        ret_amp_mins.extend(FlushADCAmplitude("min", tuple(v)) for v in amp_mins.tolist())
+        ret_amp_maxs.extend(FlushADCAmplitude("max", tuple(v)) for v in amp_maxs.tolist())
     return ret_amp_mins, ret_amp_maxs
 
 
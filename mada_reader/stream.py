@@ -0,0 +1,232 @@
+import itertools
+import mmap
+import struct
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from mada_reader import profiling
+from mada_reader.compression import DEFAULT_READ_SIZE, is_compressed, iter_decompressed
+from mada_reader.parser import FADC_CHANNEL_ID_SHIFT, FADC_CHANNEL_IDS, HEADER_SIZE, EventBatch, parse_batch
+
+MAGIC = b"uPIC"
+# 境界の確認に使う FADC の先頭 word 数 (4ch x 2 clock)
+N_CHECKED_FADC_WORDS = 8
+_CHECKED_FADC_WORDS = struct.Struct(f">{N_CHECKED_FADC_WORDS}H")
+
+
+def _boundary_check_end(magic_position: int) -> int:
+    return magic_position + len(MAGIC) + HEADER_SIZE + _CHECKED_FADC_WORDS.size
+
+
+def is_frame_boundary(buffer, magic_position: int) -> bool:
+    """
+    magic_position にある uPIC が本当にイベントの先頭かどうか
+    header の後ろに channel id 4-7 の FADC word が並んでいれば先頭とみなす
+    ファイル末尾で途中までしか書かれていないイベントも先頭とみなす
+    """
+    if _boundary_check_end(magic_position) > len(buffer):
+        return True
+    words = _CHECKED_FADC_WORDS.unpack_from(buffer, magic_position + len(MAGIC) + HEADER_SIZE)
+    return all(FADC_CHANNEL_IDS[0] <= w >> FADC_CHANNEL_ID_SHIFT <= FADC_CHANNEL_IDS[-1] for w in words)
+
+
+def are_frame_boundaries(buffer, magic_positions: np.ndarray) -> np.ndarray:
+    """
+    is_frame_boundary をまとめて確認する [shape (len(magic_positions),) bool]
+    """
+    magic_positions = np.asarray(magic_positions, dtype=np.int64)
+    result = np.ones(len(magic_positions), dtype=bool)
+    is_checkable = magic_positions + (len(MAGIC) + HEADER_SIZE + _CHECKED_FADC_WORDS.size) <= len(buffer)
+    starts = magic_positions[is_checkable] + len(MAGIC) + HEADER_SIZE
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+    try:
+        words = raw[starts[:, None] + np.arange(_CHECKED_FADC_WORDS.size)].view(">u2")
+    finally:
+        del raw
+    channel_ids = words >> FADC_CHANNEL_ID_SHIFT
+    result[is_checkable] = ((FADC_CHANNEL_IDS[0] <= channel_ids) & (channel_ids <= FADC_CHANNEL_IDS[-1])).all(axis=1)
+    return result
+
+
+def iter_frame_ranges(buffer, validate: bool = False, start: int = 0) -> Iterator[Tuple[int, int]]:
+    """
+    buffer[start:]中の uPIC で区切られた各イベントの [start, end) を返す
+    read_file の split(b"uPIC") と同じ区切り方で, uPIC自体は含まない
+    validate=True のときは is_frame_boundary を満たさない uPIC (データ中にたまたま現れたもの) では区切らない
+    """
+    size = len(buffer)
+    search_from = start
+    while start <= size:
+        end = buffer.find(MAGIC, search_from)
+        if end < 0:
+            end = size
+        elif validate and not is_frame_boundary(buffer, end):
+            profiling.count("invalid_boundary")
+            search_from = end + 1
+            continue
+        if end > start:
+            yield start, end
+        start = search_from = end + len(MAGIC)
+
+
+@contextmanager
+def open_mmap(mada_file_path: Path):
+    """
+    読み取り専用でmmapする (空ファイルはmmapできないので b"" を返す)
+    """
+    with open(mada_file_path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+def iter_events(
+    mada_file_path: Path,
+    chunk_size: int = 1024,
+    flush_adc_clock_depth: int = 1024,
+    validate: bool = True,
+    with_hits: bool = False,
+    use_block_index: bool = True,
+) -> Iterator[EventBatch]:
+    """
+    .madaをmmapして chunk_size イベントずつ EventBatch にして返す
+    payloadはコピーせずmemoryviewのまま parse_batch に渡すので,
+    メモリ使用量はファイルサイズによらず chunk_size で決まる
+    validate=True ならデータ中の uPIC では区切らない (iter_frame_ranges)
+    with_hits=True なら EventBatch.hits も埋める
+    圧縮されたファイル (.mada.gz など) はmmapできないので, 展開しながら iter_payload_chunks で区切る
+    (このときは常に validate=True と同じ区切り方になる)
+    compress_mada で作った .blkidx があれば (use_block_index=True), ブロックごとに別スレッドで展開・parseする
+    """
+    if is_compressed(mada_file_path):
+        if use_block_index:
+            # block_compression はこのモジュールを import しているのでここで import する
+            from mada_reader.block_compression import iter_indexed_events
+            batches = iter_indexed_events(mada_file_path, chunk_size, flush_adc_clock_depth, with_hits)
+            if batches is not None:
+                yield from batches
+                return
+        yield from _iter_events_decompressed(mada_file_path, chunk_size, flush_adc_clock_depth, with_hits)
+        return
+
+    with open_mmap(mada_file_path) as mm:
+        view = memoryview(mm)
+        payloads: List[memoryview] = []
+        ranges = iter_frame_ranges(mm, validate)
+        position = 0
+        try:
+            while True:
+                with profiling.stage("split") as s:
+                    for start, end in itertools.islice(ranges, chunk_size):
+                        payloads.append(view[start:end])
+                    if payloads:
+                        s.n_events, s.n_bytes, position = len(payloads), end - position, end
+                if not payloads:
+                    break
+                yield parse_batch(payloads, flush_adc_clock_depth, with_hits)
+                _release(payloads)
+        finally:
+            _release(payloads)
+            view.release()
+
+
+def _release(payloads: List[memoryview]) -> None:
+    for payload in payloads:
+        payload.release()
+    payloads.clear()
+
+
+def iter_payload_chunks(mada_file_path: Path, read_size: int = DEFAULT_READ_SIZE) -> Iterator[List[bytes]]:
+    """
+    (圧縮されていれば展開しながら) read_size byte ずつ読んで, 届いたイベントの payload をまとめて返す
+    FrameAssembler で区切るので iter_frame_ranges(validate=True) と同じ区切りになる
+    """
+    assembler = FrameAssembler()
+    for data in iter_decompressed(mada_file_path, read_size):
+        with profiling.stage("split", n_bytes=len(data)) as s:
+            payloads = assembler.feed(data)
+            s.n_events = len(payloads)
+        if payloads:
+            yield payloads
+    payloads = assembler.flush()
+    if payloads:
+        yield payloads
+
+
+def _iter_events_decompressed(
+    mada_file_path: Path,
+    chunk_size: int,
+    flush_adc_clock_depth: int,
+    with_hits: bool,
+) -> Iterator[EventBatch]:
+    payloads: List[bytes] = []
+    for new_payloads in iter_payload_chunks(mada_file_path):
+        payloads.extend(new_payloads)
+        while len(payloads) >= chunk_size:
+            yield parse_batch(payloads[:chunk_size], flush_adc_clock_depth, with_hits)
+            del payloads[:chunk_size]
+    if payloads:
+        yield parse_batch(payloads, flush_adc_clock_depth, with_hits)
+
+
+class FrameAssembler:
+    """
+    少しずつ届くbyte列 (書き込み中のファイル, 圧縮ファイルの展開結果など) からイベントを切り出す
+    次のイベントの uPIC が見つかるまで最後のイベントは返さずに持っておく
+    最後まで届いたら flush() で残りを返す (iter_frame_ranges(validate=True) と同じ区切りになる)
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._frame_start = -1  # 今持っている最初のイベントの uPIC の位置 (-1 ならまだ見つかっていない)
+        self._search_from = 0
+
+    @property
+    def pending_bytes(self) -> int:
+        return len(self._buffer)
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """
+        data を追加して, 完全に届いたイベントの payload (uPIC を除く) を返す
+        """
+        self._buffer += data
+        payloads: List[bytes] = []
+        while True:
+            position = self._buffer.find(MAGIC, self._search_from)
+            if position < 0:
+                # uPIC が途中で切れているかもしれないので3byte戻ったところから探し直す
+                self._search_from = max(self._search_from, len(self._buffer) - len(MAGIC) + 1)
+                break
+            if _boundary_check_end(position) > len(self._buffer):
+                # 境界かどうか判断できるだけのデータがまだ無い
+                self._search_from = position
+                break
+            self._search_from = position + 1
+            if not is_frame_boundary(self._buffer, position):
+                continue
+            payload_start = self._frame_start + len(MAGIC) if self._frame_start >= 0 else 0
+            if position > payload_start:
+                payloads.append(bytes(self._buffer[payload_start:position]))
+            self._frame_start = position
+            self._search_from = position + len(MAGIC)
+
+        if self._frame_start > 0:
+            del self._buffer[:self._frame_start]
+            self._search_from -= self._frame_start
+            self._frame_start = 0
+        return payloads
+
+    def flush(self) -> List[bytes]:
+        """
+        残っているデータを全てイベントとして返す (ファイルの終わりに届いたとき)
+        """
+        buffer = bytes(self._buffer)
+        self._buffer = bytearray()
+        self._frame_start = -1
+        self._search_from = 0
+        return [buffer[start:end] for start, end in iter_frame_ranges(buffer, validate=True)]
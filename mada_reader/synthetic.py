@@ -0,0 +1,105 @@
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+from mada_reader.hits import hit_record_size
+from mada_reader.parser import FADC_CHANNEL_ID_SHIFT, FADC_CHANNEL_IDS, HEADER_SIZE, fadc_block_size
+from mada_reader.stream import MAGIC
+
+BASELINE = 512
+NOISE_SIGMA = 2.
+MAX_ADC_VALUE = 0x3FF
+
+
+@dataclass
+class SyntheticConfig:
+    """
+    corruption_rate: 壊れたイベントの割合 (FADCブロックの途中で切れる / channel idが崩れる が半々)
+        先頭の N_CHECKED_FADC_WORDS word が崩れたイベントは境界とみなされず, 前のイベントにつながる
+    hit_records: 1イベントあたりのhitレコード数 (hits.hit_record_size のレコードを並べる)
+    mean_clock_interval: イベント間隔の平均 [clock]
+    """
+    flush_adc_clock_depth: int = 1024
+    corruption_rate: float = 0.
+    hit_records: int = 0
+    mean_clock_interval: float = 1e5
+    seed: int = 0
+
+    @property
+    def frame_size(self) -> int:
+        return len(MAGIC) + HEADER_SIZE + fadc_block_size(self.flush_adc_clock_depth) \
+            + self.hit_records * hit_record_size()
+
+
+def _waveforms(rng: np.random.Generator, n_events: int, depth: int) -> np.ndarray:
+    """
+    baseline + noise に負のパルスを1つ乗せた (n_events, 4, depth) の波形
+    """
+    n_channels = len(FADC_CHANNEL_IDS)
+    noise = rng.normal(BASELINE, NOISE_SIGMA, size=(n_events, n_channels, depth))
+    peak_clocks = rng.integers(depth // 8, depth // 2, size=(n_events, n_channels, 1))
+    heights = rng.uniform(20, 400, size=(n_events, n_channels, 1))
+    t = np.arange(depth) - peak_clocks
+    pulse = np.where(t >= 0, heights * np.exp(-np.maximum(t, 0) / 40.), 0.)
+    return np.clip(noise - pulse, 0, MAX_ADC_VALUE).astype(np.uint16)
+
+
+def generate_frames(n_events: int, config: SyntheticConfig = SyntheticConfig(), chunk_size: int = 256) -> Iterator[bytes]:
+    """
+    uPIC + counter + u4u2u10 のFADCブロック (+ hit) のフレームを1つずつ返す
+    counter は32 bitで一周する
+    """
+    rng = np.random.default_rng(config.seed)
+    depth = config.flush_adc_clock_depth
+    channel_ids = np.array(FADC_CHANNEL_IDS, dtype=np.uint16)[:, None] << FADC_CHANNEL_ID_SHIFT
+    hits_size = config.hit_records * hit_record_size()
+    clock = int(rng.integers(0, 2 ** 32))
+    input_ch2 = 0
+
+    for first in range(0, n_events, chunk_size):
+        n_chunk = min(chunk_size, n_events - first)
+        fadc_words = (_waveforms(rng, n_chunk, depth) | channel_ids).transpose(0, 2, 1).astype(">u2")
+        clock_steps = rng.exponential(config.mean_clock_interval, size=n_chunk).astype(np.int64) + 1
+        input_ch2_steps = rng.poisson(1., size=n_chunk)
+        corruptions = rng.random(n_chunk) < config.corruption_rate
+        hit_bytes = rng.integers(0, 256, size=(n_chunk, hits_size), dtype=np.uint8)
+
+        for i in range(n_chunk):
+            clock = (clock + int(clock_steps[i])) % 2 ** 32
+            input_ch2 = (input_ch2 + int(input_ch2_steps[i])) % 2 ** 32
+            fadc_block = fadc_words[i].tobytes()
+            if corruptions[i]:
+                if rng.random() < .5:
+                    fadc_block = fadc_block[:int(rng.integers(0, len(fadc_block)))]
+                else:
+                    position = 2 * int(rng.integers(0, 4 * depth))
+                    fadc_block = fadc_block[:position] + b"\x00\x00" + fadc_block[position + 2:]
+            yield (
+                MAGIC + b"\x00" * 4
+                + struct.pack("!III", (first + i) % 2 ** 32, clock, input_ch2)
+                + fadc_block
+                + (hit_bytes[i].tobytes() if not corruptions[i] else b"")
+            )
+
+
+def write_synthetic_mada(
+    mada_file_path: Path,
+    n_events: Optional[int] = None,
+    size_bytes: Optional[int] = None,
+    config: SyntheticConfig = SyntheticConfig(),
+) -> int:
+    """
+    n_events か size_bytes (だいたいのファイルサイズ) を指定して .mada を書く
+    書いたイベント数を返す
+    """
+    if n_events is None:
+        if size_bytes is None:
+            raise ValueError("n_events or size_bytes is required")
+        n_events = max(size_bytes // config.frame_size, 1)
+    with open(mada_file_path, "wb") as f:
+        for frame in generate_frames(n_events, config):
+            f.write(frame)
+    return n_events
@@ -11,8 +11,7 @@ def vis_flush_adc(
 ):
     """
     任意の1イベントのFADC波形をpngに出力する。
-    任意のイベントを選ぶためにファイル内の
-    すべてのイベントをdumpしているのでめっちゃ遅い。
+    イベントは index.MadaFile で必要なものだけ読んで渡す。
     """
     fadc_clock_depth = len(flush_adc.ch0)
     graphs = [
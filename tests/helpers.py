@@ -0,0 +1,37 @@
+import struct
+from typing import Optional
+
+import numpy as np
+
+MAGIC = b"uPIC"
+
+
+def make_fadc_block(waveforms: Optional[np.ndarray] = None, depth: int = 1024) -> bytes:
+    """
+    (4, depth) の波形から u4u2u10 x 4ch x depth のFADCブロックを作る
+    """
+    if waveforms is None:
+        waveforms = np.zeros((4, depth), dtype=np.uint16)
+    channel_ids = np.arange(4, 8, dtype=np.uint16)[:, None]
+    words = (channel_ids << 12) | (np.asarray(waveforms, dtype=np.uint16) & 0x3FF)
+    return words.T.astype(">u2").tobytes()
+
+
+def make_frame(
+    trigger_counter: int,
+    clock_counter: int,
+    input_ch2_counter: int = 0,
+    waveforms: Optional[np.ndarray] = None,
+    hits: bytes = b"",
+    depth: int = 1024,
+) -> bytes:
+    return (
+        MAGIC + b"\x00" * 4
+        + struct.pack("!III", trigger_counter, clock_counter, input_ch2_counter)
+        + make_fadc_block(waveforms, depth)
+        + hits
+    )
+
+
+def random_waveforms(rng: np.random.Generator, depth: int = 1024) -> np.ndarray:
+    return rng.integers(0, 1024, size=(4, depth), dtype=np.uint16)
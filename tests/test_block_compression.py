@@ -0,0 +1,107 @@
+import gzip
+
+import numpy as np
+import pytest
+
+from mada_reader import block_compression
+from mada_reader.compression import CODECS, compress_bytes
+from mada_reader.parser import EventBatch
+from mada_reader.stream import MAGIC, iter_events
+from tests.helpers import make_frame, random_waveforms
+
+rng = np.random.default_rng(0)
+
+
+def write_mada(path, n_events=20):
+    frames = [make_frame(i, 10 * i, 0, random_waveforms(rng), hits=b"\x00\x01" * (i % 5)) for i in range(n_events)]
+    # hit data の最後にたまたま uPIC が現れる
+    frames[4] = make_frame(4, 40, 0, random_waveforms(rng), hits=b"\x00" * 8 + b"uPIC")
+    path.write_bytes(b"\x00\x01" + b"".join(frames) + b"uPIC\x00")
+    return path
+
+
+def test_iter_frame_blocks_cuts_only_at_checked_boundaries():
+    frames = [make_frame(i, i, hits=b"\x00" * 8 + b"uPIC") if i == 1 else make_frame(i, i) for i in range(4)]
+    data = b"".join(frames)
+    frame_size = len(frames[0])
+    chunks = [data[i:i + 1000] for i in range(0, len(data), 1000)]
+    blocks = list(block_compression.iter_frame_blocks(iter(chunks), block_size=1))
+    assert b"".join(blocks) == data
+    # 2番目のイベントの末尾に uPIC があるので, 3番目の前では区切らない
+    assert [len(block) for block in blocks] == [frame_size, 2 * frame_size + 12, frame_size]
+    assert all(block.startswith(MAGIC) for block in blocks)
+
+
+@pytest.mark.parametrize("codec", list(CODECS))
+def test_compress_mada_round_trip(tmp_path, codec):
+    mada_path = write_mada(tmp_path / "GBKB-13_0000.mada")
+    data = mada_path.read_bytes()
+    output = block_compression.compress_mada(mada_path, codec, block_size=20000, jobs=2)
+    assert output == tmp_path / f"GBKB-13_0000.mada.{codec}"
+    assert mada_path.exists()
+    assert CODECS[codec].decompress(output.read_bytes()) == data
+
+    index = block_compression.load_block_index(output)
+    assert len(index) > 2
+    assert index.compressed_offsets[-1] == output.stat().st_size
+    assert index.uncompressed_offsets[-1] == len(data)
+    for i in range(len(index)):
+        start, end = index.uncompressed_offsets[i:i + 2]
+        assert block_compression.read_block(output, index, i) == data[start:end]
+
+    expected = EventBatch.concatenate(list(iter_events(mada_path)))
+    batches = list(block_compression.iter_events_parallel(output, jobs=3))
+    assert len(batches) == len(index)
+    actual = EventBatch.concatenate(batches)
+    assert actual.trigger_counter.tolist() == expected.trigger_counter.tolist() == list(range(20))
+    assert np.array_equal(actual.fadc, expected.fadc)
+
+
+def test_iter_events_uses_block_index(tmp_path, monkeypatch):
+    mada_path = write_mada(tmp_path / "GBKB-13_0000.mada")
+    output = block_compression.compress_mada(mada_path, "gz", block_size=20000)
+    read_blocks = []
+    read_block = block_compression.read_block
+    monkeypatch.setattr(
+        block_compression, "read_block", lambda path, index, i: read_blocks.append(i) or read_block(path, index, i)
+    )
+
+    batches = list(iter_events(output, chunk_size=3, with_hits=True))
+    assert sorted(read_blocks) == list(range(len(block_compression.load_block_index(output))))
+    assert all(len(batch) <= 3 for batch in batches)
+    expected = EventBatch.concatenate(list(iter_events(mada_path, with_hits=True)))
+    actual = EventBatch.concatenate(batches)
+    assert actual.trigger_counter.tolist() == expected.trigger_counter.tolist()
+    assert np.array_equal(actual.fadc, expected.fadc)
+    assert actual.hits.strip.tolist() == expected.hits.strip.tolist()
+
+    read_blocks.clear()
+    assert sum(map(len, iter_events(output, use_block_index=False))) == len(expected)
+    assert read_blocks == []
+
+
+def test_recompress_in_place_and_stale_index(tmp_path):
+    mada_path = write_mada(tmp_path / "GBKB-13_0000.mada")
+    data = mada_path.read_bytes()
+    archived = tmp_path / "GBKB-13_0000.mada.gz"
+    archived.write_bytes(gzip.compress(data))
+    # 普通の .gz は .blkidx が無いので順に読む
+    assert block_compression.load_block_index(archived) is None
+    assert sum(map(len, block_compression.iter_events_parallel(archived))) == 20
+
+    assert block_compression.compress_mada(archived, "gz", block_size=10000) == archived
+    assert gzip.decompress(archived.read_bytes()) == data
+    assert len(block_compression.load_block_index(archived)) > 1
+    assert not list(tmp_path.glob("*.tmp"))
+
+    archived.write_bytes(compress_bytes("gz", data))
+    assert block_compression.load_block_index(archived) is None
+
+
+def test_compress_empty_file(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    mada_path.write_bytes(b"")
+    output = block_compression.compress_mada(mada_path, "xz")
+    assert len(block_compression.load_block_index(output)) == 1
+    assert sum(map(len, block_compression.iter_events_parallel(output))) == 0
+    assert list(iter_events(output)) == []
@@ -0,0 +1,98 @@
+import gzip
+import os
+
+import numpy as np
+import pytest
+
+from mada_reader import cache, parser
+from mada_reader.stream import iter_events as iter_events
+from tests.helpers import make_frame, random_waveforms
+
+
+def write_mada(path, n_events=4, seed=0):
+    rng = np.random.default_rng(seed)
+    path.write_bytes(b"".join(make_frame(i, i, 0, random_waveforms(rng)) for i in range(n_events)))
+    return path
+
+
+def test_cache_hit_and_invalidation(tmp_path):
+    mada_path = write_mada(tmp_path / "GBKB-13_0000.mada")
+    file_cache = cache.DecodedFileCache()
+    first = parser.EventBatch.concatenate(list(file_cache.iter_events(mada_path, chunk_size=3)))
+    second = list(file_cache.iter_events(mada_path))
+    assert (file_cache.stats.misses, file_cache.stats.hits) == (1, 1)
+    assert len(second) == 1
+    assert np.array_equal(second[0].fadc, first.fadc)
+    with pytest.raises(ValueError):
+        second[0].fadc[0, 0, 0] = 1
+
+    write_mada(mada_path, n_events=2, seed=1)
+    os.utime(mada_path, ns=(0, 0))
+    assert len(parser.EventBatch.concatenate(list(file_cache.iter_events(mada_path)))) == 2
+    assert file_cache.stats.misses == 2
+
+
+def test_cache_lru_eviction(tmp_path):
+    paths = [write_mada(tmp_path / f"GBKB-13_000{i}.mada", seed=i) for i in range(3)]
+    file_cache = cache.DecodedFileCache(max_bytes=int(2.5 * os.path.getsize(paths[0])))
+    for path in paths[:2]:
+        list(file_cache.iter_events(path))
+    list(file_cache.iter_events(paths[0]))  # paths[0] を最近使ったことにする
+    list(file_cache.iter_events(paths[2]))
+    assert file_cache.stats.evictions == 1
+    assert file_cache.get(paths[0]) is not None
+    assert file_cache.get(paths[1]) is None
+
+
+def test_parse_from_mada_file_uses_cache(tmp_path):
+    mada_path = write_mada(tmp_path / "GBKB-13_0000.mada")
+    hits = cache.get_cache().stats.hits
+    first = parser.parse_from_mada_file(mada_path, as_batch=True, copy=False)
+    assert parser.parse_from_mada_file(mada_path, as_batch=True, copy=False) is first
+    assert cache.get_cache().stats.hits == hits + 1
+    events = parser.parse_from_mada_file(mada_path, use_cache=False)
+    assert events[2].fadc == first.event(2).fadc
+
+    # 既定ではコピーを返すので書き換えられる
+    copied = parser.parse_from_mada_file(mada_path, as_batch=True)
+    copied.fadc[0, 0, 0] = first.fadc[0, 0, 0] + 1
+    assert copied.fadc[0, 0, 0] != first.fadc[0, 0, 0]
+
+
+def test_parse_from_mada_file_same_with_and_without_cache(tmp_path):
+    rng = np.random.default_rng(0)
+    frames = [make_frame(i, i, 0, random_waveforms(rng)) for i in range(4)]
+    # 2つ目のイベントの最初の FADC word が壊れて境界とみなされない
+    corrupted = bytearray(frames[1])
+    corrupted[4 + parser.HEADER_SIZE:4 + parser.HEADER_SIZE + 2] = b"\x00\x00"
+    frames[1] = bytes(corrupted)
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    mada_path.write_bytes(b"".join(frames))
+
+    cached = parser.parse_from_mada_file(mada_path, as_batch=True)
+    uncached = parser.parse_from_mada_file(mada_path, as_batch=True, use_cache=False)
+    assert cached.trigger_counter.tolist() == uncached.trigger_counter.tolist() == [0, 2, 3]
+    assert np.array_equal(cached.fadc, uncached.fadc)
+
+
+def test_load_returns_the_cached_batch(tmp_path):
+    mada_path = write_mada(tmp_path / "GBKB-13_0000.mada")
+    file_cache = cache.DecodedFileCache()
+    batch = file_cache.load(mada_path, chunk_size=3)
+    assert len(batch) == 4
+    assert file_cache.get(mada_path) is batch
+    assert file_cache.nbytes == cache._batch_nbytes(batch)
+
+
+def test_budget_counts_decoded_bytes(tmp_path):
+    # ほとんど0の波形はよく縮むので, ファイルサイズは上限より小さくてもデコード後は上限を超える
+    mada_path = tmp_path / "GBKB-13_0000.mada.gz"
+    mada_path.write_bytes(gzip.compress(b"".join(make_frame(i, i) for i in range(8))))
+    decoded_nbytes = cache._batch_nbytes(parser.EventBatch.concatenate(list(iter_events(mada_path))))
+    file_cache = cache.DecodedFileCache(max_bytes=decoded_nbytes // 2)
+    assert os.path.getsize(mada_path) < file_cache.max_bytes
+
+    assert sum(map(len, file_cache.iter_events(mada_path, chunk_size=2))) == 8
+    assert len(file_cache) == 0
+    assert len(file_cache.load(mada_path)) == 8
+    assert len(file_cache) == 0
@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from mada_reader.catalog import MadaCatalog, summarize_mada_file
+from mada_reader.files import scan_mada_files
+from mada_reader.models.mada_config import parse
+from tests.helpers import make_frame
+from tests.test_files import JSON_STRING
+
+
+def write_mada(path, n_events, clock_step=100, corrupted=False):
+    frames = [make_frame(i, clock_step * i) for i in range(n_events)]
+    if corrupted:
+        frames.append(make_frame(n_events, clock_step * n_events)[:100])
+    path.write_bytes(b"".join(frames))
+    return path
+
+
+def test_summarize_mada_file(tmp_path):
+    mada_path = write_mada(tmp_path / "GBKB-13_0002.mada", 3, corrupted=True)
+    entry = summarize_mada_file(mada_path)
+    assert (entry.board_name, entry.period, entry.n_events) == ("GBKB-13", 2, 3)
+    assert (entry.first_trigger_counter, entry.last_trigger_counter) == (0, 2)
+    assert entry.clock_span == 200
+    assert entry.n_corrupted == 1
+    assert entry.duration(clock_frequency=100.) == pytest.approx(2.)
+
+
+def test_refresh_is_incremental(tmp_path):
+    write_mada(tmp_path / "GBKB-00_0000.mada", 3)
+    changed = write_mada(tmp_path / "GBKB-00_0001.mada", 2)
+    removed = write_mada(tmp_path / "GBKB-13_0000.mada", 4)
+    (tmp_path / "GBKB-13_0000.root").write_bytes(b"")  # .mada 以外は無視
+
+    read = []
+    with MadaCatalog(tmp_path) as catalog:
+        assert catalog.refresh(on_file=read.append) == (3, 0)
+        read.clear()
+        assert catalog.refresh(on_file=read.append) == (0, 0)
+        assert read == []
+
+        write_mada(changed, 5)
+        os.utime(changed, ns=(0, 0))
+        removed.unlink()
+        assert catalog.refresh(on_file=read.append) == (1, 1)
+        assert read == [changed]
+        assert [(e.name, e.n_events) for e in catalog.entries()] == [
+            ("GBKB-00_0000.mada", 3),
+            ("GBKB-00_0001.mada", 5),
+        ]
+
+    # 閉じても残っている
+    with MadaCatalog(tmp_path) as catalog:
+        assert catalog.refresh() == (0, 0)
+        assert len(catalog.entries()) == 2
+
+
+def test_queries(tmp_path):
+    write_mada(tmp_path / "GBKB-00_0000.mada", 3, clock_step=100)
+    write_mada(tmp_path / "GBKB-13_0000.mada", 1)
+    write_mada(tmp_path / "GBKB-00_0001.mada", 5, clock_step=100)
+    write_mada(tmp_path / "GBKB-13_0001.mada", 2, clock_step=1000)
+
+    with MadaCatalog(tmp_path, tmp_path / "other.sqlite") as catalog:
+        catalog.refresh()
+        assert [e.name for e in catalog.entries(period_ini=1, period_fin=1)] == [
+            "GBKB-00_0001.mada",
+            "GBKB-13_0001.mada",
+        ]
+        assert [e.name for e in catalog.entries(min_events=2)] == ["GBKB-00_0000.mada", "GBKB-00_0001.mada"]
+        assert catalog.periods("GBKB-13") == [0, 1]
+        assert catalog.periods("GBKB-13", min_events=1) == [1]
+        assert catalog.total_duration(board_name="GBKB-00", clock_frequency=100.) == pytest.approx(6.)
+        # ボードを指定しなければ長い方
+        assert catalog.total_duration(clock_frequency=100.) == pytest.approx(10.)
+        assert catalog.total_duration(period_ini=1, clock_frequency=100.) == pytest.approx(10.)
+    assert (tmp_path / "other.sqlite").exists()
+
+
+def test_scan_mada_files_with_catalog_skips_missing(tmp_path):
+    write_mada(tmp_path / "GBKB-00_0000.mada", 1)
+    write_mada(tmp_path / "GBKB-13_0000.mada", 1)
+    write_mada(tmp_path / "GBKB-01_0000.mada", 1)  # inactive
+    missing = write_mada(tmp_path / "GBKB-00_0001.mada", 1)
+    write_mada(tmp_path / "GBKB-13_0001.mada", 1)
+    mada_config = parse(JSON_STRING)
+
+    with MadaCatalog(tmp_path) as catalog:
+        catalog.refresh()
+        missing.unlink()
+        with pytest.raises(FileExistsError):
+            scan_mada_files(tmp_path, mada_config, 0, 1)
+        scanned = scan_mada_files(tmp_path, mada_config, 0, 1, catalog)
+    assert [path.name for path in scanned] == [
+        "GBKB-00_0000.mada",
+        "GBKB-13_0000.mada",
+        "GBKB-13_0001.mada",
+    ]
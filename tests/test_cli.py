@@ -1,3 +1,60 @@
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from typer.testing import CliRunner
+
 from mada_reader import cli, parser
+from tests.helpers import make_frame
 
 MADAFILE = "tests/assets/GBKB-13_0004.mada"
+
+# ROOT を読むと数秒かかるので, show は ROOT 無しで十分これより速く起動できるはず
+SHOW_STARTUP_LIMIT_SECONDS = 5.
+
+SHOW_WITHOUT_ROOT = """
+import sys
+from mada_reader import cli
+cli.app(["show", sys.argv[1]], standalone_mode=False)
+assert "ROOT" not in sys.modules, "show imported ROOT"
+"""
+
+
+def test_show_starts_without_root(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    mada_path.write_bytes(make_frame(0, 10) + make_frame(1, 20))
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", SHOW_WITHOUT_ROOT, str(mada_path)],
+        cwd=Path(__file__).parents[1], capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == ["trigger\tclock\tinput2", "0\t10\t0", "1\t20\t0"]
+    assert elapsed < SHOW_STARTUP_LIMIT_SECONDS
+
+
+MADA_CONFIG = """
+{
+    "gigaIwaki": {
+        "GBKB-13": {"active": 1, "connection": "a0", "pitch": "800", "IP": "x", "DACfile": "a", "Vth": 0}
+    },
+    "ADALM": {}
+}
+"""
+
+
+def test_detamps_short_options(tmp_path):
+    (tmp_path / "GBKB-13_0000.mada").write_bytes(make_frame(0, 10) + make_frame(1, 20))
+    (tmp_path / "GBKB-13_0001.mada").write_bytes(make_frame(2, 30))
+    config_path = tmp_path / "MADA_config.json"
+    config_path.write_text(MADA_CONFIG)
+
+    result = CliRunner().invoke(cli.app, ["detamps", "--dir", str(tmp_path), "-c", str(config_path), "-f", "0", "--fin", "1"])
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines()[-2:] == [
+        "GBKB-13, 0, 0, 0, 0, 0.0, 0.0, 0.0, 0.0, 3",
+        "GBKB-13, 0, 0, 0, 0, 0.0, 0.0, 0.0, 0.0, 3",
+    ]
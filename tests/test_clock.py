@@ -0,0 +1,34 @@
+import numpy as np
+
+from mada_reader.clock import choose_bin_width, clock_histogram, clock_histograms_by_board
+from tests.helpers import make_frame
+
+
+def test_choose_bin_width():
+    assert choose_bin_width(10 ** 9, n_bins=1000) == 10 ** 6
+    assert choose_bin_width(10, n_bins=1000) == 1
+    assert choose_bin_width(10 ** 9, bin_width=250) == 250
+
+
+def test_clock_histogram():
+    hist = clock_histogram("GBKB-13", np.array([100, 105, 110, 199, 200]), n_bins=10)
+    assert hist.bin_width == 10
+    assert hist.edges[0] == 100
+    assert hist.edges[-1] > 200
+    assert hist.counts.tolist() == [2, 1, 0, 0, 0, 0, 0, 0, 0, 1, 1]
+    assert hist.n_entries == 5
+
+
+def test_clock_histograms_by_board_unwraps_rollover(tmp_path):
+    clocks = [2 ** 32 - 300, 2 ** 32 - 100, 100]
+    (tmp_path / "GBKB-13_0000.mada").write_bytes(b"".join(make_frame(i, c) for i, c in enumerate(clocks)))
+    (tmp_path / "GBKB-13_0001.mada").write_bytes(make_frame(3, 300))
+    (tmp_path / "GBKB-00_0000.mada").write_bytes(make_frame(0, 5))
+
+    hists = clock_histograms_by_board(sorted(tmp_path.glob("*.mada")), n_bins=7)
+    assert list(hists) == ["GBKB-00", "GBKB-13"]
+    hist = hists["GBKB-13"]
+    assert hist.edges[0] == 2 ** 32 - 300
+    assert hist.bin_width == 86
+    assert hist.n_entries == 4
+    assert hist.edges[-1] > 2 ** 32 + 300
@@ -0,0 +1,106 @@
+import gzip
+
+import numpy as np
+import pytest
+
+from mada_reader import compression
+from mada_reader.catalog import MadaCatalog, summarize_mada_file
+from mada_reader.files import find_mada_file, root_output_path, scan_mada_files
+from mada_reader.headers import read_header_arrays
+from mada_reader.models.mada_config import parse
+from mada_reader.parser import EventBatch
+from mada_reader.stream import iter_events
+from tests.helpers import make_frame, random_waveforms
+from tests.test_files import JSON_STRING
+
+rng = np.random.default_rng(0)
+
+
+def mada_bytes(n_events=7):
+    frames = [make_frame(i, 10 * i, i, random_waveforms(rng), hits=b"\x00uPIC\x00") for i in range(n_events)]
+    return b"".join(frames) + make_frame(n_events, 10 * n_events, n_events)[:40]  # 最後は header だけ
+
+
+def write_compressed(path, data, codec):
+    path.write_bytes(compression.compress_bytes(codec, data))
+    return path
+
+
+def test_compression_codec():
+    assert compression.compression_codec("GBKB-13_0000.mada.xz") == "xz"
+    assert compression.compression_codec("GBKB-13_0000.mada") is None
+    assert compression.strip_compression_suffix("GBKB-13_0000.mada.bz2") == "GBKB-13_0000.mada"
+    assert compression.strip_compression_suffix("GBKB-13_0000.mada") == "GBKB-13_0000.mada"
+
+
+@pytest.mark.parametrize("codec", list(compression.CODECS))
+def test_iter_events_decompresses_in_chunks(tmp_path, monkeypatch, codec):
+    data = mada_bytes()
+    plain = tmp_path / "GBKB-13_0000.mada"
+    plain.write_bytes(data)
+    compressed = write_compressed(tmp_path / f"GBKB-13_0001.mada.{codec}", data, codec)
+
+    # イベントの途中で切れる大きさずつ展開させる
+    read_sizes = []
+    original = compression.iter_decompressed
+
+    def small_chunks(path, read_size=compression.DEFAULT_READ_SIZE):
+        read_sizes.append(read_size)
+        return original(path, 1000)
+    monkeypatch.setattr("mada_reader.stream.iter_decompressed", small_chunks)
+
+    expected = EventBatch.concatenate(list(iter_events(plain, chunk_size=3)))
+    batches = list(iter_events(compressed, chunk_size=3))
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    actual = EventBatch.concatenate(batches)
+    assert actual.trigger_counter.tolist() == expected.trigger_counter.tolist() == list(range(7))
+    assert np.array_equal(actual.fadc, expected.fadc)
+    assert read_sizes == [compression.DEFAULT_READ_SIZE]
+
+    headers = read_header_arrays(compressed)
+    assert np.array_equal(headers.as_array(), read_header_arrays(plain).as_array())
+    assert len(headers) == 8
+
+
+def test_concatenated_members_are_read_through(tmp_path):
+    data = mada_bytes()
+    path = tmp_path / "GBKB-13_0000.mada.gz"
+    path.write_bytes(gzip.compress(data[:5000]) + gzip.compress(data[5000:]))
+    assert b"".join(compression.iter_decompressed(path, 777)) == data
+
+
+def test_summarize_compressed_file(tmp_path):
+    data = mada_bytes()
+    (tmp_path / "GBKB-13_0000.mada").write_bytes(data)
+    compressed = write_compressed(tmp_path / "GBKB-13_0001.mada.xz", data, "xz")
+    plain_entry = summarize_mada_file(tmp_path / "GBKB-13_0000.mada")
+    entry = summarize_mada_file(compressed)
+    assert (entry.board_name, entry.period) == ("GBKB-13", 1)
+    assert (entry.n_events, entry.n_corrupted, entry.clock_span) == (7, 1, 60)
+    assert (entry.n_events, entry.n_corrupted, entry.clock_span) == (
+        plain_entry.n_events, plain_entry.n_corrupted, plain_entry.clock_span
+    )
+
+
+def test_catalog_prefers_uncompressed_copy(tmp_path):
+    data = mada_bytes()
+    (tmp_path / "GBKB-13_0000.mada").write_bytes(data)
+    write_compressed(tmp_path / "GBKB-13_0000.mada.gz", data, "gz")
+    write_compressed(tmp_path / "GBKB-13_0001.mada.bz2", data, "bz2")
+    with MadaCatalog(tmp_path) as catalog:
+        assert catalog.refresh() == (2, 0)
+        assert [entry.name for entry in catalog.entries()] == ["GBKB-13_0000.mada", "GBKB-13_0001.mada.bz2"]
+
+
+def test_scan_mada_files_finds_compressed(tmp_path):
+    for name in ["GBKB-00_0000.mada", "GBKB-13_0000.mada.gz", "GBKB-00_0001.mada.bz2", "GBKB-13_0001.mada"]:
+        (tmp_path / name).write_bytes(b"")
+    scanned = scan_mada_files(tmp_path, parse(JSON_STRING), 0, 1)
+    assert [path.name for path in scanned] == [
+        "GBKB-00_0000.mada",
+        "GBKB-13_0000.mada.gz",
+        "GBKB-00_0001.mada.bz2",
+        "GBKB-13_0001.mada",
+    ]
+    assert find_mada_file(tmp_path, "GBKB-13_0002.mada") == tmp_path / "GBKB-13_0002.mada"
+    assert root_output_path(tmp_path / "GBKB-13_0000.mada.gz") == tmp_path.absolute() / "GBKB-13_0000.root"
@@ -0,0 +1,27 @@
+from pathlib import Path
+
+from mada_reader.convert import convert_files
+
+
+def fake_converter(mada_path: Path) -> None:
+    if "bad" in mada_path.name:
+        raise ValueError("broken file")
+    mada_path.with_suffix(".root").write_text("converted")
+
+
+def test_convert_files_sequential(tmp_path):
+    mada_files = [tmp_path / "GBKB-00_0000.mada", tmp_path / "bad_0000.mada"]
+    done = []
+    results = convert_files(mada_files, on_done=done.append, converter=fake_converter)
+    assert [r.ok for r in results] == [True, False]
+    assert "broken file" in results[1].error
+    assert done == results
+    assert (tmp_path / "GBKB-00_0000.root").exists()
+
+
+def test_convert_files_parallel_keeps_order(tmp_path):
+    mada_files = [tmp_path / f"GBKB-{i:02}_0000.mada" for i in range(4)] + [tmp_path / "bad_0000.mada"]
+    results = convert_files(mada_files, jobs=2, converter=fake_converter)
+    assert [r.mada_path for r in results] == mada_files
+    assert [r.ok for r in results] == [True, True, True, True, False]
+    assert len(list(tmp_path.glob("*.root"))) == 4
@@ -0,0 +1,46 @@
+import numpy as np
+
+from mada_reader import parser
+from tests.helpers import make_frame, random_waveforms
+
+rng = np.random.default_rng(0)
+WAVEFORMS = [random_waveforms(rng) for _ in range(5)]
+FRAMES = [make_frame(i, 1000 * i, 2 * i, WAVEFORMS[i]) for i in range(5)]
+# read_file と同じく uPIC を落としたものを入力にする
+EVENTS = [frame[4:] for frame in FRAMES]
+
+
+def test_parse_batch():
+    batch = parser.parse_batch(EVENTS)
+    assert len(batch) == 5
+    assert batch.trigger_counter.dtype == np.uint32
+    assert batch.clock_counter.tolist() == [0, 1000, 2000, 3000, 4000]
+    assert batch.input_ch2_counter.tolist() == [0, 2, 4, 6, 8]
+    assert batch.fadc.shape == (5, 4, 1024)
+    assert np.array_equal(batch.fadc[3], WAVEFORMS[3])
+    assert batch.is_complete.all()
+
+
+def test_parse_batch_matches_parse_events():
+    corrupted = bytearray(EVENTS[2])
+    corrupted[16 + 2 * 2001] = 0x20  # channel id 2 で打ち切り
+    events = EVENTS[:2] + [bytes(corrupted), EVENTS[3][:100]] + EVENTS[4:]
+
+    batch = parser.parse_batch(events)
+    assert len(batch) == 4
+    assert batch.fadc_lengths[2].tolist() == [501, 500, 500, 500]
+    assert batch.is_complete.tolist() == [True, True, False, True]
+    assert batch.valid_mask[2].sum() == 2001
+    for expected, actual in zip(parser.parse_events(events), batch.events()):
+        assert expected.header == actual.header
+        assert expected.fadc == actual.fadc
+
+
+def test_event_batch_indexing():
+    batch = parser.parse_batch(EVENTS)
+    assert batch[1].header == parser.EventHeader(1, 1000, 2)
+    sliced = batch[1:3]
+    assert len(sliced) == 2
+    assert sliced.trigger_counter.tolist() == [1, 2]
+    assert len(parser.EventBatch.concatenate([sliced, batch])) == 7
+    assert len(parser.EventBatch.concatenate([])) == 0
@@ -0,0 +1,71 @@
+from mada_reader.event_builder import EventBuilder, period_mada_files
+from mada_reader.models.mada_config import parse
+from tests.helpers import make_frame
+from tests.test_files import JSON_STRING
+
+
+def write_board(path, triggers, clock_offset=0):
+    path.write_bytes(b"".join(make_frame(t, 100 * t + clock_offset, 0) for t in triggers))
+    return path
+
+
+def test_event_builder(tmp_path):
+    mada_files = {
+        "GBKB-00": write_board(tmp_path / "GBKB-00_0000.mada", [0, 1, 2, 3, 4, 5]),
+        "GBKB-13": write_board(tmp_path / "GBKB-13_0000.mada", [0, 2, 3, 5, 6], clock_offset=3),
+    }
+    builder = EventBuilder(mada_files, chunk_size=2)
+    built = list(builder)
+    assert [e.trigger_counter for e in built] == [0, 2, 3, 5]
+    assert built[1].events["GBKB-13"].header.clock_counter == 203
+    assert builder.report.n_built == 4
+    assert builder.report.orphans == {"GBKB-00": 2, "GBKB-13": 1}
+
+
+def test_event_builder_counts_orphans_without_waiting(tmp_path):
+    mada_files = {
+        "GBKB-00": write_board(tmp_path / "GBKB-00_0000.mada", [0, 1, 2, 3, 4, 5]),
+        "GBKB-13": write_board(tmp_path / "GBKB-13_0000.mada", [0, 4, 5]),
+    }
+    builder = EventBuilder(mada_files, chunk_size=2)
+    orphans_at = {}
+    for event in builder:
+        orphans_at[event.trigger_counter] = dict(builder.report.orphans)
+    # trigger 4 が揃った時点で, それより前の 1, 2, 3 はもう orphan になっている
+    assert orphans_at == {
+        0: {"GBKB-00": 0, "GBKB-13": 0},
+        4: {"GBKB-00": 3, "GBKB-13": 0},
+        5: {"GBKB-00": 3, "GBKB-13": 0},
+    }
+    assert builder.report.orphans == {"GBKB-00": 3, "GBKB-13": 0}
+
+
+def test_event_builder_out_of_order_trigger(tmp_path):
+    mada_files = {
+        "GBKB-00": write_board(tmp_path / "GBKB-00_0000.mada", [0, 1, 3, 2] + list(range(4, 10))),
+        "GBKB-13": write_board(tmp_path / "GBKB-13_0000.mada", list(range(10))),
+    }
+    builder = EventBuilder(mada_files, clock_tolerance=0, chunk_size=3)
+    assert [e.trigger_counter for e in builder] == [0, 1, 3, 4, 5, 6, 7, 8, 9]
+    assert builder.report.n_out_of_order == 1
+    assert builder.report.n_clock_mismatches == 0
+    assert builder.report.orphans == {"GBKB-00": 1, "GBKB-13": 1}
+
+
+def test_event_builder_clock_tolerance(tmp_path):
+    mada_files = {
+        "GBKB-00": write_board(tmp_path / "GBKB-00_0000.mada", [0, 1, 2]),
+        "GBKB-13": write_board(tmp_path / "GBKB-13_0000.mada", [0, 1, 2], clock_offset=10),
+    }
+    builder = EventBuilder(mada_files, clock_tolerance=5)
+    assert list(builder) == []
+    assert builder.report.n_clock_mismatches == 3
+    assert builder.report.orphans == {"GBKB-00": 3, "GBKB-13": 3}
+
+
+def test_period_mada_files(tmp_path):
+    mada_files = period_mada_files(tmp_path, parse(JSON_STRING), 12)
+    assert mada_files == {
+        "GBKB-00": tmp_path / "GBKB-00_0012.mada",
+        "GBKB-13": tmp_path / "GBKB-13_0012.mada",
+    }
@@ -0,0 +1,65 @@
+import numpy as np
+
+from mada_reader.features import ChannelFeatureConfig, FeatureConfig, extract_features, save_features
+from mada_reader.gain import calc_fadc_amplitudes_batch
+from mada_reader.parser import EventBatch, parse_batch
+from tests.helpers import make_frame, random_waveforms
+
+
+def _pulse_waveforms(depth: int = 1024) -> np.ndarray:
+    waveforms = np.full((4, depth), 500, dtype=np.uint16)
+    # ch0: 100 clock から 4 clock かけて 100 下がり, 10 clock そのまま
+    waveforms[0, 100:104] = [475, 450, 425, 400]
+    waveforms[0, 104:114] = 400
+    # ch1: 正のパルス
+    waveforms[1, 200] = 700
+    return waveforms
+
+
+def test_extract_features_pulse():
+    batch = parse_batch([make_frame(7, 70, waveforms=_pulse_waveforms())[4:]])
+    features = extract_features(batch)
+    assert features["trigger_counter"].tolist() == [7]
+    assert features["baseline"][0].tolist() == [500] * 4
+    assert features["baseline_rms"][0].tolist() == [0] * 4
+    assert features["amp_min"][0].tolist() == [-100, 0, 0, 0]
+    assert features["amp_max"][0].tolist() == [0, 200, 0, 0]
+    assert features["peak_clock"][0, 0] == 103
+    assert features["integral"][0, 0] == 25 + 50 + 75 + 100 * 11
+    assert features["integral"][0, 1] == -200
+    assert features["rise_time"][0, 0] == 3
+    assert features["time_over_threshold"][0].tolist() == [14, 0, 0, 0]
+
+
+def test_extract_features_per_channel_config():
+    config = FeatureConfig((
+        ChannelFeatureConfig(),
+        ChannelFeatureConfig(polarity=1, integral_window=(190, 210)),
+        ChannelFeatureConfig(threshold=-1.),
+        ChannelFeatureConfig(baseline_window=(0, 0)),
+    ))
+    features = extract_features(parse_batch([make_frame(0, 0, waveforms=_pulse_waveforms())[4:]]), config)
+    assert features["peak_clock"][0, 1] == 200
+    assert features["integral"][0, 1] == 200
+    assert features["time_over_threshold"][0, 2] == 1024
+    assert np.isnan(features["baseline"][0, 3])
+
+
+def test_extract_features_matches_calc_fadc_amplitudes_batch():
+    rng = np.random.default_rng(5)
+    batch = parse_batch([make_frame(i, i, waveforms=random_waveforms(rng))[4:] for i in range(5)])
+    amp_min, amp_max = calc_fadc_amplitudes_batch(batch)
+    features = extract_features(batch)
+    np.testing.assert_allclose(features["amp_min"], amp_min, rtol=1e-5)
+    np.testing.assert_allclose(features["amp_max"], amp_max, rtol=1e-5)
+    assert len(extract_features(EventBatch.empty())) == 0
+
+
+def test_save_features(tmp_path):
+    features = extract_features(parse_batch([make_frame(i, i, waveforms=_pulse_waveforms())[4:] for i in range(3)]))
+    save_features(features, tmp_path / "features.csv")
+    lines = (tmp_path / "features.csv").read_text().splitlines()
+    assert len(lines) == 4
+    assert lines[0].split(",")[:5] == ["trigger_counter", "clock_counter", "input_ch2_counter", "baseline_ch0", "baseline_ch1"]
+    save_features(features, tmp_path / "features.npz")
+    assert np.array_equal(np.load(tmp_path / "features.npz")["features"], features)
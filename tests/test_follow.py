@@ -0,0 +1,64 @@
+import numpy as np
+
+from mada_reader import parser
+from mada_reader.follow import FollowStats, MadaFollower
+from mada_reader.headers import unwrap_counter
+from tests.helpers import make_frame
+
+
+def test_unwrap_counter():
+    counter = np.array([2 ** 32 - 20, 2 ** 32 - 10, 5, 15], dtype=np.uint32)
+    unwrapped = unwrap_counter(counter)
+    assert unwrapped.tolist() == [2 ** 32 - 20, 2 ** 32 - 10, 2 ** 32 + 5, 2 ** 32 + 15]
+    assert unwrap_counter(np.array([3], dtype=np.uint32), unwrapped[-1]).tolist() == [2 ** 33 + 3]
+
+
+def test_follower_parses_only_complete_events(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    frames = [make_frame(i, 1000 * i, 0) for i in range(5)]
+    follower = MadaFollower(mada_path)
+    assert len(follower.poll()) == 0
+
+    mada_path.write_bytes(frames[0] + frames[1][:30])
+    assert len(follower.poll()) == 0
+    with open(mada_path, "ab") as f:
+        f.write(frames[1][30:] + frames[2][:100])
+    assert follower.poll().trigger_counter.tolist() == [0, 1]
+    with open(mada_path, "ab") as f:
+        f.write(frames[2][100:] + frames[3])
+    assert follower.poll().trigger_counter.tolist() == [2]
+    assert follower.offset == 4 * len(frames[0])
+    assert len(follower.poll()) == 0
+    assert follower.poll(final=True).trigger_counter.tolist() == [3]
+
+
+def test_follower_reads_backlog_in_chunks(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    frames = [make_frame(i, 1000 * i, 0) for i in range(10)]
+    mada_path.write_bytes(b"".join(frames))
+    follower = MadaFollower(mada_path, read_size=3 * len(frames[0]) + 100)
+
+    first = follower.poll()
+    assert first.trigger_counter.tolist() == [0, 1, 2]
+    assert follower.offset == 3 * len(frames[0]) + 100
+
+    batches = list(follower.iter_poll(final=True))
+    assert len(batches) == 3
+    assert all(len(batch) <= 3 for batch in batches)
+    assert parser.EventBatch.concatenate(batches).trigger_counter.tolist() == list(range(3, 10))
+    assert follower.offset == mada_path.stat().st_size
+
+
+def test_follow_stats():
+    stats = FollowStats(clock_frequency=1000.)
+    batches = []
+    for start in (0, 3):
+        events = [make_frame(i, 100 * i, 0)[4:] for i in range(start, start + 3)]
+        batches.append(parser.parse_batch(events))
+    stats.update(batches[0])
+    assert stats.rate == 10.
+    stats.update(batches[1])
+    assert stats.n_events == 6
+    assert stats.elapsed == 0.5
+    assert stats.recent_rate == 10.
+    assert stats.p2p.count.tolist() == [6] * 4
@@ -0,0 +1,56 @@
+import numpy as np
+
+from mada_reader import parser
+from mada_reader.gain import GainAccumulator, RunningStats, calc_fadc_peak2peak_batch
+from tests.helpers import make_frame, random_waveforms
+
+
+def test_running_stats_update_and_merge():
+    values = np.random.default_rng(0).normal(100, 5, size=(1000, 4))
+    stats = RunningStats()
+    stats.update(values[:300])
+    other = RunningStats()
+    other.update(values[300:700])
+    other.update(values[700:])
+    stats.merge(other)
+
+    assert stats.count.tolist() == [1000] * 4
+    assert np.allclose(stats.average, values.mean(axis=0))
+    assert np.allclose(stats.std, values.std(axis=0))
+    assert np.allclose(stats.total, values.sum(axis=0))
+    assert np.array_equal(stats.min, values.min(axis=0))
+    assert np.array_equal(stats.max, values.max(axis=0))
+
+
+def test_running_stats_empty():
+    stats = RunningStats()
+    stats.update(np.zeros((0, 4)))
+    stats.merge(RunningStats())
+    assert stats.count.tolist() == [0] * 4
+    assert np.isnan(stats.average).all()
+
+
+def test_gain_accumulator(tmp_path):
+    rng = np.random.default_rng(0)
+    waveforms = [random_waveforms(rng) for _ in range(5)]
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    mada_path.write_bytes(b"".join(make_frame(i, i, 0, w) for i, w in enumerate(waveforms)))
+
+    gain = GainAccumulator()
+    gain.update_from_mada_file(mada_path)
+    p2p = np.array([w.max(axis=1) - w.min(axis=1) for w in waveforms], dtype=np.float64)
+    assert np.allclose(gain.p2p.average, p2p.mean(axis=0))
+    assert np.allclose(gain.p2p.std, p2p.std(axis=0))
+
+    amp_max = np.array([w.max(axis=1) - w[:, 600:1000].mean(axis=1) for w in waveforms])
+    assert np.allclose(gain.amp_max.average, amp_max.mean(axis=0))
+    assert gain.amp_min.count.tolist() == [5] * 4
+
+
+def test_calc_fadc_peak2peak_batch_skips_empty_channels():
+    rng = np.random.default_rng(1)
+    events = [make_frame(i, i, 0, random_waveforms(rng))[4:] for i in range(2)]
+    corrupted = bytearray(events[0])
+    corrupted[16 + 2 * 1] = 0x00  # ch0 を1サンプルだけ読んで打ち切り
+    events[0] = bytes(corrupted)
+    assert calc_fadc_peak2peak_batch(parser.parse_batch(events)).shape == (1, 4)
@@ -0,0 +1,61 @@
+import numpy as np
+
+from mada_reader.header_analytics import analyze_files_by_board, analyze_headers, save_time_series
+from mada_reader.headers import HeaderArrays
+from tests.helpers import make_frame
+
+
+def _headers(triggers, clocks, input_ch2):
+    return HeaderArrays.from_counters(np.array([triggers, clocks, input_ch2], dtype=np.uint32).T)
+
+
+def test_analyze_headers_counts_missing_and_duplicated_triggers():
+    headers = _headers([0, 1, 1, 4], [0, 100, 200, 300], [0, 5, 10, 30])
+    summary, time_series = analyze_headers("GBKB-13", [headers], clock_frequency=100., bin_seconds=1.)
+    assert summary.n_events == 4
+    assert summary.n_missing_triggers == 2
+    assert summary.n_duplicated_triggers == 1
+    assert summary.duration == 3.
+    assert summary.trigger_rate == 1.
+    assert summary.input_ch2_rate == 10.
+    assert np.isnan(time_series.instantaneous_rate[0])
+    assert time_series.instantaneous_rate[1:].tolist() == [1., 1., 1.]
+    assert time_series.bin_edges.tolist() == [0., 1., 2., 3.]
+    assert time_series.trigger_rate.tolist() == [1., 1., 2.]
+    assert time_series.input_ch2_rate.tolist() == [0., 5., 25.]
+
+
+def test_analyze_headers_gaps_and_rollover_between_files():
+    first = _headers([2 ** 32 - 2, 2 ** 32 - 1], [2 ** 32 - 200, 2 ** 32 - 100], [0, 0])
+    second = _headers([0, 1], [1000, 1100], [0, 0])
+    summary, _ = analyze_headers("GBKB-13", [first, second], clock_frequency=100., gap_threshold=5.)
+    assert summary.n_missing_triggers == 0
+    assert summary.n_trigger_resets == 0
+    assert summary.last_trigger_counter == 2 ** 32 + 1
+    assert summary.duration == 13.
+    assert summary.n_gaps == 1
+    assert summary.max_interval == 11.
+    assert summary.livetime == 2.
+
+
+def test_analyze_headers_reset_is_not_a_rollover():
+    # 途中で trigger_counter が 0 に戻った, 順番が入れ替わった
+    headers = _headers([100, 101, 0, 1, 3, 2], [0, 1, 2, 3, 4, 5], [0] * 6)
+    summary, _ = analyze_headers("GBKB-13", [headers], clock_frequency=1.)
+    assert summary.n_trigger_resets == 2
+    assert summary.n_missing_triggers == 1
+    assert summary.last_trigger_counter == 2
+
+
+def test_analyze_files_by_board_and_save(tmp_path):
+    (tmp_path / "GBKB-13_0000.mada").write_bytes(b"".join(make_frame(i, i * 10 ** 8) for i in range(3)))
+    (tmp_path / "GBKB-00_0000.mada").write_bytes(make_frame(0, 0))
+    results = analyze_files_by_board(sorted(tmp_path.glob("*.mada")))
+    assert list(results) == ["GBKB-00", "GBKB-13"]
+    assert results["GBKB-13"][0].trigger_rate == 1.
+    assert results["GBKB-00"][0].n_events == 1
+
+    save_time_series(results, tmp_path / "rates.csv")
+    assert (tmp_path / "rates.csv").read_text().splitlines()[0] == "board_name,time,trigger_rate,input_ch2_rate"
+    save_time_series(results, tmp_path / "rates.npz")
+    assert len(np.load(tmp_path / "rates.npz")["GBKB-13/time"]) == 3
@@ -0,0 +1,55 @@
+import numpy as np
+
+from mada_reader import headers, index, parser
+from tests.helpers import make_frame
+
+
+def test_read_header_arrays_regular(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    frames = [make_frame(i, 100 * i, i // 2) for i in range(10)]
+    mada_path.write_bytes(b"".join(frames) + frames[0][:30])
+    header_arrays = headers.read_header_arrays(mada_path)
+    assert header_arrays.trigger_counter.tolist() == list(range(10)) + [0]
+    assert header_arrays.clock_counter[3] == 300
+    assert header_arrays.input_ch2_counter.dtype == np.uint32
+    assert header_arrays.col_lines()[5] == parser.EventHeader(5, 500, 2).col()
+
+
+def test_read_header_arrays_irregular(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    frames = [make_frame(i, 100 * i, 0, hits=b"\x00" * (i % 3)) for i in range(10)]
+    frames[4] = make_frame(4, 400, 0, hits=b"\x00uPIC\x00" * 5)
+    mada_path.write_bytes(b"".join(frames))
+    header_arrays = headers.read_header_arrays(mada_path)
+    assert header_arrays.trigger_counter.tolist() == list(range(10))
+    assert header_arrays.clock_counter.tolist() == [100 * i for i in range(10)]
+
+
+def test_read_header_arrays_regular_with_corrupted_frame(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    frames = [make_frame(i, 100 * i) for i in range(100)]
+    # 2つ目のイベントの最初の FADC word が壊れて, 1つ目のイベントにつながる
+    corrupted = bytearray(frames[1])
+    corrupted[4 + parser.HEADER_SIZE:4 + parser.HEADER_SIZE + 2] = b"\x00\x00"
+    frames[1] = bytes(corrupted)
+    mada_path.write_bytes(b"".join(frames))
+    header_arrays = headers.read_header_arrays(mada_path)
+    assert header_arrays.trigger_counter.tolist() == [0] + list(range(2, 100))
+    assert len(header_arrays) == len(index.build_index(mada_path).offsets)
+
+
+def test_read_header_arrays_truncated_frames_in_one_stride(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    frames = [make_frame(i, 100 * i) for i in range(10)]
+    # 途中で切れた2つのイベントの長さの和が1イベントの長さと同じ
+    frames[3] = frames[3][:1000]
+    frames[4] = frames[4][:len(frames[0]) - 1000]
+    mada_path.write_bytes(b"".join(frames))
+    header_arrays = headers.read_header_arrays(mada_path)
+    assert header_arrays.trigger_counter.tolist() == list(range(10))
+
+
+def test_read_header_arrays_empty(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    mada_path.write_bytes(b"")
+    assert len(headers.read_header_arrays(mada_path)) == 0
@@ -0,0 +1,63 @@
+import numpy as np
+
+from mada_reader import parser
+from mada_reader.histogram import Axis, WaveformHist2D
+from tests.helpers import make_frame, random_waveforms
+
+
+def root_find_bin(axis: Axis, x: float) -> int:
+    """
+    TAxis::FindBin (等間隔) と同じ計算
+    """
+    if x < axis.low:
+        return 0
+    if not x < axis.high:
+        return axis.nbins + 1
+    return 1 + int(axis.nbins * (x - axis.low) / (axis.high - axis.low))
+
+
+def make_batch():
+    rng = np.random.default_rng(0)
+    events = [make_frame(i, i, 0, random_waveforms(rng))[4:] for i in range(3)]
+    corrupted = bytearray(events[1])
+    corrupted[16 + 2 * 100] = 0x00
+    events[1] = bytes(corrupted)
+    return parser.parse_batch(events)
+
+
+def test_waveform_hist2d_matches_root_binning():
+    batch = make_batch()
+    hist = WaveformHist2D()
+    hist.fill(batch)
+
+    expected = np.zeros_like(hist.counts)
+    for i in range(len(batch)):
+        for ch in range(4):
+            for clock in range(batch.fadc_lengths[i, ch]):
+                x_bin = root_find_bin(hist.x_axis, clock)
+                y_bin = root_find_bin(hist.y_axis, batch.fadc[i, ch, clock])
+                expected[ch, y_bin, x_bin] += 1
+    assert np.array_equal(hist.counts, expected)
+    assert hist.entries.tolist() == batch.fadc_lengths.sum(axis=0).tolist()
+    # clock 1023 は x の overflow に入る
+    assert hist.counts[:, :, -1].sum() == 4 * 2
+    assert hist.contents(0).shape == (2048, 1024)
+
+    # 統計量は x の overflow (clock 1023) を除いて数える
+    x = np.arange(1023)
+    for ch in range(4):
+        y = np.concatenate([batch.fadc[i, ch, :min(batch.fadc_lengths[i, ch], 1023)] for i in range(len(batch))])
+        x_all = np.concatenate([x[:min(batch.fadc_lengths[i, ch], 1023)] for i in range(len(batch))])
+        y = y.astype(np.float64)
+        assert hist.stats[ch].tolist() == [
+            len(y), len(y), x_all.sum(), (x_all * x_all).sum(), y.sum(), (y * y).sum(), (x_all * y).sum(),
+        ]
+
+
+def test_waveform_hist2d_merge():
+    batch = make_batch()
+    whole = WaveformHist2D().fill_all([batch])
+    merged = WaveformHist2D().fill_all([batch[:1]])
+    merged.merge(WaveformHist2D().fill_all([batch[1:]]))
+    assert np.array_equal(whole.counts, merged.counts)
+    assert np.allclose(whole.stats, merged.stats)
@@ -0,0 +1,72 @@
+import struct
+
+import numpy as np
+
+from mada_reader.hits import HitArrays, decode_hits
+from mada_reader.parser import EventBatch, parse_batch, read_file
+from mada_reader.stream import iter_events
+from tests.helpers import make_frame
+
+
+def make_hit_record(clock: int, strips) -> bytes:
+    bitmap = np.zeros(128, dtype=np.uint8)
+    bitmap[list(strips)] = 1
+    return struct.pack("!H", clock) + np.packbits(bitmap).tobytes()
+
+
+def test_decode_hits():
+    blocks = [
+        make_hit_record(3, [0, 127]) + make_hit_record(4, [9]),
+        b"",
+        make_hit_record(70, [64, 65]) + b"\x00\x01\x02",  # 端数は捨てる
+    ]
+    hits = decode_hits(blocks)
+    assert len(hits) == 3
+    assert hits.offsets.tolist() == [0, 3, 3, 5]
+    assert hits.strip.tolist() == [0, 127, 9, 64, 65]
+    assert hits.clock.tolist() == [3, 3, 4, 70, 70]
+    assert hits.event(1)[0].tolist() == []
+    assert decode_hits([b"", b""]).offsets.tolist() == [0, 0, 0]
+
+
+def test_hit_arrays_take_and_concatenate():
+    hits = decode_hits([make_hit_record(i, range(i)) for i in range(5)])
+    taken = hits.take(np.array([False, True, False, True, True]))
+    assert taken.n_hits.tolist() == [1, 3, 4]
+    assert taken.strip.tolist() == [0, 0, 1, 2, 0, 1, 2, 3]
+    assert taken.clock.tolist() == [1, 3, 3, 3, 4, 4, 4, 4]
+    assert hits.take(slice(3, 5)).event(0)[0].tolist() == [0, 1, 2]
+
+    joined = HitArrays.concatenate([hits.take(slice(0, 2)), hits.take(slice(2, 5))])
+    assert joined.offsets.tolist() == hits.offsets.tolist()
+    assert joined.strip.tolist() == hits.strip.tolist()
+
+
+def test_batch_hits(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    mada_path.write_bytes(
+        make_frame(0, 0, hits=make_hit_record(1, [5]))
+        + make_frame(1, 1)
+        + make_frame(2, 2, hits=make_hit_record(2, [6, 7]) + make_hit_record(3, [8]))
+    )
+    batch = parse_batch(read_file(mada_path), with_hits=True)
+    assert batch.hits.n_hits.tolist() == [1, 0, 3]
+    assert parse_batch(read_file(mada_path)).hits is None
+    assert batch[1:].hits.strip.tolist() == [6, 7, 8]
+
+    streamed = EventBatch.concatenate(list(iter_events(mada_path, chunk_size=2, with_hits=True)))
+    assert streamed.hits.strip.tolist() == [5, 6, 7, 8]
+    assert streamed.hits.clock.tolist() == [1, 2, 2, 3]
+
+
+def test_magic_in_hit_records_is_kept(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    # bitmap にたまたま uPIC が現れる (後ろにイベントは続かない)
+    record = struct.pack("!H", 4) + b"uPIC" + b"\x00" * 12
+    mada_path.write_bytes(
+        make_frame(0, 0, hits=record + make_hit_record(5, [9]))
+        + make_frame(1, 1, hits=make_hit_record(6, [0]))
+    )
+    batch = EventBatch.concatenate(list(iter_events(mada_path, with_hits=True)))
+    assert batch.hits.n_hits.tolist() == [14, 1]
+    assert batch.hits.event(0)[0].tolist()[-1] == 9
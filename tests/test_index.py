@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+from mada_reader import index, parser, stream
+from tests.helpers import make_frame, random_waveforms
+
+rng = np.random.default_rng(0)
+WAVEFORMS = [random_waveforms(rng) for _ in range(6)]
+
+
+def write_mada(path):
+    frames = [make_frame(i, 10 * i, 0, WAVEFORMS[i], hits=b"\x00\x01") for i in range(6)]
+    # hit data 中にたまたま uPIC が現れる
+    frames[2] = make_frame(2, 20, 0, WAVEFORMS[2], hits=b"\x00uPIC\x00\x00")
+    path.write_bytes(b"".join(frames) + b"uPIC\x00\x00")  # 最後は書きかけ
+    return path
+
+
+def test_build_index_ignores_magic_in_payload(tmp_path):
+    mada_path = write_mada(tmp_path / "GBKB-13_0000.mada")
+    idx = index.build_index(mada_path)
+    assert len(idx) == 6
+    assert idx.n_skipped == 1
+    assert idx.trigger_counter.tolist() == [0, 1, 2, 3, 4, 5]
+    assert idx.clock_counter.tolist() == [0, 10, 20, 30, 40, 50]
+    batches = list(stream.iter_events(mada_path))
+    assert parser.EventBatch.concatenate(batches).trigger_counter.tolist() == [0, 1, 2, 3, 4, 5]
+
+
+def test_sidecar_is_reused_and_invalidated(tmp_path):
+    mada_path = write_mada(tmp_path / "GBKB-13_0000.mada")
+    idx = index.get_index(mada_path)
+    assert index.index_path(mada_path).exists()
+    assert np.array_equal(index.load_index(mada_path).offsets, idx.offsets)
+
+    with open(mada_path, "ab") as f:
+        f.write(b"\x00" * 10)
+    assert index.load_index(mada_path) is None
+
+    os.utime(mada_path, ns=(0, 0))
+    assert index.get_index(mada_path).file_mtime_ns == 0
+
+
+def test_mada_file_random_access(tmp_path):
+    mada_path = write_mada(tmp_path / "GBKB-13_0000.mada")
+    with index.MadaFile(mada_path) as mada:
+        assert len(mada) == 6
+        assert mada[4].header == parser.EventHeader(4, 40, 0)
+        assert mada[-1].fadc.ch2.tolist() == WAVEFORMS[5][2].tolist()
+        sliced = mada[1:6:2]
+        assert sliced.trigger_counter.tolist() == [1, 3, 5]
+        assert np.array_equal(sliced.fadc[1], WAVEFORMS[3])
+
+
+def test_parse_event_ids():
+    assert index.parse_event_ids(["12"]) == [12]
+    assert index.parse_event_ids(["3,5,7", "10-12"]) == [3, 5, 7, 10, 11, 12]
+    with pytest.raises(ValueError):
+        index.parse_event_ids(["a"])
@@ -0,0 +1,67 @@
+import os
+
+from mada_reader.convert import convert_files
+from mada_reader.manifest import ConversionManifest
+from tests.test_convert import fake_converter
+
+
+def _mada_files(tmp_path, n=3):
+    mada_files = [tmp_path / f"GBKB-{i:02}_0000.mada" for i in range(n)]
+    for mada_file in mada_files:
+        mada_file.write_bytes(b"uPIC" + mada_file.name.encode())
+    return mada_files
+
+
+def test_convert_files_skips_up_to_date(tmp_path):
+    mada_files = _mada_files(tmp_path)
+    manifest_path = tmp_path / "manifest.json"
+    results = convert_files(mada_files, converter=fake_converter, manifest=ConversionManifest.load(manifest_path, "v1"))
+    assert [r.skipped for r in results] == [False] * 3
+
+    # 1つは中身が変わり, 1つは touch されただけ
+    mada_files[0].write_bytes(b"uPIC changed")
+    stat = os.stat(mada_files[1])
+    os.utime(mada_files[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    results = convert_files(mada_files, converter=fake_converter, manifest=ConversionManifest.load(manifest_path, "v1"))
+    assert [r.skipped for r in results] == [False, True, True]
+
+    # 出力が消えたものだけやり直す
+    mada_files[2].with_suffix(".root").unlink()
+    results = convert_files(mada_files, converter=fake_converter, manifest=ConversionManifest.load(manifest_path, "v1"))
+    assert [r.skipped for r in results] == [True, True, False]
+
+
+def test_convert_files_force_and_converter_version(tmp_path):
+    mada_files = _mada_files(tmp_path, n=2)
+    manifest_path = tmp_path / "manifest.json"
+    convert_files(mada_files, converter=fake_converter, manifest=ConversionManifest.load(manifest_path, "v1"))
+
+    manifest = ConversionManifest.load(manifest_path, "v1")
+    results = convert_files(mada_files, converter=fake_converter, manifest=manifest, force=True)
+    assert [r.skipped for r in results] == [False, False]
+
+    results = convert_files(mada_files, converter=fake_converter, manifest=ConversionManifest.load(manifest_path, "v2"))
+    assert [r.skipped for r in results] == [False, False]
+    assert {e.converter for e in ConversionManifest.load(manifest_path, "v2").entries.values()} == {"v2"}
+
+
+def test_convert_files_parallel_records_manifest(tmp_path):
+    mada_files = _mada_files(tmp_path) + [tmp_path / "bad_0000.mada"]
+    mada_files[-1].write_bytes(b"uPIC")
+    manifest_path = tmp_path / "manifest.json"
+    results = convert_files(
+        mada_files, jobs=2, converter=fake_converter, manifest=ConversionManifest.load(manifest_path, "v1")
+    )
+    assert [r.ok for r in results] == [True, True, True, False]
+    assert set(ConversionManifest.load(manifest_path, "v1").entries) == {f.name for f in mada_files[:3]}
+
+    results = convert_files(
+        mada_files, jobs=2, converter=fake_converter, manifest=ConversionManifest.load(manifest_path, "v1")
+    )
+    assert [r.skipped for r in results] == [True, True, True, False]
+
+
+def test_load_broken_manifest(tmp_path):
+    manifest_path = tmp_path / "manifest.json"
+    manifest_path.write_text("{broken")
+    assert ConversionManifest.load(manifest_path, "v1").entries == {}
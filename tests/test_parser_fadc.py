@@ -0,0 +1,65 @@
+import struct
+
+import numpy as np
+
+from mada_reader import parser
+from tests.helpers import make_fadc_block, random_waveforms
+
+
+def reference_decode(block: bytes, depth: int = 1024):
+    """
+    bitstruct版 parse_flush_adc と同じ手順のpure python実装
+    """
+    channels = {4: [], 5: [], 6: [], 7: []}
+    for (word,) in struct.iter_unpack(">H", block[:8 * depth]):
+        channel_id, adc_value = word >> 12, word & 0x3FF
+        if channel_id not in channels:
+            break
+        channels[channel_id].append(adc_value)
+    return [channels[i] for i in range(4, 8)]
+
+
+def test_decode_regular_block():
+    waveforms = random_waveforms(np.random.default_rng(0))
+    block = make_fadc_block(waveforms)
+    decoded = parser.decode_flush_adc(block)
+    assert [ch.tolist() for ch in decoded] == waveforms.tolist()
+
+
+def test_decode_stops_at_unexpected_channel_id():
+    block = bytearray(make_fadc_block(random_waveforms(np.random.default_rng(1))))
+    block[2 * 1001] = 0x30  # 1001 word目の channel id を 3 にする
+    decoded = parser.decode_flush_adc(bytes(block))
+    assert [ch.tolist() for ch in decoded] == reference_decode(bytes(block))
+    assert list(map(len, decoded)) == [251, 250, 250, 250]
+
+
+def test_decode_out_of_order_channel_ids():
+    block = bytearray(make_fadc_block(random_waveforms(np.random.default_rng(2))))
+    block[0:2], block[2:4] = block[2:4], block[0:2]
+    decoded = parser.decode_flush_adc(bytes(block))
+    assert [ch.tolist() for ch in decoded] == reference_decode(bytes(block))
+
+
+def test_parse_flush_adc_short_block():
+    assert parser.parse_flush_adc(b"\x40\x00" * 100) is None
+
+
+def test_parse_flush_adc_returns_remaining_bytes():
+    waveforms = random_waveforms(np.random.default_rng(3))
+    fadc, remain = parser.parse_flush_adc(make_fadc_block(waveforms) + b"hits")
+    assert fadc.ch1.tolist() == waveforms[1].tolist()
+    assert fadc.data.shape == (4, 1024)
+    assert fadc.data.dtype == np.uint16
+    assert remain == b"hits"
+
+
+def test_flush_adc_iteration_and_equality():
+    fadc = parser.FlushADC([1, 2, 3], [4, 5, 6], [7, 8], [])
+    assert [ch.tolist() for ch in fadc] == [[1, 2, 3], [4, 5, 6], [7, 8], []]
+    # 同じオブジェクトを入れ子で回しても互いに影響しない
+    assert [(len(a), len(b)) for a in fadc for b in fadc][:2] == [(3, 3), (3, 3)]
+    assert len([b for a in fadc for b in fadc]) == 16
+    assert fadc == parser.FlushADC.from_array(fadc.data.copy(), (3, 3, 2, 0))
+    assert fadc != parser.FlushADC([1, 2, 3], [4, 5, 6], [7, 8], [0])
+    assert not hasattr(fadc, "__dict__")
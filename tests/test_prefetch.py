@@ -0,0 +1,91 @@
+import threading
+
+import numpy as np
+import pytest
+
+from mada_reader import prefetch
+from mada_reader.gain import GainAccumulator
+from mada_reader.parser import EventBatch
+from mada_reader.stream import iter_events
+from tests.helpers import make_frame, random_waveforms
+
+rng = np.random.default_rng(0)
+
+
+def write_mada(path, n_events, first_trigger=0):
+    frames = [make_frame(first_trigger + i, 10 * i, 0, random_waveforms(rng), hits=b"\x00uPIC") for i in range(n_events)]
+    path.write_bytes(b"".join(frames) + b"uPIC\x00\x00")  # 最後は書きかけ
+    return path
+
+
+@pytest.mark.parametrize("queue_depth", [0, 1, 4])
+def test_iter_batches_prefetched_matches_iter_events(tmp_path, queue_depth):
+    paths = [
+        write_mada(tmp_path / "GBKB-00_0000.mada", 5),
+        write_mada(tmp_path / "GBKB-13_0000.mada", 0),
+        write_mada(tmp_path / "GBKB-00_0001.mada", 3, first_trigger=100),
+    ]
+    (tmp_path / "GBKB-13_0001.mada").write_bytes(b"")
+    paths.append(tmp_path / "GBKB-13_0001.mada")
+    # buffer はイベントの途中で切れる大きさにする
+    config = prefetch.PrefetchConfig(queue_depth=queue_depth, buffer_size=1000)
+
+    results = list(prefetch.iter_batches_prefetched(paths, config, chunk_size=2))
+    assert all(len(batch) <= 2 for _, batch in results)
+    for path in paths:
+        batches = [batch for p, batch in results if p == path]
+        assert len(batches) >= 1
+        expected = list(iter_events(path))
+        if not expected:
+            assert sum(map(len, batches)) == 0
+            continue
+        actual = EventBatch.concatenate(batches)
+        expected = EventBatch.concatenate(expected)
+        assert actual.trigger_counter.tolist() == expected.trigger_counter.tolist()
+        assert np.array_equal(actual.fadc, expected.fadc)
+    assert [p for p, _ in results] == sorted((p for p, _ in results), key=paths.index)
+
+
+def test_iter_file_batches_feeds_gain_accumulator(tmp_path):
+    paths = [write_mada(tmp_path / "GBKB-00_0000.mada", 0), write_mada(tmp_path / "GBKB-00_0001.mada", 4)]
+    prefetched, direct = GainAccumulator(), GainAccumulator()
+    seen = []
+    for path, batches in prefetch.iter_file_batches(paths, prefetch.PrefetchConfig(buffer_size=4096), chunk_size=3):
+        seen.append(path)
+        for batch in batches:
+            prefetched.update(batch)
+    for path in paths:
+        direct.update_from_mada_file(path)
+    assert seen == paths
+    assert prefetched.p2p.count.tolist() == direct.p2p.count.tolist() == [4] * 4
+    assert np.allclose(prefetched.p2p.average, direct.p2p.average)
+
+
+def test_prefetch_is_bounded_and_stops_when_closed():
+    produced = []
+
+    def items():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    n_threads = threading.active_count()
+    iterator = prefetch.prefetch(items(), queue_depth=2)
+    assert next(iterator) == 0
+    threading.Event().wait(0.3)
+    # queue に2つ, put 待ちで1つ, 返したものが1つ
+    assert len(produced) <= 4
+    iterator.close()
+    assert threading.active_count() == n_threads
+    assert len(produced) <= 4
+
+
+def test_prefetch_reraises_errors():
+    def items():
+        yield 1
+        raise OSError("broken disk")
+
+    iterator = prefetch.prefetch(items(), queue_depth=4)
+    assert next(iterator) == 1
+    with pytest.raises(OSError, match="broken disk"):
+        next(iterator)
@@ -0,0 +1,54 @@
+from mada_reader import profiling
+from mada_reader.parser import parse_batch, parse_events, read_file
+from mada_reader.profiling import Profiler
+from mada_reader.stream import iter_events
+from tests.helpers import make_frame
+
+
+def test_disabled_profiler_records_no_stages():
+    profiler = Profiler()
+    with profiler.stage("read", n_bytes=10) as s:
+        s.n_events = 3
+    assert profiler.stages == {}
+    profiler.count("fadc_too_short")
+    assert profiler.skipped == {"fadc_too_short": 1}
+
+
+def test_profiler_stage_and_merge():
+    profiler = Profiler(enabled=True)
+    with profiler.stage("read", n_bytes=10) as s:
+        s.n_events = 3
+    with profiler.stage("read", n_bytes=5):
+        pass
+    assert profiler.stages["read"].calls == 2
+    assert profiler.stages["read"].n_bytes == 15
+    assert profiler.stages["read"].n_events == 3
+
+    other = Profiler(enabled=True)
+    other.merge_dict(profiler.to_dict())
+    other.merge_dict(profiler.to_dict())
+    assert other.stages["read"].n_bytes == 30
+    assert "read" in "\n".join(other.summary_lines())
+
+
+def test_parser_counts_skipped_events(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    frame = make_frame(0, 0)
+    mada_path.write_bytes(frame + frame[:100] + frame[:10])
+
+    profiler = profiling.enable_profiling()
+    profiler.reset()
+    try:
+        parse_events(read_file(mada_path))
+        assert profiler.skipped == {"fadc_too_short": 1, "header_too_short": 1}
+        assert profiler.stages["read"].n_bytes == mada_path.stat().st_size
+
+        profiler.reset()
+        parse_batch(read_file(mada_path))
+        list(iter_events(mada_path, validate=False))
+        assert profiler.skipped == {"fadc_too_short": 2, "header_too_short": 2}
+        assert profiler.stages["fadc_decode"].n_events == 2
+        assert profiler.stages["split"].n_events == 6  # read_file と iter_events
+    finally:
+        profiling.enable_profiling(False)
+        profiler.reset()
@@ -0,0 +1,76 @@
+import numpy as np
+
+from mada_reader import parser, profiling, stream
+from mada_reader.hits import hit_record_size
+from tests.helpers import make_frame, random_waveforms
+
+
+def write_mada(path, n_events=7, tail=b""):
+    rng = np.random.default_rng(0)
+    frames = [make_frame(i, 10 * i, 0, random_waveforms(rng), hits=b"\x01" * i) for i in range(n_events)]
+    path.write_bytes(b"".join(frames) + tail)
+    return path
+
+
+def test_iter_frame_ranges_matches_split():
+    buffer = b"xxuPICabcuPICuPICdefuPIC"
+    ranges = list(stream.iter_frame_ranges(buffer))
+    assert [buffer[s:e] for s, e in ranges] == [b"xx", b"abc", b"def"]
+
+
+def test_iter_events(tmp_path):
+    mada_path = write_mada(tmp_path / "GBKB-13_0000.mada", tail=b"uPIC\x00\x00")
+    batches = list(stream.iter_events(mada_path, chunk_size=3))
+    assert list(map(len, batches)) == [3, 3, 1]
+
+    streamed = parser.EventBatch.concatenate(batches)
+    # キャッシュ (iter_events で作る) ではなく, split してからまとめてparseしたものと比べる
+    expected = parser.parse_batch(parser.read_file(mada_path))
+    assert len(expected) == 7
+    assert np.array_equal(streamed.trigger_counter, expected.trigger_counter)
+    assert np.array_equal(streamed.fadc, expected.fadc)
+
+
+def test_iter_events_empty_file(tmp_path):
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    mada_path.write_bytes(b"")
+    assert list(stream.iter_events(mada_path)) == []
+
+
+def test_frame_assembler_matches_iter_frame_ranges():
+    rng = np.random.default_rng(1)
+    frames = [make_frame(i, i, 0, random_waveforms(rng), hits=b"uPIC" * (i % 2)) for i in range(5)]
+    data = b"junk" + b"".join(frames) + b"uPIC\x00"
+    expected = [data[s:e] for s, e in stream.iter_frame_ranges(data, validate=True)]
+
+    for step in (1, 7, 1000, len(data)):
+        assembler = stream.FrameAssembler()
+        payloads = []
+        for i in range(0, len(data), step):
+            payloads += assembler.feed(data[i:i + step])
+        assert len(payloads) == 5  # 最後の2つ (frames[4] と書きかけ) はまだ返さない
+        payloads += assembler.flush()
+        assert payloads == expected
+
+
+def test_corrupted_first_word_is_not_merged_into_previous_hits(tmp_path):
+    rng = np.random.default_rng(2)
+    hits = [bytes([0, i]) + bytes([0x80]) + b"\x00" * (hit_record_size() - 3) for i in range(3)]
+    frames = [make_frame(i, i, 0, random_waveforms(rng), hits=hits[i]) for i in range(3)]
+    # 2つ目のイベントの最初の FADC word を壊すと, その uPIC は境界とみなされない
+    corrupted = bytearray(frames[1])
+    corrupted[4 + parser.HEADER_SIZE:4 + parser.HEADER_SIZE + 2] = b"\x00\x00"
+    frames[1] = bytes(corrupted)
+    mada_path = tmp_path / "GBKB-13_0000.mada"
+    mada_path.write_bytes(b"".join(frames))
+
+    profiler = profiling.get_profiler()
+    profiler.reset()
+    batch = parser.EventBatch.concatenate(list(stream.iter_events(mada_path, with_hits=True)))
+    assert batch.trigger_counter.tolist() == [0, 2]
+    assert profiler.skipped == {"invalid_boundary": 1, "merged_frame": 1}
+    # 1つ目のイベントのhitは自分のレコードだけ
+    assert batch.hits.n_hits.tolist() == [1, 1]
+    assert batch.hits.event(0)[1].tolist() == [0]
+    assert batch.hits.event(1)[1].tolist() == [2]
+    profiler.reset()